@@ -1,11 +1,30 @@
 import os
+import sys
 import numpy as np
 import pandas as pd
 import networkx as nx
 import torch
-from torch_geometric.data import Data
 from tqdm import tqdm  # <-- barra di avanzamento
 
+# moduli condivisi in PTE/Analisi
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from connectome_store import ConnectomeStore
+from id_matching import match_labels, print_match_report
+from pyg_dataset import ConnectomeDataset, NodeFeatures
+
+# Store binario creato con connectome_store.py (es. ".../connectomes.npy"): se impostato
+# le matrici si leggono da lì (memory-mapped) invece che dai CSV di base_path
+STORE_CONNETTOMI = None
+store = ConnectomeStore(STORE_CONNETTOMI) if STORE_CONNETTOMI else None
+# ID del paziente nel nome della matrice: solo il numero dopo "sub-" (le altre cifre, es. sessione o
+# atlante in "sub-0001_ses-1_HO96.csv", non contano); senza token si usano tutte le cifre del nome
+ID_PATTERN = r"sub-(\d+)"
+# Cartella dove viene salvato il dataset PyG già processato
+DATASET_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pyg_cache")
+# Archi passati alla GNN: None = tutti i pesi > 0; altrimenti es. {"method": "density", "density": 0.1},
+# {"method": "topk", "k": 8} oppure {"method": "mst_topk", "k": 5} (vedi pyg_dataset.adj_to_edge_index)
+SPARSIFY = None
+
 # Se c'è GPU, usa quella
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 print("Using device:", device)
@@ -17,21 +36,19 @@ df = pd.read_excel(
     "C:/Users/yuyuy/Desktop/Cartelle/Uni/Magistrale/PTEe/MATPTE/label.xlsx"
 )
 
-df["ID_num"] = df["Patient"].str.split("-").str[1].astype(int)
-df["ID_num"] = df["ID_num"].apply(lambda x: f"{x:04d}")
-
 base_path = "C:/Users/yuyuy/Desktop/Cartelle/Uni/Magistrale/PTEe/MATPTE"
-file_names_only = os.listdir(base_path)
+file_names_only = store.files if store is not None else os.listdir(base_path)
 
-def trova_file(id_num):
-    matches = [f for f in file_names_only if f"sub-{id_num}" in f]
-    return matches[0] if len(matches) > 0 else np.nan
-
-df["Matadi_File"] = df["ID_num"].apply(trova_file)
+# un solo merge per ID canonico, con report di mancanti e duplicati
+df, report = match_labels(df, file_names_only, id_col="Patient", label_col="Label", file_col="Matadi_File",
+                          id_pattern=ID_PATTERN)
+print_match_report(report)
 df = df.dropna()
 dfcut = df[["Label", "Matadi_File"]].copy()
 
 def leggi_matrice(nome_file):
+    if store is not None:
+        return store.matrix(nome_file)
     full_path = os.path.join(base_path, nome_file)
     mat = pd.read_csv(full_path, header=None)
     mat = mat.select_dtypes(include=[np.number])
@@ -40,65 +57,19 @@ def leggi_matrice(nome_file):
 dfcut["matrice"] = dfcut["Matadi_File"].apply(leggi_matrice)
 
 # ----------------------------
-# Funzioni di feature
-# ----------------------------
-def compute_node_features(A):
-    G = nx.from_numpy_array(A)
-    for u, v, d in G.edges(data=True):
-        w = d.get("weight", 1.0)
-        d["inv_weight"] = 1.0 / w if w != 0 else 0.0
-
-    strength_vals = dict(G.degree(weight="weight"))
-    closeness_vals = nx.closeness_centrality(G, distance="inv_weight")
-    betweenness_vals = nx.betweenness_centrality(G, weight="inv_weight")
-    eig_vals = nx.eigenvector_centrality(G, weight="weight", max_iter=1000, tol=1e-6)
-    clustering_vals = nx.clustering(G, weight="weight")
-    dist_mat = dict(nx.all_pairs_dijkstra_path_length(G, weight="inv_weight"))
-    avg_path_len = {node: np.mean(list(dist.values())) for node, dist in dist_mat.items()}
-
-    features = [
-        [
-            strength_vals[node],
-            closeness_vals[node],
-            betweenness_vals[node],
-            eig_vals[node],
-            clustering_vals[node],
-            avg_path_len[node],
-        ]
-        for node in G.nodes()
-    ]
-
-    # Sposta su device
-    return torch.tensor(features, dtype=torch.float, device=device)
-
-def adj_to_edge_index(A):
-    A = torch.tensor(A, dtype=torch.float, device=device)
-    mask = A > 0
-    edge_index = mask.nonzero(as_tuple=False).t()
-    edge_weight = A[mask]
-    return edge_index, edge_weight
-
-def build_pyg_graph(A, label):
-    x = compute_node_features(A)
-    edge_index, edge_weight = adj_to_edge_index(A)
-
-    data = Data(
-        x=x,
-        edge_index=edge_index,
-        edge_attr=edge_weight,
-        y=torch.tensor([label], dtype=torch.long, device=device)
-    )
-    return data
-
-# ----------------------------
-# Costruisci grafi con barra di avanzamento
+# Dataset PyG con barra di avanzamento
 # ----------------------------
-graphs = []
-
-for _, row in tqdm(dfcut.iterrows(), total=len(dfcut), desc="Building graphs"):
-    A = row["matrice"]
-    label = row["Label"]
-    graphs.append(build_pyg_graph(A, label))
+# I grafi (feature nodali comprese) vengono calcolati al primo run e salvati in DATASET_ROOT;
+# i run successivi li ricaricano direttamente
+dataset = ConnectomeDataset(
+    DATASET_ROOT,
+    matrices=dfcut["matrice"].tolist(),
+    labels=dfcut["Label"].tolist(),
+    ids=dfcut["Matadi_File"].tolist(),
+    sparsify=SPARSIFY,
+    pre_transform=NodeFeatures(),
+)
+graphs = [data.to(device) for data in tqdm(dataset, desc="Loading graphs")]
 
 
 import matplotlib.pyplot as plt
@@ -0,0 +1,230 @@
+"""
+Dataset PyG dei connettomi, salvato su disco (InMemoryDataset).
+
+- build_pyg_graph costruisce il Data di un soggetto (edge_index, edge_attr, y) e tiene la
+  matrice densa in data.adj
+- sparsificazione opzionale degli archi (adj_to_edge_index, parametro sparsify):
+      None                                  tutti i pesi > 0 (grafo quasi completo, ~9k archi per N=96)
+      {"method": "density", "density": d}   soglia proporzionale (stessa regola di thresholding.py)
+      {"method": "topk", "k": k}            i k archi più forti di ogni nodo (unione dei due versi)
+      {"method": "mst_topk", "k": k}        maximum spanning tree (grafo connesso) + top-k
+  gli archi scelti sul triangolo superiore vengono emessi nei due versi, già coalesced
+  (ordinati per riga, poi colonna); le feature nodali restano calcolate sulla matrice completa
+- il pre_transform NodeFeatures calcola le 6 feature nodali (Strength, Closeness, Betweenness,
+  Eigenvector, Clustering, AvgPathLen, stesse definizioni di compute_node_features) con le
+  funzioni numpy di PTE/Analisi invece che con networkx, e toglie adj
+- con NodeFeatures(keep_adj=True) le adiacenze del batch (B, N, N) restano disponibili e
+  torch_features.node_features ricalcola le stesse feature al volo in torch (grafi aumentati/sogliati)
+- i grafi vengono collati UNA volta e salvati in <root>/processed/data_<chiave>.pt: i run
+  successivi li ricaricano senza ricalcolare nulla
+
+La chiave dipende dal contenuto delle matrici, dalle label e dal pre_transform: cambiando dati o
+feature viene creato un nuovo file invece di riusare quello vecchio.
+
+Uso:
+    dataset = ConnectomeDataset("pyg_cache", matrici, labels, ids, pre_transform=NodeFeatures())
+    loader = DataLoader(dataset, batch_size=16, shuffle=True)
+
+Dipendenze: numpy, torch, torch_geometric
+"""
+
+import os
+import sys
+
+import numpy as np
+import torch
+from torch_geometric.data import Data, InMemoryDataset
+from torch_geometric.transforms import BaseTransform
+
+# moduli condivisi in PTE/Analisi
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from cohort_tensor import cohort_metrics
+from matrix_metrics import adjacency
+from shortest_paths import closeness_centrality, mean_node_distance
+from betweenness import weighted_betweenness
+from feature_cache import FeatureCache
+from thresholding import edge_ranks, n_keep
+from torch_features import FEATURE_NAMES
+
+DATASET_VERSION = 3     # da incrementare quando cambia la costruzione dei grafi (invalida i file salvati)
+
+
+# ----------------------------
+# Feature e archi
+# ----------------------------
+def node_features(A) -> np.ndarray:
+    """(N, 6) nell'ordine di FEATURE_NAMES; archi = pesi > 0, lunghezze 1/w."""
+    A = np.array(A, dtype=float, copy=True)
+    np.fill_diagonal(A, 0)
+
+    coh = cohort_metrics(A[None])
+    D, L = coh["D"][0], coh["L"][0]
+    return np.column_stack([
+        coh["strength"][0],
+        closeness_centrality(D),
+        weighted_betweenness(L),
+        coh["eigenvector_w"][0],
+        coh["clustering_w"][0],
+        mean_node_distance(D),
+    ])
+
+
+def topk_mask(W: np.ndarray, k: int) -> np.ndarray:
+    """Maschera simmetrica dei k archi più forti (peso > 0) di ogni nodo."""
+    n = W.shape[0]
+    k = min(int(k), n - 1)
+    if k <= 0:
+        return np.zeros_like(W, dtype=bool)
+    Wk = np.where(np.eye(n, dtype=bool), -np.inf, W)
+    top = np.argpartition(-Wk, k - 1, axis=1)[:, :k]
+
+    M = np.zeros_like(W, dtype=bool)
+    M[np.arange(n)[:, None], top] = True
+    M &= W > 0
+    return M | M.T
+
+
+def maximum_spanning_tree_mask(W: np.ndarray) -> np.ndarray:
+    """Maschera simmetrica del maximum spanning tree (Prim, O(N^2)); foresta se il grafo è sconnesso."""
+    n = W.shape[0]
+    M = np.zeros((n, n), dtype=bool)
+    in_tree = np.zeros(n, dtype=bool)
+    best = np.full(n, -np.inf)          # peso migliore verso l'albero
+    parent = np.full(n, -1)
+
+    for _ in range(n):
+        cand = np.where(in_tree, -np.inf, best)
+        u = int(np.argmax(cand))
+        if not np.isfinite(cand[u]):    # nuova componente: parte da un nodo qualsiasi non ancora visitato
+            u = int(np.flatnonzero(~in_tree)[0])
+        elif parent[u] >= 0:
+            M[u, parent[u]] = M[parent[u], u] = True
+        in_tree[u] = True
+
+        upd = ~in_tree & (W[u] > 0) & (W[u] > best)
+        best[upd] = W[u, upd]
+        parent[upd] = u
+    return M
+
+
+def sparsify_mask(W: np.ndarray, method=None, density: float = 0.1, k: int = 5) -> np.ndarray:
+    """Maschera (N, N) simmetrica degli archi tenuti; method None = tutti i pesi > 0."""
+    if method is None:
+        return W > 0
+    if method == "density":
+        iu, ju = np.triu_indices(W.shape[0], 1)
+        ranks = edge_ranks(W)
+        keep = (ranks < n_keep(ranks.size, density)) & (W[iu, ju] > 0)
+        M = np.zeros_like(W, dtype=bool)
+        M[iu[keep], ju[keep]] = True
+        return M | M.T
+    if method == "topk":
+        return topk_mask(W, k)
+    if method == "mst_topk":
+        return maximum_spanning_tree_mask(W) | topk_mask(W, k)
+    raise ValueError(f"Sparsificazione non supportata: {method} (usa None, 'density', 'topk', 'mst_topk')")
+
+
+def adj_to_edge_index(A, method=None, density: float = 0.1, k: int = 5):
+    """
+    (edge_index (2, E), edge_weight (E,)) dal triangolo superiore, nei due versi e coalesced.
+    method/density/k: vedi sparsify_mask.
+    """
+    W = np.asarray(A, dtype=float)
+
+    if method is None:
+        # come prima: ogni voce > 0 della matrice, già ordinata per riga
+        rows, cols = np.nonzero(W > 0)
+    else:
+        # stessa simmetrizzazione delle metriche (triangolo superiore + trasposta, diagonale nulla)
+        W, _ = adjacency(W)
+        iu, ju = np.nonzero(np.triu(sparsify_mask(W, method, density=density, k=k), 1))
+        rows, cols = np.concatenate([iu, ju]), np.concatenate([ju, iu])
+        order = np.lexsort((cols, rows))
+        rows, cols = rows[order], cols[order]
+
+    edge_index = torch.as_tensor(np.stack([rows, cols]), dtype=torch.long)
+    edge_weight = torch.as_tensor(W[rows, cols], dtype=torch.float)
+    return edge_index, edge_weight
+
+
+def build_pyg_graph(A, label, subject=None, sparsify=None):
+    """Data del soggetto, senza feature nodali: x viene calcolato dal pre_transform."""
+    edge_index, edge_weight = adj_to_edge_index(A, **(sparsify or {}))
+    data = Data(
+        edge_index=edge_index,
+        edge_attr=edge_weight,
+        y=torch.tensor([label], dtype=torch.long),
+        num_nodes=int(np.shape(A)[0]),
+    )
+    data.adj = torch.as_tensor(np.asarray(A), dtype=torch.float).unsqueeze(0)
+    if subject is not None:
+        data.subject = str(subject)
+    return data
+
+
+class NodeFeatures(BaseTransform):
+    """pre_transform: data.x (N, 6) da data.adj; keep_adj=False rimuove la matrice densa."""
+
+    def __init__(self, keep_adj: bool = False):
+        self.keep_adj = keep_adj
+
+    def forward(self, data):
+        data.x = torch.as_tensor(node_features(data.adj[0].numpy()), dtype=torch.float)
+        if not self.keep_adj:
+            del data.adj
+        return data
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(keep_adj={self.keep_adj})"
+
+
+# ----------------------------
+# Dataset
+# ----------------------------
+class ConnectomeDataset(InMemoryDataset):
+    """
+    matrices, labels, ids: liste allineate (una matrice N x N per soggetto).
+    sparsify: dict per adj_to_edge_index (es. {"method": "mst_topk", "k": 8}), None = tutti gli archi.
+    I tensori collati stanno in memoria e su disco; transform (se dato) viene applicato a ogni accesso.
+    """
+
+    def __init__(self, root, matrices, labels, ids=None, sparsify=None, transform=None,
+                 pre_transform=None, pre_filter=None, force_reload: bool = False):
+        self.matrices = list(matrices)
+        self.labels = [int(y) for y in labels]
+        self.ids = [str(i) for i in ids] if ids is not None else [str(i) for i in range(len(self.matrices))]
+        self.sparsify = dict(sparsify) if sparsify else None
+        if not (len(self.matrices) == len(self.labels) == len(self.ids)):
+            raise ValueError("matrices, labels e ids devono avere la stessa lunghezza")
+
+        self.key = FeatureCache.key(
+            "".join(FeatureCache.key(np.asarray(A, dtype=float)) for A in self.matrices).encode(),
+            labels=self.labels,
+            ids=self.ids,
+            sparsify=sparsify,
+            pre_transform=repr(pre_transform),
+            version=DATASET_VERSION,
+        )[:16]
+        super().__init__(root, transform, pre_transform, pre_filter, force_reload=force_reload)
+        self.load(self.processed_paths[0])
+
+    @property
+    def raw_file_names(self):
+        return []  # le matrici arrivano già in memoria (CSV o store), niente download
+
+    @property
+    def processed_file_names(self):
+        return [f"data_{self.key}.pt"]
+
+    def download(self):
+        pass
+
+    def process(self):
+        data_list = [build_pyg_graph(A, y, s, sparsify=self.sparsify)
+                     for A, y, s in zip(self.matrices, self.labels, self.ids)]
+        if self.pre_filter is not None:
+            data_list = [d for d in data_list if self.pre_filter(d)]
+        if self.pre_transform is not None:
+            data_list = [self.pre_transform(d) for d in data_list]
+        self.save(data_list, self.processed_paths[0])
@@ -0,0 +1,146 @@
+"""
+Feature nodali dei connettomi direttamente in torch, in blocco su un batch di adiacenze (B, N, N).
+
+Stesse definizioni del pre_transform NodeFeatures di pyg_dataset (e di cohort_tensor / shortest_paths):
+- Strength: somma dei pesi
+- Closeness: come nx.closeness_centrality (wf_improved=True), lunghezza = 1/w
+- Betweenness: Brandes esatto di betweenness.py sullo stack delle lunghezze (NumPy, float64);
+  è l'unica feature non in torch, con betweenness=False si salta (colonna assente)
+- Eigenvector: autovettore principale (torch.linalg.eigh batched), norma L2 = 1, segno positivo
+- Clustering: Onnela pesato, pesi normalizzati per il massimo del soggetto
+- AvgPathLen: distanza media da ogni nodo ai nodi raggiungibili (sé stesso incluso)
+
+Archi = pesi > edge_min del triangolo superiore (simmetrizzato), diagonale ignorata.
+Distanze con Floyd–Warshall batched: N passi, ognuno un torch.minimum su (B, N, N).
+Gira sui thread CPU di torch (n_threads imposta torch.set_num_threads per la durata della chiamata);
+funziona anche su GPU se A è già lì.
+
+Con NodeFeatures(keep_adj=True) ogni Data tiene adj (1, N, N) e il DataLoader li concatena in (B, N, N):
+le feature si possono ricalcolare al volo sui grafi aumentati / sogliati durante il training, senza
+passare da networkx o da NumPy per ogni soggetto:
+
+    for batch in loader:
+        adj = augment(batch.adj)                                   # (B, N, N)
+        batch.x = node_features(adj, betweenness=False).flatten(0, 1)
+
+Dipendenze: torch (+ numpy per la betweenness)
+"""
+
+import os
+import sys
+
+import numpy as np
+import torch
+
+# moduli condivisi in PTE/Analisi
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from betweenness import cohort_betweenness
+
+FEATURE_NAMES = ("Strength", "Closeness", "Betweenness", "Eigenvector", "Clustering", "AvgPathLen")
+
+
+# ----------------------------
+# Archi e lunghezze
+# ----------------------------
+def adjacency(A: torch.Tensor, edge_min: float = 0.0):
+    """(W, M): pesi simmetrici dal triangolo superiore (0 senza arco, diagonale nulla) e maschera degli archi."""
+    W = torch.triu(A, 1)
+    W = W + W.transpose(-1, -2)
+    M = W > edge_min
+    return torch.where(M, W, torch.zeros_like(W)), M
+
+
+def length_matrix(W: torch.Tensor, M: torch.Tensor) -> torch.Tensor:
+    """Lunghezze 1/w sugli archi, +inf altrove (diagonale compresa)."""
+    return torch.where(M, 1.0 / torch.where(M, W, torch.ones_like(W)), torch.full_like(W, float("inf")))
+
+
+def floyd_warshall(L: torch.Tensor) -> torch.Tensor:
+    """Distanze minime (B, N, N) dalle lunghezze; +inf = non raggiungibile."""
+    D = L.clone()
+    D.diagonal(dim1=-2, dim2=-1).zero_()
+    for k in range(D.shape[-1]):
+        D = torch.minimum(D, D[..., :, k, None] + D[..., None, k, :])
+    return D
+
+
+# ----------------------------
+# Metriche nodali
+# ----------------------------
+def strength(W: torch.Tensor) -> torch.Tensor:
+    return W.sum(dim=-1)
+
+
+def eigenvector_centrality(W: torch.Tensor) -> torch.Tensor:
+    """Come matrix_metrics.eigenvector_centrality: zeri se il grafo non ha archi."""
+    _, vecs = torch.linalg.eigh(W)
+    v = vecs[..., :, -1]
+    norm = torch.sign(v.sum(dim=-1, keepdim=True)) * torch.linalg.vector_norm(v, dim=-1, keepdim=True)
+    ok = (W > 0).any(dim=-1).any(dim=-1, keepdim=True) & (norm != 0)
+    return torch.where(ok, v / torch.where(norm != 0, norm, torch.ones_like(norm)), torch.zeros_like(v))
+
+
+def weighted_clustering(W: torch.Tensor, M: torch.Tensor) -> torch.Tensor:
+    """Clustering di Onnela: sum_jk (w_ij w_jk w_ki)^(1/3) / (k_i (k_i - 1)), pesi / peso massimo."""
+    w_max = W.amax(dim=(-2, -1), keepdim=True)
+    C = (W / torch.where(w_max > 0, w_max, torch.ones_like(w_max))).pow(1.0 / 3.0)
+    tri = ((C @ C) * C).sum(dim=-1)     # diagonale di C^3 (C simmetrica)
+
+    k = M.sum(dim=-1).to(W.dtype)
+    den = k * (k - 1)
+    return torch.where(den > 0, tri / torch.where(den > 0, den, torch.ones_like(den)), torch.zeros_like(tri))
+
+
+def closeness_centrality(D: torch.Tensor) -> torch.Tensor:
+    """c_u = (r-1)/sum(d) * (r-1)/(N-1), r = nodi raggiungibili da u (u incluso)."""
+    n = D.shape[-1]
+    reach = torch.isfinite(D)
+    r = reach.sum(dim=-1).to(D.dtype)
+    tot = torch.where(reach, D, torch.zeros_like(D)).sum(dim=-1)
+    ok = (tot > 0) & (n > 1)
+    c = torch.where(ok, (r - 1.0) / torch.where(ok, tot, torch.ones_like(tot)), torch.zeros_like(tot))
+    return c * (r - 1.0) / max(n - 1, 1)
+
+
+def mean_node_distance(D: torch.Tensor) -> torch.Tensor:
+    reach = torch.isfinite(D)
+    return torch.where(reach, D, torch.zeros_like(D)).sum(dim=-1) / reach.sum(dim=-1).to(D.dtype)
+
+
+# ----------------------------
+# API
+# ----------------------------
+def node_features(A, betweenness: bool = True, edge_min: float = 0.0, dtype=torch.float64,
+                  n_threads=None, n_workers: int = 1) -> torch.Tensor:
+    """
+    Feature nodali per il batch A (B, N, N) (o una matrice N x N) -> (B, N, 6) nell'ordine di FEATURE_NAMES,
+    (B, N, 5) senza Betweenness se betweenness=False. Stesso device di A, dtype = dtype.
+    n_threads: thread CPU di torch per questa chiamata (None = impostazione corrente).
+    n_workers: processi per la betweenness (vedi betweenness.cohort_betweenness).
+    """
+    A = torch.as_tensor(A)
+    single = A.dim() == 2
+    A = A.to(dtype).unsqueeze(0) if single else A.to(dtype)
+
+    prev = torch.get_num_threads()
+    if n_threads is not None:
+        torch.set_num_threads(int(n_threads))
+    try:
+        with torch.no_grad():
+            W, M = adjacency(A, edge_min=edge_min)
+            L = length_matrix(W, M)
+            D = floyd_warshall(L)
+            cols = [strength(W), closeness_centrality(D)]
+            if betweenness:
+                bc = cohort_betweenness(L.detach().cpu().numpy().astype(np.float64), n_workers=n_workers)
+                cols.append(torch.as_tensor(bc, dtype=dtype, device=A.device))
+            cols += [eigenvector_centrality(W), weighted_clustering(W, M), mean_node_distance(D)]
+            X = torch.stack(cols, dim=-1)
+    finally:
+        torch.set_num_threads(prev)
+    return X[0] if single else X
+
+
+def feature_names(betweenness: bool = True) -> tuple:
+    """Nomi delle colonne di node_features."""
+    return FEATURE_NAMES if betweenness else tuple(f for f in FEATURE_NAMES if f != "Betweenness")
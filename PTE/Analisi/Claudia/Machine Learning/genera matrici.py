@@ -1,30 +1,66 @@
 import os
+import sys
 import numpy as np
 import pandas as pd
 import networkx as nx
 
+# moduli condivisi in PTE/Analisi
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from cohort_tensor import stack_cohort, cohort_metrics
+from shortest_paths import length_matrix, closeness_centrality, mean_node_distance
+from betweenness import weighted_betweenness, cohort_betweenness
+from thresholding import edge_ranks, proportional_threshold
+from density_sweep import incremental_sweep
+from feature_cache import FeatureCache
+from connectome_store import ConnectomeStore
+from id_matching import match_labels, print_match_report
+import profiling
+from profiling import timed
+
+# True: ogni gruppo viene impilato in un tensore (S, N, N) e le metriche calcolate in blocco
+TENSORE_COORTE = False
+# True: per ogni paziente gli archi vengono aggiunti in ordine di peso e le metriche
+# aggiornate densità dopo densità (conviene per sweep lunghi, es. AUC sulla densità)
+SWEEP_INCREMENTALE = False
+# Cartella della cache delle metriche per paziente/densità (None = off): i rerun riusano i risultati
+CACHE_DIR = None
+CACHE_MAX_MB = 2048
+# Versione delle metriche nella chiave di cache: da incrementare quando cambia una definizione
+# (2 = betweenness Brandes di betweenness.py invece di networkx), così i risultati vecchi non vengono riusati
+METRICHE_VERSION = 2
+cache = FeatureCache(CACHE_DIR, max_bytes=CACHE_MAX_MB * 1024 ** 2) if CACHE_DIR else None
+# Store binario creato con connectome_store.py (es. ".../connectomes.npy"): se impostato
+# le matrici si leggono da lì (memory-mapped) invece che dai CSV di base_path
+STORE_CONNETTOMI = None
+store = ConnectomeStore(STORE_CONNETTOMI) if STORE_CONNETTOMI else None
+# Processi per la betweenness (blocchi di sorgenti in parallelo; None = tutti i core)
+BETWEENNESS_WORKERS = 1
+# ID del paziente nel nome della matrice: solo il numero dopo "sub-" (le altre cifre, es. sessione o
+# atlante in "sub-0001_ses-1_HO96.csv", non contano); senza token si usano tutte le cifre del nome
+ID_PATTERN = r"sub-(\d+)"
+# True: tempo e numero di chiamate di ogni metrica per paziente, tabella riassuntiva alla fine
+PROFILING = False
+profiling.enable(PROFILING)
+profili = []  # un dict {blocco: (chiamate, secondi)} per paziente e densità
+
 # Leggo il file Excel
 df = pd.read_excel(
     "C:/Users/yuyuy/Desktop/Cartelle/Uni/Magistrale/Articolo/MATPTE/label.xlsx"
 )
 
-# Estrai la parte numerica dell'ID paziente
-df["ID_num"] = df["Patient"].str.split("-").str[1].astype(int)
-
-# Converto in formato a 4 cifre con zeri iniziali
-df["ID_num"] = df["ID_num"].apply(lambda x: f"{x:04d}")
-
 # Prendo i file dalla cartella
 base_path = "C:/Users/yuyuy/Desktop/Cartelle/Uni/Magistrale/Articolo/MATPTE"
-path_matadi = [os.path.join(base_path, f) for f in os.listdir(base_path)]
-file_names_only = [os.path.basename(f) for f in path_matadi]
-
-# Associa pazienti e matrici
-def trova_file(id_num):
-    matches = [f for f in file_names_only if f"sub-{id_num}" in f]
-    return matches[0] if len(matches) > 0 else np.nan
-
-df["Matadi_File"] = df["ID_num"].apply(trova_file)
+if store is not None:
+    file_names_only = store.files
+else:
+    path_matadi = [os.path.join(base_path, f) for f in os.listdir(base_path)]
+    file_names_only = [os.path.basename(f) for f in path_matadi]
+
+# Associa pazienti e matrici: un solo merge per ID canonico (sub-0001_ses-1_HO96 -> "1"),
+# con report di pazienti senza matrice, matrici senza label e ID duplicati
+df, report = match_labels(df, file_names_only, id_col="Patient", label_col="Label", file_col="Matadi_File",
+                          id_pattern=ID_PATTERN)
+print_match_report(report)
 
 # Rimuovo NA
 df = df.dropna()
@@ -33,6 +69,8 @@ df = df.dropna()
 dfcut = df[["Label", "Matadi_File"]].copy()
 
 def leggi_matrice(nome_file):
+    if store is not None:
+        return store.matrix(nome_file)
     full_path = os.path.join(base_path, nome_file)
     try:
         mat = pd.read_csv(full_path, header=None)
@@ -56,7 +94,8 @@ def rendi_simmetrica(mat):
 matrici_sani = [rendi_simmetrica(m) for m in matrici_sani]
 matrici_ad   = [rendi_simmetrica(m) for m in matrici_ad]
 
-def metr_dens_nodi(gruppo, dens, nome_gruppo):
+def metr_dens_nodi(gruppo, dens, nome_gruppo, ranghi=None):
+    # ranghi: ordinamento degli archi di ogni soggetto (edge_ranks), calcolato una volta per tutte le densità
     risultati = []
 
     for i, mat in enumerate(gruppo, start=1):
@@ -66,70 +105,176 @@ def metr_dens_nodi(gruppo, dens, nome_gruppo):
         np.fill_diagonal(mat, 0)
         n = mat.shape[0]
 
-        # --- Threshold come nel secondo programma ---
-        upper_idx = np.triu_indices(n, 1)
-        upper_vals = mat[upper_idx]
-
-        n_total = len(upper_vals)
-        n_keep = int(np.floor(n_total * dens))
-        keep_idx = np.argsort(upper_vals)[::-1][:n_keep]
-
-        mat_sparse = np.zeros_like(mat)
-        for k in keep_idx:
-            ii = upper_idx[0][k]
-            jj = upper_idx[1][k]
-            mat_sparse[ii, jj] = mat[ii, jj]
-            mat_sparse[jj, ii] = mat[ii, jj]
-
-        # --- Crea grafo ---
-        G = nx.from_numpy_array(mat_sparse)
-        for u, v, d in G.edges(data=True):
-            d["weight"] = mat_sparse[u, v]
-            d["inv_weight"] = 1.0 / d["weight"]
-        
-
-        # --- Metriche ---
-        strength_vals = dict(G.degree(weight="weight"))
-        closeness_vals = nx.closeness_centrality(G, distance="inv_weight")
-        betweenness_vals = nx.betweenness_centrality(G, weight="inv_weight")
-
-        eig_vals = nx.eigenvector_centrality(
-            G,
-            weight="weight",
-            max_iter=1000,
-            tol=1e-6
-            )
-
-        clustering_vals = nx.clustering(G, weight="weight")
-
-        dist_mat = dict(nx.all_pairs_dijkstra_path_length(G, weight="inv_weight"))
-        avg_path_len = {
-            node: np.mean(list(dist.values())) for node, dist in dist_mat.items()
-        }
+        # --- Cache (stessa matrice + stessa densità = stesse metriche) ---
+        with timed("cache.get"):
+            chiave = FeatureCache.key(mat, densita=round(float(dens), 6), versione=METRICHE_VERSION) if cache else None
+            hit = cache.get(chiave) if cache else None
+
+        if hit is not None:
+            valori = hit["metriche"]
+        else:
+            # --- Threshold come nel secondo programma (vettorizzato) ---
+            with timed("threshold"):
+                mat_sparse = proportional_threshold(mat, dens, None if ranghi is None else ranghi[i - 1])
+
+            # --- Crea grafo ---
+            with timed("grafo"):
+                G = nx.from_numpy_array(mat_sparse)
+                for u, v, d in G.edges(data=True):
+                    d["weight"] = mat_sparse[u, v]
+                    d["inv_weight"] = 1.0 / d["weight"]
+
+            # --- Metriche ---
+            with timed("strength"):
+                strength_vals = dict(G.degree(weight="weight"))
+            with timed("closeness"):
+                closeness_vals = nx.closeness_centrality(G, distance="inv_weight")
+            with timed("betweenness"):
+                # Brandes sulle lunghezze 1/w: stessi valori di nx.betweenness_centrality(G, weight="inv_weight")
+                betweenness_vals = dict(enumerate(
+                    weighted_betweenness(length_matrix(mat_sparse), n_workers=BETWEENNESS_WORKERS)))
+
+            with timed("eigenvector"):
+                eig_vals = nx.eigenvector_centrality(
+                    G,
+                    weight="weight",
+                    max_iter=1000,
+                    tol=1e-6
+                    )
+
+            with timed("clustering"):
+                clustering_vals = nx.clustering(G, weight="weight")
+
+            with timed("avg_path_len"):
+                dist_mat = dict(nx.all_pairs_dijkstra_path_length(G, weight="inv_weight"))
+                avg_path_len = {
+                    node: np.mean(list(dist.values())) for node, dist in dist_mat.items()
+                }
+
+            # righe: Strength, Closeness, Betweenness, Eigenvector, Clustering, AvgPathLen
+            valori = np.array([
+                [vals.get(nodo, np.nan) for nodo in range(n)]
+                for vals in (strength_vals, closeness_vals, betweenness_vals,
+                             eig_vals, clustering_vals, avg_path_len)
+            ], dtype=float)
+            if cache:
+                with timed("cache.put"):
+                    cache.put(chiave, {"metriche": valori})
 
         # --- Costruisco dataframe ---
-        row = {
-            "Paziente": i,
-            "Diagnosi": nome_gruppo,
-            "Densita": dens
-        }
-
-        for nodo in range(n):
-            row[f"Strength_{nodo+1}"] = strength_vals.get(nodo, np.nan)
-            row[f"Closeness_{nodo+1}"] = closeness_vals.get(nodo, np.nan)
-            row[f"Betweenness_{nodo+1}"] = betweenness_vals.get(nodo, np.nan)
-            row[f"Eigenvector_{nodo+1}"] = eig_vals.get(nodo, np.nan)
-            row[f"Clustering_{nodo+1}"] = clustering_vals.get(nodo, np.nan)
-            row[f"AvgPathLen_{nodo+1}"] = avg_path_len.get(nodo, np.nan)
-
-        risultati.append(pd.DataFrame([row]))
+        with timed("tabella"):
+            row = {
+                "Paziente": i,
+                "Diagnosi": nome_gruppo,
+                "Densita": dens
+            }
+
+            for nodo in range(n):
+                row[f"Strength_{nodo+1}"] = valori[0, nodo]
+                row[f"Closeness_{nodo+1}"] = valori[1, nodo]
+                row[f"Betweenness_{nodo+1}"] = valori[2, nodo]
+                row[f"Eigenvector_{nodo+1}"] = valori[3, nodo]
+                row[f"Clustering_{nodo+1}"] = valori[4, nodo]
+                row[f"AvgPathLen_{nodo+1}"] = valori[5, nodo]
+
+            risultati.append(pd.DataFrame([row]))
+        if PROFILING:
+            profili.append(profiling.collect())
 
     return pd.concat(risultati, ignore_index=True)
 
+def metr_dens_nodi_tensore(gruppo, dens, nome_gruppo, ranghi=None):
+    """Come metr_dens_nodi, ma su tutto il gruppo impilato in (S, N, N) con calcoli batched."""
+    X = stack_cohort(gruppo)
+    S, n, _ = X.shape
+    X[:, np.arange(n), np.arange(n)] = 0
+
+    # --- Threshold (stessa regola di metr_dens_nodi, su tutti i soggetti insieme) ---
+    with timed("threshold"):
+        X_sparse = proportional_threshold(X, dens, None if ranghi is None else np.stack(ranghi))
+
+    # --- Metriche batched ---
+    with timed("coorte"):
+        coh = cohort_metrics(X_sparse)
+    with timed("closeness"):
+        closeness = closeness_centrality(coh["D"])
+    with timed("avg_path_len"):
+        avg_path_len = mean_node_distance(coh["D"])
+    with timed("betweenness"):
+        betweenness = cohort_betweenness(coh["L"], n_workers=BETWEENNESS_WORKERS)
+
+    righe = []
+    with timed("tabella"):
+        for s in range(S):
+            row = {
+                "Paziente": s + 1,
+                "Diagnosi": nome_gruppo,
+                "Densita": dens
+            }
+            for nodo in range(n):
+                row[f"Strength_{nodo+1}"] = coh["strength"][s, nodo]
+                row[f"Closeness_{nodo+1}"] = closeness[s, nodo]
+                row[f"Betweenness_{nodo+1}"] = betweenness[s, nodo]
+                row[f"Eigenvector_{nodo+1}"] = coh["eigenvector_w"][s, nodo]
+                row[f"Clustering_{nodo+1}"] = coh["clustering_w"][s, nodo]
+                row[f"AvgPathLen_{nodo+1}"] = avg_path_len[s, nodo]
+            righe.append(row)
+    # blocchi batched: un profilo per gruppo e densità (non per paziente)
+    if PROFILING:
+        profili.append(profiling.collect())
+
+    return pd.DataFrame(righe)
+
+
+def metr_sweep_incrementale(gruppo, densita, nome_gruppo):
+    """Come metr_dens_nodi su tutte le densità insieme: restituisce {densità: DataFrame}."""
+    righe = {d: [] for d in densita}
+
+    for i, mat in enumerate(gruppo, start=1):
+        print(f"Analisi del paziente: {i}")
+        n = mat.shape[0]
+
+        with timed("sweep"):
+            sweep = list(incremental_sweep(mat, densita))
+        for dens, met in sweep:
+            row = {
+                "Paziente": i,
+                "Diagnosi": nome_gruppo,
+                "Densita": dens
+            }
+            for nodo in range(n):
+                row[f"Strength_{nodo+1}"] = met["strength"][nodo]
+                row[f"Closeness_{nodo+1}"] = met["closeness"][nodo]
+                row[f"Betweenness_{nodo+1}"] = met["betweenness"][nodo]
+                row[f"Eigenvector_{nodo+1}"] = met["eigenvector"][nodo]
+                row[f"Clustering_{nodo+1}"] = met["clustering"][nodo]
+                row[f"AvgPathLen_{nodo+1}"] = met["avg_path_len"][nodo]
+            righe[dens].append(row)
+        if PROFILING:
+            profili.append(profiling.collect())
+
+    return {d: pd.DataFrame(r) for d, r in righe.items()}
+
+
+metriche_gruppo = metr_dens_nodi_tensore if TENSORE_COORTE else metr_dens_nodi
+
+# ordinamento degli archi fatto una sola volta per soggetto, riusato a ogni densità
+ranghi_sani = [edge_ranks(m) for m in matrici_sani]
+ranghi_ad   = [edge_ranks(m) for m in matrici_ad]
+
 #Select the density range you want.
-for d in np.arange(0.25, 0.27, 0.01):
-    normal = metr_dens_nodi(matrici_sani, d, "noPTE")
-    ad = metr_dens_nodi(matrici_ad, d, "PTE")
+densita = np.arange(0.25, 0.27, 0.01)
+
+if SWEEP_INCREMENTALE:
+    sweep_sani = metr_sweep_incrementale(matrici_sani, densita, "noPTE")
+    sweep_ad = metr_sweep_incrementale(matrici_ad, densita, "PTE")
+
+for d in densita:
+    if SWEEP_INCREMENTALE:
+        normal, ad = sweep_sani[d], sweep_ad[d]
+    else:
+        normal = metriche_gruppo(matrici_sani, d, "noPTE", ranghi_sani)
+        ad = metriche_gruppo(matrici_ad, d, "PTE", ranghi_ad)
 
     tabella_completa = pd.concat([normal, ad], ignore_index=True)
 
@@ -138,3 +283,6 @@ for d in np.arange(0.25, 0.27, 0.01):
 
     print("Creato file:", nome_file)
 
+if PROFILING:
+    profiling.print_summary(profili, title="Profiling metriche (per paziente e densità)")
+
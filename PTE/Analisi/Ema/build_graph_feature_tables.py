@@ -5,18 +5,54 @@ Crea un unico CSV "wide" (final.csv) con:
 - tutti gli edge (triangolo superiore): edge_0..edge_{E-1}
 - tutte le metriche globali: gf_*
 - tutte le metriche nodali (NON aggregate), appiattite: *_n%03d
+- opzionale: carico lesionale per parcella lesion_load_n%03d (da lesion_parcels.py, LESION_LOAD_CSV)
 
-Dipendenze: numpy, pandas, networkx
+Dipendenze: numpy, pandas
 """
 
 import os
-import re
+import sys
 import glob
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pandas as pd
-import networkx as nx
+
+# moduli condivisi in PTE/Analisi
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from shortest_paths import (  # noqa: E402
+    distance_matrix,
+    characteristic_path_length,
+    global_efficiency,
+)
+from betweenness import weighted_betweenness, cohort_betweenness  # noqa: E402
+from communities import louvain, participation_coefficient, within_module_degree_z  # noqa: E402
+from null_models import null_model_metrics, normalized_features  # noqa: E402
+from matrix_metrics import (  # noqa: E402
+    adjacency,
+    binary_density,
+    degree,
+    strength,
+    weighted_clustering,
+    transitivity,
+    eigenvector_centrality,
+    local_efficiency_binary,
+)
+from cohort_tensor import stack_cohort, cohort_metrics, subject_slice  # noqa: E402
+from feature_cache import FeatureCache  # noqa: E402
+from connectome_store import ConnectomeStore, parse_connectivity_csv  # noqa: E402
+from feature_table import write_feature_table  # noqa: E402
+from memory_report import MemoryReport  # noqa: E402
+import profiling  # noqa: E402
+from profiling import timed  # noqa: E402
+from id_matching import (  # noqa: E402
+    canon_ids,
+    detect_columns,
+    load_label_table,
+    match_labels,
+    print_match_report,
+)
 
 
 # ============================
@@ -24,12 +60,32 @@ import networkx as nx
 # ============================
 LABELS_CSV = "labels_claudia.csv"   
 MAT_DIR    = "./PTE"                      
+CONNECTOME_STORE = None       # es. "connectomes.npy" creato con connectome_store.py: se impostato sostituisce MAT_DIR
 OUT_CSV    = "final.csv"                      
+OUT_FORMAT = "csv"            # "csv" | "npy" (matrice float32 + _columns.json) | "parquet" (richiede pyarrow)
 
 EDGE_MIN_FOR_METRICS = 0.0    # soglia usata SOLO per calcolare metriche (non per salvare edge_*)
 ZERO_DIAG = True             
 CLIP_NEGATIVES = True         # mette a 0 i pesi negativi
-ZSCORE_FINAL = False          # se vuoi z-score sulle feature finali (esclusi id/label)
+ZSCORE_FINAL = False          # z-score sulle feature finali (esclusi id/label) con media/std di TUTTA la coorte: leakage in CV (usa ../cv_pipeline.py)
+COHORT_TENSOR = False         # True: metriche vettorizzabili calcolate in blocco su tutto lo stack (S, N, N)
+CACHE_DIR = None              # es. "./feature_cache": riusa le feature dei soggetti già calcolati (None = off)
+CACHE_MAX_MB = 2048           # dimensione massima della cache (eviction LRU)
+LESION_LOAD_CSV = None        # es. "../lesion_parcel_load.csv" (lesion_parcels.py): aggiunge lesion_load_n*
+LESION_MIN_MATCH = 0.5        # frazione minima di soggetti con una riga in LESION_LOAD_CSV (sotto: avviso; zero: errore)
+DTYPE = "float64"             # "float32": matrici, stack di coorte, edge, cache e CSV in singola precisione
+PROFILE = False               # True: tempo e chiamate per metrica/soggetto, tabella riassuntiva a fine run
+MEMORY_REPORT = False         # True: picco di memoria per stadio (tracemalloc, rallenta) + picco RSS a fine run
+N_WORKERS = 1                 # >1: soggetti in parallelo su un process pool (es. = request_cpus del .sub); None = tutte le CPU
+COMMUNITY_SEED = 0            # seed di Louvain (comunità riproducibili)
+COMMUNITY_RESTARTS = 5        # restart di Louvain per soggetto: si tiene la partizione a modularità massima
+COMMUNITY_WORKERS = 1         # processi per i restart (lasciare 1 con N_WORKERS > 1: niente pool annidati)
+NULL_MODELS = False           # True: metriche normalizzate su grafi randomizzati + small-worldness (gf_*_norm*, lento; richiede EDGE_MIN_FOR_METRICS > 0)
+NULL_METHOD = "maslov_sneppen"  # "maslov_sneppen" (conserva il grado) | "strength" (grado + circa la strength)
+N_NULLS = 100                 # grafi randomizzati per soggetto
+NULL_SWAPS = 10               # tentativi di scambio per arco
+NULL_SEED = 0                 # seed dell'ensemble (con CACHE_DIR l'ensemble si salva per soggetto e seed)
+NULL_WORKERS = 1              # processi per i null del soggetto (lasciare 1 con N_WORKERS > 1)
 
 # Se vuoi forzare le colonne del labels file:
 ID_COL_HINT = None            # es: "Paziente"
@@ -37,259 +93,208 @@ LABEL_COL_HINT = None         # es: "Label"
 # ============================
 
 
-# -------------------------- Utility ID --------------------------
-def canon_id(s: str) -> str:
-    """Estrae un id canonico da stringa/nome file."""
-    s = str(s).strip()
-    b = os.path.splitext(os.path.basename(s))[0]
-    digs = re.findall(r"\d+", b)
-    if digs:
-        d = "".join(digs).lstrip("0")
-        return d if d else "0"
-
-    b = re.sub(r"[\s\-_]+", "", b.lower())
-    for pref in ("sub", "subject", "pt", "pte", "id", "patient", "paziente"):
-        if b.startswith(pref):
-            b = b[len(pref):]
-    b = b.lstrip("0")
-    return b if b else "0"
-
-
-def load_labels(labels_csv: str, id_col_hint=None, label_col_hint=None) -> dict:
-    """
-    Carica labels da CSV e restituisce dict {canon_id: label}.
-    Auto-detect colonne comuni, oppure puoi passarle in hint.
-    """
-    df = pd.read_csv(labels_csv, dtype=str)
-
-    id_col = id_col_hint or next(
-        (c for c in ["Paziente", "ID", "Id", "Subject", "subject", "patient", "Patient"] if c in df.columns),
-        None
-    )
-    label_col = label_col_hint or next(
-        (c for c in ["Label", "label", "y", "Y", "Class", "class", "Classe"] if c in df.columns),
-        None
-    )
-
-    if id_col is None or label_col is None:
-        raise ValueError(
-            f"labels_csv deve avere colonne ID e LABEL. "
-            f"Colonne trovate: {list(df.columns)}. "
-            f"Puoi forzare ID_COL_HINT e LABEL_COL_HINT nel config."
-        )
+# -------------------------- IO matrice --------------------------
+def preprocess_connectivity(A: np.ndarray, zero_diag: bool = True, clip_negatives: bool = True,
+                            name: str = "", dtype=float) -> np.ndarray:
+    """Simmetrizza, azzera la diagonale e clippa i negativi (restituisce una nuova matrice di tipo dtype)."""
+    A = np.asarray(A, dtype=dtype)
+    if A.ndim != 2 or A.shape[0] != A.shape[1]:
+        raise ValueError(f"Matrice non quadrata in {name}: shape={A.shape}")
 
-    df[id_col] = df[id_col].astype(str).str.strip()
-    df[label_col] = df[label_col].astype(str).str.strip()
+    # simmetrizza
+    A = 0.5 * (A + A.T)
 
-    df["__canon__"] = df[id_col].map(canon_id)
-    df = df.drop_duplicates(subset="__canon__", keep="last")
+    if zero_diag:
+        np.fill_diagonal(A, 0.0)
+    if clip_negatives:
+        A[A < 0] = 0.0
 
-    return dict(zip(df["__canon__"], df[label_col]))
+    return A
 
 
-# -------------------------- IO matrice --------------------------
-def load_connectivity_csv(fp: str, zero_diag: bool = True, clip_negatives: bool = True) -> np.ndarray:
+def load_connectivity_csv(fp: str, zero_diag: bool = True, clip_negatives: bool = True,
+                          dtype=float) -> np.ndarray:
     """
     Carica matrice NxN da CSV. Robusto a:
     - header presenti (si tenta coercizione numerica)
     - NaN (riempiti a 0)
     """
-    raw = pd.read_csv(fp, header=None)
+    A = parse_connectivity_csv(fp)
+    return preprocess_connectivity(A, zero_diag=zero_diag, clip_negatives=clip_negatives, name=fp, dtype=dtype)
 
-    # coercizione numerica: eventuali stringhe -> NaN
-    A = raw.apply(pd.to_numeric, errors="coerce").values.astype(float)
-    A = np.nan_to_num(A, nan=0.0, posinf=0.0, neginf=0.0)
 
-    if A.ndim != 2 or A.shape[0] != A.shape[1]:
-        raise ValueError(f"Matrice non quadrata in {fp}: shape={A.shape}")
+_STORE = None
 
-    # simmetrizza
-    A = 0.5 * (A + A.T)
 
-    if zero_diag:
-        np.fill_diagonal(A, 0.0)
-    if clip_negatives:
-        A[A < 0] = 0.0
+def _connectome_store():
+    """Store binario aperto una sola volta per processo (memory-mapped), None se non configurato."""
+    global _STORE
+    if CONNECTOME_STORE and _STORE is None:
+        _STORE = ConnectomeStore(CONNECTOME_STORE)
+    return _STORE
 
-    return A
+
+def load_subject_matrix(fp: str) -> np.ndarray:
+    """Matrice preprocessata di un soggetto: dallo store binario se configurato, altrimenti dal CSV."""
+    store = _connectome_store()
+    if store is not None:
+        return preprocess_connectivity(store.matrix(fp), zero_diag=ZERO_DIAG,
+                                       clip_negatives=CLIP_NEGATIVES, name=fp, dtype=DTYPE)
+    return load_connectivity_csv(fp, zero_diag=ZERO_DIAG, clip_negatives=CLIP_NEGATIVES, dtype=DTYPE)
 
 
 def upper_triangle_vector(A: np.ndarray, k: int = 1):
     iu, ju = np.triu_indices_from(A, k=k)
-    return A[iu, ju].astype(float), iu, ju
+    return A[iu, ju].astype(DTYPE), iu, ju
 
 
 # -------------------------- Grafi & metriche --------------------------
-def build_graphs_from_matrix(A: np.ndarray, edge_min: float = 0.0):
+def build_subject_bundle(A: np.ndarray, edge_min: float = 0.0, pre: dict = None) -> dict:
     """
-    G_w: pesato (weight=w)
-    G_b: binario (weight=1)
-    H_len: pesato con 'length' = 1/w per distanze
+    Tutto ciò che serve alle metriche di UN soggetto, costruito una sola volta:
+    - W, B: pesi e maschera degli archi (vedi matrix_metrics)
+    - L, D: lunghezze 1/w e distanze minime (vedi shortest_paths)
+    - pre: valori del soggetto già calcolati in modalità coorte (vedi cohort_tensor), opzionale
     """
-    n = A.shape[0]
-    G_w = nx.Graph(); G_w.add_nodes_from(range(n))
-    G_b = nx.Graph(); G_b.add_nodes_from(range(n))
-    H_len = nx.Graph(); H_len.add_nodes_from(range(n))
-
-    for i in range(n):
-        for j in range(i + 1, n):
-            w = float(A[i, j])
-            if w > edge_min:
-                G_w.add_edge(i, j, weight=w)
-                G_b.add_edge(i, j, weight=1.0)
-                H_len.add_edge(i, j, weight=w, length=(1.0 / w))
-
-    return G_w, G_b, H_len
-
-
-def binary_density(A: np.ndarray, edge_min: float = 0.0) -> float:
-    N = A.shape[0]
-    if N <= 1:
-        return 0.0
-    E = int(np.count_nonzero(np.triu(A, 1) > edge_min))
-    return E / (N * (N - 1) / 2.0)
+    if pre is not None:
+        W, B, L, D = pre["W"], pre["B"], pre["L"], pre["D"]
+    else:
+        W, B = adjacency(A, edge_min=edge_min)
+        L, D = distance_matrix(A, edge_min=edge_min)
 
+    return {"A": A, "edge_min": edge_min, "W": W, "B": B, "L": L, "D": D, "pre": pre}
 
-def characteristic_path_length_weighted(H_len: nx.Graph) -> float:
-    if H_len.number_of_edges() == 0 or H_len.number_of_nodes() <= 1:
-        return np.nan
 
-    lengths = dict(nx.all_pairs_dijkstra_path_length(H_len, weight="length"))
-    nodes = list(H_len.nodes())
+def _from_cohort(bundle: dict, key: str, compute):
+    """Valore già calcolato in modalità coorte (bundle["pre"]) oppure calcolato qui."""
+    pre = bundle.get("pre")
+    if pre is not None and key in pre:
+        return pre[key]
+    return compute()
 
-    dists = []
-    for i_idx in range(len(nodes)):
-        for j_idx in range(i_idx + 1, len(nodes)):
-            i, j = nodes[i_idx], nodes[j_idx]
-            dij = lengths.get(i, {}).get(j, None)
-            if dij is not None:
-                dists.append(dij)
 
-    return float(np.mean(dists)) if dists else np.nan
+def subject_communities(bundle: dict, weighted: bool):
+    """
+    Partizione Louvain del soggetto (etichette, Q) sul grafo binario B o pesato W.
+    Calcolata una sola volta e tenuta nel bundle: la usano sia global_features sia nodal_metrics.
+    """
+    key = "communities_w" if weighted else "communities_bin"
+    if key not in bundle:
+        M = bundle["W"] if weighted else bundle["B"].astype(float)
+        bundle[key] = louvain(M, seed=COMMUNITY_SEED, n_restarts=COMMUNITY_RESTARTS, n_workers=COMMUNITY_WORKERS)
+    return bundle[key]
 
 
-def global_efficiency_weighted(H_len: nx.Graph) -> float:
-    if H_len.number_of_edges() == 0 or H_len.number_of_nodes() <= 1:
+def characteristic_path_length_weighted(D: np.ndarray) -> float:
+    """Path length caratteristico dalla matrice delle distanze (lunghezze 1/w)."""
+    if D.shape[0] <= 1:
         return np.nan
+    return characteristic_path_length(D)
 
-    lengths = dict(nx.all_pairs_dijkstra_path_length(H_len, weight="length"))
-    nodes = list(H_len.nodes())
-
-    inv_d = []
-    for i_idx in range(len(nodes)):
-        for j_idx in range(i_idx + 1, len(nodes)):
-            i, j = nodes[i_idx], nodes[j_idx]
-            dij = lengths.get(i, {}).get(j, None)
-            if dij is not None and dij > 0:
-                inv_d.append(1.0 / dij)
 
-    return float(np.mean(inv_d)) if inv_d else np.nan
+def global_efficiency_weighted(D: np.ndarray) -> float:
+    """Efficienza globale dalla matrice delle distanze (lunghezze 1/w)."""
+    if D.shape[0] <= 1:
+        return np.nan
+    return global_efficiency(D)
 
 
-def global_features(A: np.ndarray, edge_min: float = 0.0) -> dict:
+def global_features(A: np.ndarray, edge_min: float = 0.0, bundle: dict = None) -> dict:
+    """bundle: grafi/distanze del soggetto da build_subject_bundle (se None viene costruito qui)."""
     n = A.shape[0]
-    G_w, G_b, H_len = build_graphs_from_matrix(A, edge_min=edge_min)
-
-    # strength per nodo (solo archi > edge_min)
-    strength_per_node = (A * (A > edge_min)).sum(axis=1)
-
-    gf = {
-        "gf_n_nodes": int(n),
-        "gf_binary_density": float(binary_density(A, edge_min=edge_min)),
-        "gf_total_strength": float(np.sum(np.triu(A, 1) * (np.triu(A, 1) > edge_min))),
-        "gf_mean_strength": float(np.mean(strength_per_node)) if n > 0 else np.nan,
-        "gf_charpath_len_w": characteristic_path_length_weighted(H_len),
-        "gf_global_eff_w": global_efficiency_weighted(H_len),
-        "gf_transitivity_bin": nx.transitivity(G_b) if G_b.number_of_edges() > 0 else np.nan,
-    }
+    if bundle is None:
+        bundle = build_subject_bundle(A, edge_min=edge_min)
+    W, B, D = bundle["W"], bundle["B"], bundle["D"]
+
+    with timed("gf.density_strength"):
+        # strength per nodo (solo archi > edge_min)
+        strength_per_node = (A * (A > edge_min)).sum(axis=1)
+
+        gf = {
+            "gf_n_nodes": int(n),
+            "gf_binary_density": float(binary_density(B)),
+            "gf_total_strength": float(np.sum(np.triu(A, 1) * (np.triu(A, 1) > edge_min))),
+            "gf_mean_strength": float(np.mean(strength_per_node)) if n > 0 else np.nan,
+        }
+
+    with timed("gf.charpath_eff"):
+        gf["gf_charpath_len_w"] = float(_from_cohort(bundle, "gf_charpath_len_w",
+                                                     lambda: characteristic_path_length_weighted(D)))
+        gf["gf_global_eff_w"] = float(_from_cohort(bundle, "gf_global_eff_w",
+                                                   lambda: global_efficiency_weighted(D)))
+
+    with timed("gf.transitivity"):
+        gf["gf_transitivity_bin"] = float(_from_cohort(bundle, "gf_transitivity_bin", lambda: transitivity(B)))
 
     # clustering pesato medio
-    if G_w.number_of_edges() > 0:
-        cl_w = nx.clustering(G_w, weight="weight")
-        gf["gf_avg_weighted_clust"] = float(np.mean(list(cl_w.values()))) if cl_w else np.nan
-    else:
-        gf["gf_avg_weighted_clust"] = np.nan
-
-    # modularità binaria (best effort)
-    try:
-        from networkx.algorithms.community import greedy_modularity_communities, modularity
-        if G_b.number_of_edges() > 0:
-            comms = list(greedy_modularity_communities(G_b))
-            gf["gf_n_communities"] = int(len(comms))
-            gf["gf_modularity_bin"] = float(modularity(G_b, comms))
+    with timed("gf.avg_clustering"):
+        if B.any() and n > 0:
+            gf["gf_avg_weighted_clust"] = float(_from_cohort(
+                bundle, "gf_avg_weighted_clust", lambda: np.mean(weighted_clustering(W, B))))
         else:
-            gf["gf_n_communities"] = np.nan
-            gf["gf_modularity_bin"] = np.nan
-    except Exception:
-        gf["gf_n_communities"] = np.nan
-        gf["gf_modularity_bin"] = np.nan
+            gf["gf_avg_weighted_clust"] = np.nan
+
+    # comunità (Louvain) e modularità, binaria e pesata: NaN se il grafo non ha archi
+    with timed("gf.modularity"):
+        labels_b, q_b = subject_communities(bundle, weighted=False)
+        labels_w, q_w = subject_communities(bundle, weighted=True)
+        has_edges = bool(B.any())
+        gf["gf_n_communities"] = int(labels_b.max() + 1) if has_edges else np.nan
+        gf["gf_modularity_bin"] = float(q_b)
+        gf["gf_n_communities_w"] = int(labels_w.max() + 1) if has_edges else np.nan
+        gf["gf_modularity_w"] = float(q_w)
+
+    if NULL_MODELS:
+        with timed("gf.null_models"):
+            null = null_model_metrics(W, n_nulls=N_NULLS, method=NULL_METHOD, n_swaps=NULL_SWAPS,
+                                      seed=NULL_SEED, n_workers=NULL_WORKERS, cache=_feature_cache())
+            gf.update(normalized_features(gf, null))
 
     return gf
 
 
-def nodal_metrics(A: np.ndarray, edge_min: float = 0.0) -> pd.DataFrame:
-    G_w, G_b, H_len = build_graphs_from_matrix(A, edge_min=edge_min)
+def nodal_metrics(A: np.ndarray, edge_min: float = 0.0, bundle: dict = None) -> pd.DataFrame:
+    """bundle: grafi/distanze del soggetto da build_subject_bundle (se None viene costruito qui)."""
+    if bundle is None:
+        bundle = build_subject_bundle(A, edge_min=edge_min)
+    W, B, L, D = bundle["W"], bundle["B"], bundle["L"], bundle["D"]
     n = A.shape[0]
-    all_nodes = list(range(n))
-
-    deg_bin = pd.Series(dict(G_b.degree())).reindex(all_nodes).fillna(0).astype(float)
-    strength = pd.Series(dict(G_w.degree(weight="weight"))).reindex(all_nodes).fillna(0.0)
-
-    if G_w.number_of_edges() > 0:
-        clust_w = pd.Series(nx.clustering(G_w, weight="weight")).reindex(all_nodes).fillna(0.0)
-    else:
-        clust_w = pd.Series(index=all_nodes, dtype=float).fillna(0.0)
 
-    if H_len.number_of_edges() > 0:
-        btw_len = pd.Series(nx.betweenness_centrality(H_len, weight="length", normalized=True)) \
-            .reindex(all_nodes).fillna(0.0)
-    else:
-        btw_len = pd.Series(index=all_nodes, dtype=float).fillna(0.0)
-
-    try:
-        if G_w.number_of_edges() > 0:
-            eig_cent = pd.Series(nx.eigenvector_centrality_numpy(G_w, weight="weight")) \
-                .reindex(all_nodes).fillna(0.0)
-        else:
-            eig_cent = pd.Series(index=all_nodes, dtype=float).fillna(0.0)
-    except Exception:
-        eig_cent = pd.Series(index=all_nodes, dtype=float).fillna(0.0)
-
-    # local efficiency per nodo su binario
-    def node_local_efficiency_binary(Gb: nx.Graph):
-        eff = {}
-        for u in Gb.nodes():
-            nbrs = set(Gb.neighbors(u))
-            if len(nbrs) <= 1:
-                eff[u] = 0.0
-                continue
-
-            sub = Gb.subgraph(nbrs).copy()
-            lengths = dict(nx.all_pairs_shortest_path_length(sub))
-
-            inv_d = []
-            nodes = list(sub.nodes())
-            for i_idx in range(len(nodes)):
-                for j_idx in range(i_idx + 1, len(nodes)):
-                    i, j = nodes[i_idx], nodes[j_idx]
-                    dij = lengths.get(i, {}).get(j, None)
-                    if dij is not None and dij > 0:
-                        inv_d.append(1.0 / dij)
-
-            m = len(nodes) * (len(nodes) - 1) / 2.0
-            eff[u] = float(np.sum(inv_d) / m) if m > 0 else 0.0
-        return eff
-
-    loc_eff_bin = pd.Series(node_local_efficiency_binary(G_b)).reindex(all_nodes).fillna(0.0)
+    # eigenvector: zeri se il grafo è sconnesso (soluzione ambigua, come networkx) o se eigh fallisce
+    with timed("nodal.eigenvector"):
+        eig_cent = np.zeros(n)
+        if n > 0 and np.isfinite(D).all():
+            try:
+                eig_cent = _from_cohort(bundle, "eigenvector_w", lambda: eigenvector_centrality(W))
+            except np.linalg.LinAlgError:
+                pass
+
+    with timed("nodal.degree_strength"):
+        deg = _from_cohort(bundle, "degree_bin", lambda: degree(B))
+        stren = _from_cohort(bundle, "strength", lambda: strength(W))
+    with timed("nodal.clustering"):
+        clust = _from_cohort(bundle, "clustering_w", lambda: weighted_clustering(W, B))
+    with timed("nodal.betweenness"):
+        # betweenness sulle lunghezze 1/w (Brandes esatto, come networkx)
+        betw = _from_cohort(bundle, "betweenness_len", lambda: weighted_betweenness(L, normalized=True))
+    with timed("nodal.local_efficiency"):
+        loc_eff = local_efficiency_binary(B)
+    with timed("nodal.communities"):
+        # ruoli rispetto alla partizione pesata (0 per i nodi isolati)
+        labels_w, _ = subject_communities(bundle, weighted=True)
+        part = participation_coefficient(W, labels_w)
+        wmz = within_module_degree_z(W, labels_w)
 
     return pd.DataFrame({
-        "node": all_nodes,
-        "degree_bin": deg_bin.values,
-        "strength": strength.values,
-        "clustering_w": clust_w.values,
-        "betweenness_len": btw_len.values,
-        "eigenvector_w": eig_cent.values,
-        "local_eff_bin": loc_eff_bin.values,
+        "node": np.arange(n),
+        "degree_bin": deg,
+        "strength": stren,
+        "clustering_w": clust,
+        "betweenness_len": betw,
+        "eigenvector_w": eig_cent,
+        "local_eff_bin": loc_eff,
+        "participation_w": part,
+        "within_module_z_w": wmz,
     })
 
 
@@ -298,82 +303,388 @@ def flatten_nodal_wide(df_nodes: pd.DataFrame, fmt="{:03d}") -> dict:
     """
     Converte il dataframe per-nodo in dict {col_wide: valore}, con suffissi *_n000, *_n001, ...
     """
-    out = {}
-    for _, row in df_nodes.iterrows():
-        n_id = fmt.format(int(row["node"]))
-        for c in df_nodes.columns:
-            if c == "node":
-                continue
-            v = row[c]
-            out[f"{c}_n{n_id}"] = float(v) if pd.notna(v) else 0.0
-    return out
+    cols = [c for c in df_nodes.columns if c != "node"]
+    vals = np.nan_to_num(df_nodes[cols].to_numpy(dtype=float), nan=0.0)
+    n_ids = [fmt.format(int(n)) for n in df_nodes["node"]]
 
+    # ordine: nodo per nodo, metriche nell'ordine delle colonne
+    names = [f"{c}_n{n_id}" for n_id in n_ids for c in cols]
+    return dict(zip(names, vals.ravel().tolist()))
 
-# -------------------------- MAIN  --------------------------
-def run():
-    label_map = load_labels(LABELS_CSV, id_col_hint=ID_COL_HINT, label_col_hint=LABEL_COL_HINT)
 
-    files = sorted(glob.glob(os.path.join(MAT_DIR, "*.csv")))
-    if not files:
-        raise FileNotFoundError(f"Nessun CSV trovato in MAT_DIR={MAT_DIR}")
+# -------------------------- Cache feature --------------------------
+FEATURES_VERSION = 3          # da incrementare quando cambiano le metriche calcolate (invalida la cache)
 
-    rows = []
-    used, skipped_no_label, skipped_errors = 0, 0, 0
-    edge_cols = None
 
-    for fp in files:
-        pid = canon_id(fp)
-        lab = label_map.get(pid)
+_CACHE = None
+
+
+def _feature_cache():
+    """
+    Cache delle feature aperta una sola volta per processo (come _connectome_store), None se non configurata:
+    la stessa istanza tiene il totale corrente dei byte, così put() non riscandisce la cartella.
+    """
+    global _CACHE
+    if not CACHE_DIR:
+        return None
+    if _CACHE is None or _CACHE.cache_dir != Path(CACHE_DIR):
+        _CACHE = FeatureCache(CACHE_DIR, max_bytes=CACHE_MAX_MB * 1024 ** 2)
+    return _CACHE
+
+
+def subject_cache_key(fp: str) -> str:
+    """Chiave di cache: contenuto del file matrice (o della fetta dello store) + parametri che cambiano le feature."""
+    store = _connectome_store()
+    return FeatureCache.key(
+        store.matrix(fp) if store is not None else fp,
+        edge_min=EDGE_MIN_FOR_METRICS,
+        zero_diag=ZERO_DIAG,
+        clip_negatives=CLIP_NEGATIVES,
+        dtype=DTYPE,
+        community=(COMMUNITY_SEED, COMMUNITY_RESTARTS),
+        null_models=(NULL_METHOD, N_NULLS, NULL_SWAPS, NULL_SEED) if NULL_MODELS else None,
+        version=FEATURES_VERSION,
+    )
+
+
+def _pack_features(edge_vec, gf: dict, nodes_df: pd.DataFrame) -> dict:
+    return {
+        "edges": edge_vec,
+        "gf_names": np.array(list(gf.keys())),
+        "gf_values": np.array([float(v) for v in gf.values()]),
+        "gf_is_int": np.array([isinstance(v, (int, np.integer)) for v in gf.values()]),
+        "nodal": nodes_df.to_numpy(dtype=DTYPE),
+        "nodal_cols": np.array(list(nodes_df.columns)),
+    }
+
+
+def _unpack_features(z: dict):
+    gf = {
+        k: int(v) if is_int else float(v)
+        for k, v, is_int in zip(z["gf_names"].tolist(), z["gf_values"].tolist(), z["gf_is_int"].tolist())
+    }
+    nodes_df = pd.DataFrame(z["nodal"], columns=z["nodal_cols"].tolist())
+    return z["edges"], gf, nodes_df
 
-        if lab is None:
-            skipped_no_label += 1
-            continue
 
+# -------------------------- Carico lesionale per parcella --------------------------
+def load_lesion_load(csv_path: str) -> tuple:
+    """
+    Tabella di lesion_parcels.py -> ({canon_id: vettore}, colonne lesion_load_n*).
+    Più maschere con lo stesso id canonico: vale l'ultima (come load_labels).
+    """
+    df = pd.read_csv(csv_path, dtype={"patient_id": str})
+    cols = [c for c in df.columns if c.startswith("lesion_load_n")]
+    if not cols:
+        raise ValueError(f"Nessuna colonna lesion_load_n* in {csv_path}")
+
+    df["__canon__"] = canon_ids(df["patient_id"]).to_numpy()
+    df = df.drop_duplicates(subset="__canon__", keep="last")
+    return dict(zip(df["__canon__"], df[cols].to_numpy(dtype=float))), cols
+
+
+def check_lesion_match(lesion: tuple, pids, min_fraction: float = LESION_MIN_MATCH) -> int:
+    """
+    Soggetti (ID canonici) con una riga nella tabella lesionale.
+    Nessuno -> ValueError: gli ID non si uniscono (es. patient_id ancora come nome della maschera,
+    vedi ID_PATTERN / ID_MAP_CSV di lesion_parcels.py). Meno di min_fraction -> avviso.
+    """
+    by_id = lesion[0]
+    pids = list(pids)
+    n = sum(pid in by_id for pid in pids)
+    example = f"tabella: {next(iter(by_id), '-')}, soggetti: {pids[0] if pids else '-'}"
+    if pids and n == 0:
+        raise ValueError(f"Nessun soggetto ha una riga in LESION_LOAD_CSV (ID canonici diversi, es. {example}): "
+                         f"rigenera la tabella con ID_MAP_CSV in lesion_parcels.py")
+    if n < min_fraction * len(pids):
+        print(f"[WARN] Solo {n}/{len(pids)} soggetti hanno una riga in LESION_LOAD_CSV ({example}): "
+              f"gli altri avranno lesion_load_n* = NaN")
+    return n
+
+
+def lesion_load_features(lesion: tuple, pid: str) -> dict:
+    """Colonne lesion_load_n* del soggetto; NaN se non ha una maschera."""
+    by_id, cols = lesion
+    vals = by_id.get(pid)
+    if vals is None:
+        return dict.fromkeys(cols, np.nan)
+    return dict(zip(cols, vals.tolist()))
+
+
+# -------------------------- Pipeline per soggetto --------------------------
+def subject_features(fp: str, A: np.ndarray = None, pre: dict = None):
+    """
+    Carica la matrice di un soggetto e calcola (edge_vec, metriche globali, dataframe per-nodo).
+    A, pre: matrice già caricata e valori precalcolati in modalità coorte (opzionali).
+    Con CACHE_DIR attivo, un soggetto già calcolato con gli stessi parametri non viene ricalcolato.
+    """
+    cache = _feature_cache()
+    with timed("cache.get"):
+        key = subject_cache_key(fp) if cache is not None else None
+        hit = cache.get(key) if cache is not None else None
+
+    if hit is not None:
+        return _unpack_features(hit)
+
+    # Matrice & edges
+    if A is None:
+        with timed("load"):
+            A = load_subject_matrix(fp)
+    with timed("edges"):
+        edge_vec, _, _ = upper_triangle_vector(A, k=1)
+
+    # Metriche (grafi e distanze costruiti una sola volta per soggetto)
+    with timed("bundle"):
+        bundle = build_subject_bundle(A, edge_min=EDGE_MIN_FOR_METRICS, pre=pre)
+    gf = global_features(A, edge_min=EDGE_MIN_FOR_METRICS, bundle=bundle)
+    nodes_df = nodal_metrics(A, edge_min=EDGE_MIN_FOR_METRICS, bundle=bundle)
+
+    if cache is not None:
+        with timed("cache.put"):
+            cache.put(key, _pack_features(edge_vec, gf, nodes_df))
+    return edge_vec, gf, nodes_df
+
+
+def process_subject(fp: str, pid: str, lab, A: np.ndarray = None, pre: dict = None) -> dict:
+    """Riga del CSV wide di un soggetto: id, label, edge_*, gf_*, metriche nodali appiattite."""
+    edge_vec, gf, nodes_df = subject_features(fp, A=A, pre=pre)
+    with timed("flatten"):
+        node_wide = flatten_nodal_wide(nodes_df, fmt="{:03d}")
+
+    # Riga
+    row = {"id": pid, "label": lab}
+    row.update({f"edge_{k}": float(edge_vec[k]) for k in range(edge_vec.size)})
+    row.update(gf)
+    row.update(node_wide)
+    return row
+
+
+def subject_vector(fp: str, A: np.ndarray = None, pre: dict = None):
+    """
+    Output colonnare: le feature del soggetto come un unico vettore float32, nello stesso ordine
+    di colonne della riga di process_subject (edge, gf, nodali nodo per nodo), senza passare da un dict.
+    -> (schema, vettore); schema = (n. edge, nomi gf, metriche nodali, nodi) identifica le colonne
+    e con vector_columns ne ricostruisce i nomi.
+    """
+    edge_vec, gf, nodes_df = subject_features(fp, A=A, pre=pre)
+    with timed("flatten"):
+        cols = [c for c in nodes_df.columns if c != "node"]
+        nodal = nodes_df[cols].to_numpy(dtype=float)
+        vec = np.empty(edge_vec.size + len(gf) + nodal.size, dtype=np.float32)
+        vec[:edge_vec.size] = edge_vec
+        vec[edge_vec.size:edge_vec.size + len(gf)] = [float(v) for v in gf.values()]
+        vec[edge_vec.size + len(gf):] = np.nan_to_num(nodal, nan=0.0).ravel()
+    schema = (edge_vec.size, tuple(gf), tuple(cols), tuple(int(n) for n in nodes_df["node"]))
+    return schema, vec
+
+
+def vector_columns(schema, fmt="{:03d}") -> list:
+    """Nomi delle colonne di subject_vector (gli stessi di flatten_nodal_wide per la parte nodale)."""
+    n_edges, gf_names, cols, nodes = schema
+    return ([f"edge_{k}" for k in range(n_edges)] + list(gf_names)
+            + [f"{c}_n{fmt.format(n)}" for n in nodes for c in cols])
+
+
+def _process_subject_safe(job):
+    """
+    Wrapper per il process pool: restituisce (risultato, None, profilo) oppure (None, messaggio d'errore, profilo).
+    risultato: riga di process_subject (OUT_FORMAT = "csv") o (schema, vettore) di subject_vector.
+    profilo: {blocco: (chiamate, secondi)} del soggetto con PROFILE attivo, altrimenti None.
+    """
+    fp, pid, lab, *extra = job
+    profiling.enable(PROFILE)
+    profiling.reset()
+    try:
+        if OUT_FORMAT == "csv":
+            res, err = process_subject(fp, pid, lab, *extra), None
+        else:
+            res, err = subject_vector(fp, *extra), None
+    except Exception as e:
+        res, err = None, str(e)
+    return res, err, (profiling.collect() if PROFILE else None)
+
+
+def attach_cohort_metrics(jobs, edge_min: float = 0.0):
+    """
+    Modalità coorte: carica tutte le matrici, le impila in (S, N, N) e calcola in blocco
+    le metriche vettorizzabili. Restituisce i job estesi con (A, valori del soggetto).
+    I soggetti che non si caricano restano job semplici (l'errore verrà riportato dal worker),
+    così come quelli già presenti nella cache delle feature.
+    """
+    cache = _feature_cache()
+    loaded, mats = [], []
+    for job in jobs:
+        if cache is not None and subject_cache_key(job[0]) in cache:
+            continue
         try:
-            # Matrice & edges
-            A = load_connectivity_csv(fp, zero_diag=ZERO_DIAG, clip_negatives=CLIP_NEGATIVES)
-            edge_vec, _, _ = upper_triangle_vector(A, k=1)
+            A = load_subject_matrix(job[0])
+        except Exception:
+            continue
+        loaded.append(job)
+        mats.append(A)
+
+    if not mats:
+        return jobs
+
+    cohort = cohort_metrics(stack_cohort(mats, dtype=DTYPE), edge_min=edge_min)
+    # betweenness di tutta la coorte in blocchi (soggetto, sorgente) sul process pool
+    cohort["betweenness_len"] = cohort_betweenness(cohort["L"], normalized=True, n_workers=N_WORKERS)
+    extended = {job: (A, subject_slice(cohort, s)) for s, (job, A) in enumerate(zip(loaded, mats))}
+    return [job + extended[job] if job in extended else job for job in jobs]
+
+
+def iter_subject_results(jobs, n_workers=1):
+    """
+    Esegue i job (fp, pid, label) in serie o su un process pool.
+    I risultati escono nello stesso ordine dei job (output deterministico).
+    """
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
 
-            if edge_cols is None:
-                edge_cols = [f"edge_{k}" for k in range(edge_vec.size)]
+    if n_workers <= 1 or len(jobs) <= 1:
+        yield from map(_process_subject_safe, jobs)
+        return
 
-            # Metriche
-            gf = global_features(A, edge_min=EDGE_MIN_FOR_METRICS)
-            nodes_df = nodal_metrics(A, edge_min=EDGE_MIN_FOR_METRICS)
-            node_wide = flatten_nodal_wide(nodes_df, fmt="{:03d}")
+    with ProcessPoolExecutor(max_workers=min(n_workers, len(jobs))) as ex:
+        yield from ex.map(_process_subject_safe, jobs)
 
-            # Riga
-            row = {"id": pid, "label": lab}
-            row.update({edge_cols[k]: float(edge_vec[k]) for k in range(edge_vec.size)})
-            row.update(gf)
-            row.update(node_wide)
 
-            rows.append(row)
-            used += 1
+# -------------------------- MAIN  --------------------------
+def run():
+    if NULL_MODELS and EDGE_MIN_FOR_METRICS <= 0:
+        # senza soglia il grafo è quasi completo: pochi scambi validi, null quasi uguali al soggetto
+        raise ValueError("NULL_MODELS richiede un grafo sogliato: imposta EDGE_MIN_FOR_METRICS > 0")
+
+    mem = MemoryReport(enabled=MEMORY_REPORT)
+    mem.mark("label + file")
+    # i blocchi del processo principale (coorte, scrittura) finiscono in un profilo a parte
+    profiling.enable(PROFILE)
+    profiling.reset()
+
+    store = _connectome_store()
+    if store is not None:
+        files = store.files
+    else:
+        files = sorted(glob.glob(os.path.join(MAT_DIR, "*.csv")))
+    if not files:
+        raise FileNotFoundError(f"Nessun CSV trovato in MAT_DIR={MAT_DIR}")
 
-        except Exception as e:
+    # join label <-> file per ID canonico (un solo merge, con report di mancanti e duplicati)
+    labels_df = load_label_table(LABELS_CSV, id_col=ID_COL_HINT, label_col=LABEL_COL_HINT)
+    matched, report = match_labels(labels_df, files, id_col=ID_COL_HINT, label_col=LABEL_COL_HINT)
+    print_match_report(report)
+    _, label_col = detect_columns(labels_df, ID_COL_HINT, LABEL_COL_HINT)
+    jobs = list(zip(matched["file"], matched["canon"], matched[label_col]))
+
+    lesion = load_lesion_load(LESION_LOAD_CSV) if LESION_LOAD_CSV else None
+    if lesion is not None:
+        check_lesion_match(lesion, matched["canon"])
+
+    used, skipped_errors = 0, 0
+    skipped_no_label = len(report["unmatched_files"])
+    n_edges, no_lesion = 0, 0
+
+    if COHORT_TENSOR:
+        mem.mark("coorte (S, N, N)")
+        with timed("cohort"):
+            jobs = attach_cohort_metrics(jobs, edge_min=EDGE_MIN_FOR_METRICS)
+
+    mem.mark("soggetti (load + metriche)")
+
+    # csv: lista di righe -> DataFrame; npy/parquet: matrice float32 (S, F) preallocata
+    columnar = OUT_FORMAT != "csv"
+    rows, ids, labels = [], [], []
+    X, feat_cols, first_schema, first_vec_size = None, None, None, 0
+    profiles = []
+    main_prof = profiling.collect()  # prima del loop: in serie i soggetti azzerano i contatori
+
+    for (fp, pid, lab, *_), (res, err, prof) in zip(jobs, iter_subject_results(jobs, n_workers=N_WORKERS)):
+        if prof is not None:
+            profiles.append(prof)
+
+        if err is None and columnar:
+            # colonne fissate dal primo soggetto; i successivi scrivono il vettore direttamente nella loro riga
+            schema, vec = res
+            if feat_cols is None:
+                first_schema, first_vec_size = schema, vec.size
+                feat_cols = vector_columns(schema) + (lesion[1] if lesion is not None else [])
+                X = np.empty((len(jobs), len(feat_cols)), dtype=np.float32)
+                n_edges = schema[0]
+            elif schema != first_schema:
+                err = f"colonne diverse dal primo soggetto ({vec.size} vs {first_vec_size})"
+
+        if err is not None:
             skipped_errors += 1
-            print(f"[WARN] Skip {fp} (id={pid}) per errore: {e}")
+            print(f"[WARN] Skip {fp} (id={pid}) per errore: {err}")
+            continue
 
-    if used == 0:
-        raise RuntimeError("Nessun paziente processato: controlla matching ID tra labels e nomi file delle matrici.")
+        if lesion is not None:
+            no_lesion += pid not in lesion[0]
 
-    df_all = pd.DataFrame(rows).sort_values("id").reset_index(drop=True)
+        if columnar:
+            X[used, :vec.size] = vec
+            if lesion is not None:
+                X[used, vec.size:] = lesion[0].get(pid, np.nan)
+            ids.append(pid)
+            labels.append(lab)
+        else:
+            if lesion is not None:
+                res.update(lesion_load_features(lesion, pid))
+            if not n_edges:
+                n_edges = sum(1 for c in res if c.startswith("edge_"))
+            rows.append(res)
+        used += 1
 
-    # Z-score finale (opzionale)
-    if ZSCORE_FINAL:
-        num_cols = df_all.columns.difference(["id", "label"])
-        df_all[num_cols] = (df_all[num_cols] - df_all[num_cols].mean()) / (df_all[num_cols].std(ddof=0) + 1e-12)
+    if used == 0:
+        raise RuntimeError("Nessun paziente processato: controlla matching ID tra labels e nomi file delle matrici.")
 
+    mem.mark("output")
     Path(os.path.dirname(OUT_CSV) or ".").mkdir(parents=True, exist_ok=True)
-    df_all.to_csv(OUT_CSV, index=False)
+    with timed("write"):
+        if columnar:
+            order = sorted(range(used), key=lambda i: ids[i])
+            X = X[order]
+            ids = [ids[i] for i in order]
+            labels = [labels[i] for i in order]
+
+            # Z-score finale (opzionale)
+            if ZSCORE_FINAL:
+                X = (X - X.mean(axis=0)) / (X.std(axis=0) + 1e-12)
+
+            out_path = write_feature_table(OUT_CSV, X, feat_cols, ids, labels, fmt=OUT_FORMAT)
+            n_cols = X.shape[1] + 2
+        else:
+            df_all = pd.DataFrame(rows).sort_values("id").reset_index(drop=True)
+            del rows
+            if DTYPE != "float64":
+                float_cols = df_all.select_dtypes("float").columns
+                df_all[float_cols] = df_all[float_cols].astype(DTYPE)
+
+            # Z-score finale (opzionale)
+            if ZSCORE_FINAL:
+                num_cols = df_all.columns.difference(["id", "label"])
+                df_all[num_cols] = (df_all[num_cols] - df_all[num_cols].mean()) / (df_all[num_cols].std(ddof=0) + 1e-12)
+
+            df_all.to_csv(OUT_CSV, index=False)
+            out_path, n_cols = OUT_CSV, df_all.shape[1]
+    if PROFILE:
+        main_prof.update(profiling.collect())
+        profiles.append(main_prof)
+    mem.finish()
 
     print(f"[OK] Pazienti processati: {used}")
     print(f"[OK] Saltati senza label: {skipped_no_label}")
     print(f"[OK] Saltati per errori: {skipped_errors}")
-    print(f"[OK] Colonne finali: {df_all.shape[1]}  |  Edge per soggetto: {len(edge_cols)}")
-    print(f"[OK] Salvato: {OUT_CSV}")
-    print("[TIP] Scaling/feature selection falli dentro i fold di CV (anti-leakage).")
+    if lesion is not None:
+        print(f"[OK] Senza maschera lesionale (lesion_load_n* = NaN): {no_lesion}")
+    print(f"[OK] Colonne finali: {n_cols}  |  Edge per soggetto: {n_edges}")
+    print(f"[OK] Salvato: {out_path}")
+    mem.print_summary()
+    if PROFILE:
+        profiling.print_summary(profiles, title=f"Profiling metriche ({used} soggetti)")
+    if ZSCORE_FINAL:
+        print("[WARN] ZSCORE_FINAL usa media/std di tutta la coorte: per la CV rigenera la tabella con ZSCORE_FINAL = False")
+    print(f"[TIP] Scaling/feature selection dentro i fold di CV (anti-leakage): python ../cv_pipeline.py {out_path}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Benchmark delle pipeline di feature su coorti sintetiche.
+
+Pipeline e stadi (ognuno cronometrato separatamente, su tutti i soggetti della coorte):
+- ema      build_graph_feature_tables: load (CSV e store), edge, graph build (bundle), ogni metrica,
+           global_features / nodal_metrics, flatten, subject (process_subject completo),
+           coorte batched, scrittura csv / npy
+- claudia  genera matrici.py: edge_ranks, threshold, grafo networkx, ogni metrica di metr_dens_nodi,
+           metr_dens_nodi completo, versione tensore, sweep incrementale, scrittura csv
+- pyg      torch_features: feature nodali batched in torch (con e senza betweenness; saltato senza torch)
+           pyg_dataset: adj_to_edge_index (tutti gli archi / mst_topk), feature nodali,
+           build_pyg_graph + NodeFeatures (saltato se torch_geometric non è installato)
+
+Per ogni combinazione (N, S) il risultato è il tempo migliore su --repeat ripetizioni.
+Output JSON (meta con commit git, versioni, CPU + lista di risultati), confrontabile con compare.py.
+
+Esempi:
+    python bench_pipelines.py                                   # rapido: N = 96, 200; S = 10
+    python bench_pipelines.py --nodes 96 200 400 1000 --subjects 10 100 1000 --out full.json
+    python bench_pipelines.py --pipelines ema --skip metric.modularity metric.local_efficiency
+
+genera matrici.py esegue tutto all'import (Excel e path Windows fissi): di quello script vengono
+eseguiti solo il prologo (import e configurazione) e le definizioni di funzione.
+
+Dipendenze: numpy, pandas, networkx (+ torch, torch_geometric per pyg)
+"""
+
+import io
+import os
+import sys
+import ast
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+from pathlib import Path
+from contextlib import redirect_stdout
+
+import numpy as np
+import pandas as pd
+import networkx as nx
+
+HERE = Path(__file__).resolve().parent
+ANALISI = HERE.parent
+sys.path.insert(0, str(ANALISI))
+sys.path.insert(0, str(ANALISI / "Ema"))
+sys.path.insert(0, str(HERE))
+
+from synthetic import synthetic_cohort, write_cohort_csv  # noqa: E402
+from connectome_store import ingest, ConnectomeStore  # noqa: E402
+from cohort_tensor import stack_cohort, cohort_metrics  # noqa: E402
+from shortest_paths import (  # noqa: E402
+    length_matrix,
+    characteristic_path_length,
+    global_efficiency,
+)
+from betweenness import weighted_betweenness  # noqa: E402
+from communities import louvain  # noqa: E402
+from matrix_metrics import (  # noqa: E402
+    weighted_clustering,
+    transitivity,
+    eigenvector_centrality,
+    local_efficiency_binary,
+)
+from thresholding import edge_ranks, proportional_threshold  # noqa: E402
+from feature_table import write_feature_table  # noqa: E402
+import build_graph_feature_tables as ema  # noqa: E402
+
+GENERA_MATRICI = ANALISI / "Claudia" / "Machine Learning" / "genera matrici.py"
+PYG_DIR = ANALISI / "Claudia" / "Deep Learning"
+
+QUICK_NODES = (96, 200)
+QUICK_SUBJECTS = (10,)
+DENSITY = 0.25          # densità usata per gli stadi di genera matrici
+
+
+# -------------------------- Utility --------------------------
+def best_time(fn, repeat: int = 1) -> float:
+    best = np.inf
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def git_commit() -> dict:
+    try:
+        sha = subprocess.run(["git", "rev-parse", "HEAD"], cwd=HERE, capture_output=True,
+                             text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=HERE,
+                               capture_output=True, text=True, check=True).stdout.strip() != ""
+        return {"commit": sha, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+
+def load_script_functions(path, stop_marker: str = "read_excel") -> dict:
+    """
+    Namespace con prologo (import + configurazione, fino alla prima istruzione che contiene
+    stop_marker) e tutte le definizioni di funzione di uno script che gira all'import.
+    """
+    src = Path(path).read_text(encoding="utf-8")
+    tree = ast.parse(src)
+
+    prologue, funcs, stopped = [], [], False
+    for node in tree.body:
+        if isinstance(node, ast.FunctionDef):
+            funcs.append(node)
+        elif not stopped and stop_marker in (ast.get_source_segment(src, node) or ""):
+            stopped = True
+        elif not stopped:
+            prologue.append(node)
+
+    ns = {"__file__": str(path), "__name__": Path(path).stem.replace(" ", "_")}
+    exec(compile(ast.Module(body=prologue + funcs, type_ignores=[]), str(path), "exec"), ns)
+    return ns
+
+
+class Bench:
+    def __init__(self, repeat: int = 1, skip=()):
+        self.repeat = repeat
+        self.skip = set(skip)
+        self.results = []
+
+    def run(self, pipeline: str, stage: str, n_nodes: int, n_subjects: int, fn) -> None:
+        if stage in self.skip or f"{pipeline}.{stage}" in self.skip:
+            return
+        sec = best_time(fn, self.repeat)
+        self.results.append({
+            "pipeline": pipeline,
+            "stage": stage,
+            "n_nodes": n_nodes,
+            "n_subjects": n_subjects,
+            "seconds": sec,
+            "per_subject": sec / n_subjects,
+            "repeat": self.repeat,
+        })
+        print(f"  {pipeline:8s} {stage:32s} N={n_nodes:<5d} S={n_subjects:<5d} {sec:10.4f} s")
+
+
+# -------------------------- Pipeline Ema --------------------------
+def bench_ema(bench: Bench, X: np.ndarray, workdir: Path) -> None:
+    S, N, _ = X.shape
+    run = lambda stage, fn: bench.run("ema", stage, N, S, fn)  # noqa: E731
+
+    paths = write_cohort_csv(X, workdir / "csv")
+    store_npy = ingest(str(workdir / "csv"), workdir / "connectomes.npy")
+    store = ConnectomeStore(store_npy)
+    edge_min = ema.EDGE_MIN_FOR_METRICS
+
+    run("load_csv", lambda: [ema.load_connectivity_csv(fp) for fp in paths])
+    run("load_store", lambda: [ema.preprocess_connectivity(store.matrix(fp)) for fp in store.files])
+
+    mats = [ema.load_connectivity_csv(fp) for fp in paths]
+    run("upper_edges", lambda: [ema.upper_triangle_vector(A) for A in mats])
+    run("graph_build", lambda: [ema.build_subject_bundle(A, edge_min=edge_min) for A in mats])
+
+    bundles = [ema.build_subject_bundle(A, edge_min=edge_min) for A in mats]
+    run("metric.charpath_eff", lambda: [(characteristic_path_length(b["D"]), global_efficiency(b["D"]))
+                                        for b in bundles])
+    run("metric.clustering_w", lambda: [weighted_clustering(b["W"], b["B"]) for b in bundles])
+    run("metric.transitivity", lambda: [transitivity(b["B"]) for b in bundles])
+    run("metric.eigenvector", lambda: [eigenvector_centrality(b["W"]) for b in bundles])
+    run("metric.betweenness", lambda: [weighted_betweenness(b["L"]) for b in bundles])
+    run("metric.local_efficiency", lambda: [local_efficiency_binary(b["B"]) for b in bundles])
+
+    run("metric.modularity", lambda: [louvain(b["B"].astype(float), seed=0, n_restarts=ema.COMMUNITY_RESTARTS)
+                                      for b in bundles])
+
+    run("global_features", lambda: [ema.global_features(A, edge_min, bundle=b) for A, b in zip(mats, bundles)])
+    run("nodal_metrics", lambda: [ema.nodal_metrics(A, edge_min, bundle=b) for A, b in zip(mats, bundles)])
+
+    nodes = [ema.nodal_metrics(A, edge_min, bundle=b) for A, b in zip(mats, bundles)]
+    run("flatten", lambda: [ema.flatten_nodal_wide(df) for df in nodes])
+
+    run("cohort_metrics", lambda: cohort_metrics(stack_cohort(mats), edge_min=edge_min))
+
+    rows = []
+
+    def subjects():
+        rows[:] = [ema.process_subject(fp, str(s), s % 2, A=A) for s, (fp, A) in enumerate(zip(paths, mats))]
+    run("subject", subjects)
+    if not rows:
+        subjects()
+
+    run("write_csv", lambda: pd.DataFrame(rows).to_csv(workdir / "final.csv", index=False))
+    cols = [c for c in rows[0] if c not in ("id", "label")]
+    Xf = np.array([[r[c] for c in cols] for r in rows], dtype=np.float32)
+    run("write_npy", lambda: write_feature_table(workdir / "final.npy", Xf, cols,
+                                                 [r["id"] for r in rows], [r["label"] for r in rows]))
+
+
+# -------------------------- Pipeline Claudia (genera matrici) --------------------------
+def bench_claudia(bench: Bench, X: np.ndarray, workdir: Path, ns: dict) -> None:
+    S, N, _ = X.shape
+    run = lambda stage, fn: bench.run("claudia", stage, N, S, fn)  # noqa: E731
+    gruppo = [A.copy() for A in X]
+
+    run("edge_ranks", lambda: [edge_ranks(A) for A in gruppo])
+    ranghi = [edge_ranks(A) for A in gruppo]
+    run("threshold", lambda: [proportional_threshold(A, DENSITY, r) for A, r in zip(gruppo, ranghi)])
+
+    sparse = [proportional_threshold(A, DENSITY, r) for A, r in zip(gruppo, ranghi)]
+
+    def graphs():
+        out = []
+        for M in sparse:
+            G = nx.from_numpy_array(M)
+            for u, v, d in G.edges(data=True):
+                d["inv_weight"] = 1.0 / d["weight"]
+            out.append(G)
+        return out
+    run("graph_build", graphs)
+
+    # stesse chiamate di metr_dens_nodi (networkx, betweenness da betweenness.py)
+    Gs = graphs()
+    run("metric.strength", lambda: [dict(G.degree(weight="weight")) for G in Gs])
+    run("metric.closeness", lambda: [nx.closeness_centrality(G, distance="inv_weight") for G in Gs])
+    run("metric.betweenness", lambda: [weighted_betweenness(length_matrix(M)) for M in sparse])
+    run("metric.betweenness_nx", lambda: [nx.betweenness_centrality(G, weight="inv_weight") for G in Gs])
+    run("metric.eigenvector", lambda: [nx.eigenvector_centrality(G, weight="weight", max_iter=1000, tol=1e-6)
+                                       for G in Gs])
+    run("metric.clustering", lambda: [nx.clustering(G, weight="weight") for G in Gs])
+    run("metric.avg_path_len", lambda: [dict(nx.all_pairs_dijkstra_path_length(G, weight="inv_weight"))
+                                        for G in Gs])
+
+    quiet = io.StringIO()
+    table = []
+
+    def full():
+        with redirect_stdout(quiet):
+            table[:] = [ns["metr_dens_nodi"](gruppo, DENSITY, "bench", ranghi)]
+    run("metr_dens_nodi", full)
+    run("metr_dens_nodi_tensore", lambda: ns["metr_dens_nodi_tensore"](gruppo, DENSITY, "bench", ranghi))
+
+    def sweep():
+        with redirect_stdout(quiet):
+            ns["metr_sweep_incrementale"](gruppo, [DENSITY], "bench")
+    run("metr_sweep_incrementale", sweep)
+
+    if table:
+        run("write_csv", lambda: table[0].to_csv(workdir / "matrice_bench.csv", index=False))
+
+
+# -------------------------- Pipeline PyG --------------------------
+def bench_pyg(bench: Bench, X: np.ndarray) -> None:
+    S, N, _ = X.shape
+    run = lambda stage, fn: bench.run("pyg", stage, N, S, fn)  # noqa: E731
+    sys.path.insert(0, str(PYG_DIR))
+    try:
+        import torch
+        import torch_features
+    except ImportError as e:
+        print(f"  pyg      torch_features saltato: {e}")
+    else:
+        A = torch.as_tensor(X)
+        run("torch_features", lambda: torch_features.node_features(A))
+        run("torch_features.no_betweenness", lambda: torch_features.node_features(A, betweenness=False))
+
+    try:
+        import pyg_dataset
+    except ImportError as e:
+        print(f"  pyg      saltato: {e}")
+        return
+
+    run("edge_index.all", lambda: [pyg_dataset.adj_to_edge_index(A) for A in X])
+    run("edge_index.mst_topk", lambda: [pyg_dataset.adj_to_edge_index(A, method="mst_topk", k=5) for A in X])
+    run("node_features", lambda: [pyg_dataset.node_features(A) for A in X])
+
+    pre = pyg_dataset.NodeFeatures()
+    run("build_pyg_graph", lambda: [pre(pyg_dataset.build_pyg_graph(A, s % 2)) for s, A in enumerate(X)])
+
+
+# -------------------------- MAIN --------------------------
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--nodes", type=int, nargs="+", default=list(QUICK_NODES))
+    ap.add_argument("--subjects", type=int, nargs="+", default=list(QUICK_SUBJECTS))
+    ap.add_argument("--pipelines", nargs="+", default=["ema", "claudia", "pyg"], choices=["ema", "claudia", "pyg"])
+    ap.add_argument("--skip", nargs="*", default=[], help="stadi da saltare (es. metric.modularity o ema.subject)")
+    ap.add_argument("--density", type=float, default=1.0, help="densità delle matrici sintetiche")
+    ap.add_argument("--repeat", type=int, default=1)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default="bench_results.json")
+    args = ap.parse_args(argv)
+
+    bench = Bench(repeat=args.repeat, skip=args.skip)
+    ns = load_script_functions(GENERA_MATRICI) if "claudia" in args.pipelines else None
+
+    for n in args.nodes:
+        for s in args.subjects:
+            print(f"[BENCH] N={n} S={s}")
+            X = synthetic_cohort(n, s, density=args.density, seed=args.seed)
+            with tempfile.TemporaryDirectory(prefix="bench_") as tmp:
+                if "ema" in args.pipelines:
+                    bench_ema(bench, X, Path(tmp))
+                if "claudia" in args.pipelines:
+                    bench_claudia(bench, X, Path(tmp), ns)
+                if "pyg" in args.pipelines:
+                    bench_pyg(bench, X)
+
+    out = {
+        "meta": {
+            **git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "networkx": nx.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": bench.results,
+    }
+    Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(out, f, indent=1)
+    print(f"[OK] {len(bench.results)} misure salvate in {Path(args.out).resolve()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Confronta due file di bench_pipelines.py (es. due commit): tempo per stadio e rapporto nuovo/vecchio.
+
+    python compare.py base.json nuovo.json [--min-ratio 1.1]
+
+--min-ratio mostra solo gli stadi più lenti (rapporto >= soglia) o più veloci (<= 1/soglia).
+
+Dipendenze: pandas
+"""
+
+import sys
+import json
+import argparse
+
+import pandas as pd
+
+KEYS = ["pipeline", "stage", "n_nodes", "n_subjects"]
+
+
+def load_results(path) -> tuple:
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return data["meta"], pd.DataFrame(data["results"])
+
+
+def compare(base_json, new_json, min_ratio: float = 1.0) -> pd.DataFrame:
+    _, base = load_results(base_json)
+    _, new = load_results(new_json)
+    df = base[KEYS + ["seconds"]].merge(new[KEYS + ["seconds"]], on=KEYS, suffixes=("_base", "_new"))
+    df["ratio"] = df["seconds_new"] / df["seconds_base"]
+    if min_ratio > 1.0:
+        df = df[(df["ratio"] >= min_ratio) | (df["ratio"] <= 1.0 / min_ratio)]
+    return df.sort_values(KEYS).reset_index(drop=True)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Confronto tra due run di bench_pipelines.py")
+    ap.add_argument("base")
+    ap.add_argument("new")
+    ap.add_argument("--min-ratio", type=float, default=1.0)
+    args = ap.parse_args(argv)
+
+    meta_b, _ = load_results(args.base)
+    meta_n, _ = load_results(args.new)
+    print(f"base: {meta_b.get('commit')}  ({meta_b.get('timestamp')})")
+    print(f"new:  {meta_n.get('commit')}  ({meta_n.get('timestamp')})")
+
+    df = compare(args.base, args.new, min_ratio=args.min_ratio)
+    if df.empty:
+        print("Nessuno stadio in comune (o nessuna differenza sopra soglia).")
+        return 0
+    with pd.option_context("display.max_rows", None, "display.width", 160):
+        print(df.to_string(index=False, float_format=lambda x: f"{x:.4f}"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
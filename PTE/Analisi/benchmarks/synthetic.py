@@ -0,0 +1,42 @@
+"""
+Coorti sintetiche di connettomi per i benchmark.
+
+Matrici simmetriche, diagonale nulla, pesi >= 0 log-normali (come le connettività reali,
+pochi archi forti e molti deboli). density < 1 azzera una frazione casuale degli archi.
+
+Dipendenze: numpy
+"""
+
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+def synthetic_cohort(n_nodes: int, n_subjects: int, density: float = 1.0, seed: int = 0,
+                     dtype=float) -> np.ndarray:
+    """Stack (S, N, N) di matrici simmetriche con diagonale nulla."""
+    rng = np.random.default_rng(seed)
+    iu, ju = np.triu_indices(n_nodes, 1)
+
+    X = np.zeros((n_subjects, n_nodes, n_nodes), dtype=dtype)
+    for s in range(n_subjects):
+        w = rng.lognormal(mean=-1.0, sigma=1.0, size=iu.size)
+        if density < 1.0:
+            w[rng.random(iu.size) >= density] = 0.0
+        X[s, iu, ju] = w
+        X[s, ju, iu] = w
+    return X
+
+
+def write_cohort_csv(X: np.ndarray, out_dir) -> list:
+    """Un CSV per soggetto (sub-0001.csv, ...) come in PTE/data/patients_connectome; restituisce i path."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for s, A in enumerate(X, start=1):
+        fp = os.path.join(out_dir, f"sub-{s:04d}.csv")
+        np.savetxt(fp, A, delimiter=",", fmt="%.15g")
+        paths.append(fp)
+    return paths
+
@@ -0,0 +1,91 @@
+"""
+Modalità "coorte": tutte le matrici impilate in un tensore (S, N, N) e metriche
+calcolate in un solo passaggio con chiamate batched (einsum / linalg / Floyd–Warshall),
+invece di un loop Python per soggetto.
+
+Metriche batched: degree, strength, densità, clustering pesato, transitività,
+eigenvector, distanze (L, D), path length caratteristico, efficienza globale.
+La betweenness sullo stack delle lunghezze L è in betweenness.cohort_betweenness.
+Restano per soggetto (non vettorizzabili in modo utile): local efficiency, modularità.
+
+Precisione: uno stack float32 tiene in float32 pesi e metriche sui pesi (metà memoria);
+L e D restano float64, perché la betweenness confronta somme di lunghezze.
+
+Dipendenze: numpy
+"""
+
+import numpy as np
+
+from matrix_metrics import (
+    as_float_array,
+    adjacency,
+    degree,
+    strength,
+    binary_density,
+    weighted_clustering,
+    transitivity,
+    eigenvector_centrality,
+)
+from shortest_paths import (
+    length_matrix,
+    floyd_warshall,
+    characteristic_path_length,
+    global_efficiency,
+)
+
+
+def stack_cohort(mats, dtype=float) -> np.ndarray:
+    """Impila una lista di matrici N x N in un array (S, N, N); tutte devono avere la stessa N."""
+    mats = [np.asarray(m, dtype=dtype) for m in mats]
+    shapes = {m.shape for m in mats}
+    if len(shapes) != 1:
+        raise ValueError(f"Matrici con shape diverse, impossibile impilarle: {sorted(shapes)}")
+    return np.stack(mats, axis=0)
+
+
+def cohort_metrics(X: np.ndarray, edge_min: float = 0.0) -> dict:
+    """
+    Metriche batched su uno stack (S, N, N). Restituisce un dict di array:
+    - nodali (S, N): degree_bin, strength, clustering_w, eigenvector_w
+    - globali (S,): gf_binary_density, gf_total_strength, gf_mean_strength, gf_charpath_len_w,
+      gf_global_eff_w, gf_transitivity_bin, gf_avg_weighted_clust, connected
+    - W, B, L, D (S, N, N) per le metriche che restano per soggetto
+
+    eigenvector_w è l'autovettore principale anche per grafi sconnessi:
+    chi vuole la convenzione di networkx (zeri) usa la maschera "connected".
+    """
+    X = as_float_array(X)
+    if X.ndim != 3 or X.shape[1] != X.shape[2]:
+        raise ValueError(f"Atteso uno stack (S, N, N), trovato shape={X.shape}")
+
+    W, B = adjacency(X, edge_min=edge_min)
+    L = length_matrix(X, edge_min=edge_min)
+    D = floyd_warshall(L)
+
+    s = strength(W)
+    clust = weighted_clustering(W, B)
+    has_edges = B.any(axis=(-2, -1))
+
+    return {
+        "degree_bin": degree(B),
+        "strength": s,
+        "clustering_w": clust,
+        "eigenvector_w": eigenvector_centrality(W),
+        "gf_binary_density": binary_density(B),
+        "gf_total_strength": W.sum(axis=(-2, -1)) / 2.0,
+        "gf_mean_strength": s.mean(axis=-1),
+        "gf_charpath_len_w": characteristic_path_length(D),
+        "gf_global_eff_w": global_efficiency(D),
+        "gf_transitivity_bin": transitivity(B),
+        "gf_avg_weighted_clust": np.where(has_edges, clust.mean(axis=-1), np.nan),
+        "connected": np.isfinite(D).all(axis=(-2, -1)),
+        "W": W,
+        "B": B,
+        "L": L,
+        "D": D,
+    }
+
+
+def subject_slice(cohort: dict, s: int) -> dict:
+    """Valori del soggetto s estratti dal dict di cohort_metrics."""
+    return {k: v[s] for k, v in cohort.items()}
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Store binario delle connettività: UN file .npy (S, N, N) + indice degli ID.
+
+Ingest (una volta):
+    python connectome_store.py ../data/patients_connectome connectomes.npy
+crea
+    connectomes.npy        array (S, N, N) con le matrici grezze (solo coercizione numerica, NaN -> 0)
+    connectomes_ids.csv    index, id, file   (id = nome file senza estensione)
+
+Lettura: np.load(..., mmap_mode="r"), quindi ogni matrice è una fetta zero-copy del file
+invece di un pd.read_csv per soggetto. Simmetrizzazione, diagonale, clipping restano ai loader.
+
+Dipendenze: numpy, pandas
+"""
+
+import os
+import sys
+import glob
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+# ============================
+# CONFIG (MODIFICA QUI)
+# ============================
+SRC_DIR = "../data/patients_connectome"
+OUT_NPY = "connectomes.npy"
+DTYPE = "float64"
+# ============================
+
+
+def index_path(npy_path) -> Path:
+    p = Path(npy_path)
+    return p.with_name(p.stem + "_ids.csv")
+
+
+def parse_connectivity_csv(fp: str) -> np.ndarray:
+    """Parsing del CSV testuale: coercizione numerica, NaN/inf -> 0. Nessun altro preprocessing."""
+    raw = pd.read_csv(fp, header=None)
+    A = raw.apply(pd.to_numeric, errors="coerce").values.astype(float)
+    return np.nan_to_num(A, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def ingest(src_dir: str, out_npy: str, dtype: str = DTYPE) -> Path:
+    """Converte tutti i *.csv di src_dir in un unico .npy (S, N, N) + indice degli ID."""
+    files = sorted(glob.glob(os.path.join(src_dir, "*.csv")))
+    if not files:
+        raise FileNotFoundError(f"Nessun CSV trovato in {src_dir}")
+
+    first = parse_connectivity_csv(files[0])
+    if first.ndim != 2 or first.shape[0] != first.shape[1]:
+        raise ValueError(f"Matrice non quadrata in {files[0]}: shape={first.shape}")
+    n = first.shape[0]
+
+    out_npy = Path(out_npy)
+    out_npy.parent.mkdir(parents=True, exist_ok=True)
+    X = np.lib.format.open_memmap(out_npy, mode="w+", dtype=dtype, shape=(len(files), n, n))
+
+    for s, fp in enumerate(files):
+        A = first if s == 0 else parse_connectivity_csv(fp)
+        if A.shape != (n, n):
+            raise ValueError(f"Shape {A.shape} in {fp} diversa da ({n}, {n}): lo store richiede la stessa N")
+        X[s] = A
+    X.flush()
+    del X
+
+    names = [os.path.basename(fp) for fp in files]
+    pd.DataFrame({
+        "index": np.arange(len(files)),
+        "id": [os.path.splitext(f)[0] for f in names],
+        "file": names,
+    }).to_csv(index_path(out_npy), index=False)
+
+    return out_npy
+
+
+class ConnectomeStore:
+    """Accesso in sola lettura (memory-mapped) a uno store creato con ingest()."""
+
+    def __init__(self, npy_path):
+        self.path = Path(npy_path)
+        self.array = np.load(self.path, mmap_mode="r")
+        self.index = pd.read_csv(index_path(self.path), dtype={"id": str, "file": str})
+        if len(self.index) != self.array.shape[0]:
+            raise ValueError(f"Indice e array non allineati: {len(self.index)} ID vs {self.array.shape[0]} matrici")
+
+        self._by_id = dict(zip(self.index["id"], self.index["index"]))
+        self._by_file = dict(zip(self.index["file"], self.index["index"]))
+
+    def __len__(self) -> int:
+        return self.array.shape[0]
+
+    @property
+    def ids(self) -> list:
+        return self.index["id"].tolist()
+
+    @property
+    def files(self) -> list:
+        return self.index["file"].tolist()
+
+    def matrix(self, id_or_file: str) -> np.ndarray:
+        """Fetta zero-copy (read-only) per ID o nome file; KeyError se assente."""
+        key = os.path.basename(str(id_or_file))
+        s = self._by_file.get(key, self._by_id.get(key))
+        if s is None:
+            raise KeyError(f"{id_or_file} non presente nello store {self.path}")
+        return self.array[s]
+
+    def __contains__(self, id_or_file) -> bool:
+        key = os.path.basename(str(id_or_file))
+        return key in self._by_file or key in self._by_id
+
+
+if __name__ == "__main__":
+    src = sys.argv[1] if len(sys.argv) > 1 else SRC_DIR
+    out = sys.argv[2] if len(sys.argv) > 2 else OUT_NPY
+    out = ingest(src, out)
+    store = ConnectomeStore(out)
+    print(f"[OK] {len(store)} matrici {store.array.shape[1:]} -> {out.resolve()}")
+    print(f"[OK] Indice: {index_path(out).resolve()}")
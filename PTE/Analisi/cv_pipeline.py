@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Cross-validation senza leakage sulla tabella wide (PTE vs noPTE, colonna label).
+
+Tutto ciò che impara dai dati sta dentro i fold, stimato solo sui soggetti di training:
+- filtro di varianza (VarianceThreshold: varianza di training > VAR_THRESHOLD)
+- selezione univariata (ANOVA F come f_classif, si tengono le K_BEST colonne migliori)
+- z-score (media/std ddof=0 di training, come StandardScaler; std nulla -> 1)
+- modello lineare (regressione logistica L2 o SVM lineare, class_weight="balanced")
+
+Lavoro fatto una volta sola:
+- matrice delle feature: la tabella (csv / npy / parquet) si converte una volta in .npy float32
+  dentro CACHE_DIR, con chiave = contenuto del file (per un .npy anche del sidecar con id e label)
+  + gruppi di colonne; le run successive (altre ripetizioni, altri K_BEST o modelli) la leggono
+  memory-mapped senza ricalcolare nulla
+- statistiche di tutti i fold di tutte le ripetizioni in blocco: con la matrice (K, S) degli
+  indicatori di training, medie, varianze e F escono da pochi prodotti (K, S) @ (S, F)
+- i worker ricevono il path della matrice e gli indici del fold, non la matrice
+
+Colonne con valori mancanti: escluse in partenza (scelta che non usa le label).
+ZSCORE_FINAL in build_graph_feature_tables.py usa media/std di tutta la coorte: per la CV
+lasciarlo False e usare questo script.
+
+Uso:
+    python cv_pipeline.py [FEATURES_PATH] [OUT_CSV]
+
+Output: OUT_CSV (una riga per fold: AUC, balanced accuracy, n. feature) e riepilogo a schermo
+(AUC out-of-fold per ripetizione, media ± std).
+
+Dipendenze: numpy, pandas, scikit-learn
+"""
+
+import os
+import sys
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import RepeatedStratifiedKFold
+from sklearn.linear_model import LogisticRegression
+from sklearn.svm import LinearSVC
+from sklearn.metrics import roc_auc_score, balanced_accuracy_score
+
+from feature_cache import FeatureCache, file_digest
+from feature_table import load_feature_matrix, write_npy, sidecar_path
+from group_stats import group_indicator
+
+
+# ============================
+# CONFIG (MODIFICA QUI)
+# ============================
+FEATURES_PATH = "Ema/final.csv"     # tabella wide (csv / npy / parquet) di build_graph_feature_tables.py
+OUT_CSV = "cv_results.csv"
+GROUPS = ("edge", "gf", "nodal")    # gruppi di colonne usati come feature (vedi feature_table.column_group)
+CACHE_DIR = "./cv_cache"            # matrice .npy delle feature riusata tra le run (None = niente cache)
+N_SPLITS = 5
+N_REPEATS = 10
+SEED = 0
+VAR_THRESHOLD = 0.0                 # varianza minima di training (0 = scarta solo le colonne costanti)
+K_BEST = 500                        # feature tenute per fold dopo l'ANOVA F (None = tutte)
+MODEL = "logreg"                    # "logreg" | "linear_svm"
+C = 1.0                             # regolarizzazione (inversa) del modello
+N_WORKERS = 1                       # >1: fold in parallelo su un process pool; None = tutte le CPU
+# ============================
+
+
+# -------------------------- Matrice delle feature --------------------------
+def cached_matrix(features_path, groups=GROUPS, cache_dir=CACHE_DIR) -> Path:
+    """
+    .npy (S, F) float32 con le sole colonne dei gruppi richiesti, creato una volta e poi riusato.
+    Senza cache_dir: il file stesso se è già un .npy completo, altrimenti <stem>_cv.npy accanto alla tabella
+    (riscritto a ogni run).
+    """
+    path = Path(features_path)
+    if cache_dir is None:
+        if path.suffix == ".npy" and groups is None:
+            return path
+        out = path.with_name(path.stem + "_cv.npy")
+    else:
+        groups_key = sorted(groups) if groups is not None else None
+        # .npy: colonne, id e label stanno nel sidecar _columns.json, che entra nella chiave
+        sidecar = file_digest(sidecar_path(path)) if path.suffix == ".npy" else None
+        key = FeatureCache.key(path, kind="cv_matrix", groups=groups_key, sidecar=sidecar)
+        out = Path(cache_dir) / f"{key}.npy"
+        if out.exists() and sidecar_path(out).exists():
+            return out
+
+    X, columns, ids, labels = load_feature_matrix(path, groups=groups)
+    return write_npy(out, X, columns, ids, labels)
+
+
+# -------------------------- Statistiche per fold (in blocco) --------------------------
+def fold_statistics(X: np.ndarray, y: np.ndarray, train: np.ndarray) -> dict:
+    """
+    X (S, F), y (S,) in {0, 1}, train (K, S) indicatori di training dei K fold.
+    -> mean, var (ddof=0) e F (ANOVA a una via, come f_classif) di training per fold: (K, F).
+    """
+    X = np.asarray(X, dtype=float)
+    offset = X.mean(axis=0)         # centratura globale: solo per la precisione numerica, le statistiche non cambiano
+    Xc = X - offset
+    Xc2 = Xc * Xc
+
+    T = np.asarray(train, dtype=float)
+    T1 = T * y[None, :]
+    n = T.sum(axis=1, keepdims=True)
+    n1 = T1.sum(axis=1, keepdims=True)
+    n0 = n - n1
+
+    s = T @ Xc
+    s1 = T1 @ Xc
+    s0 = s - s1
+    q = T @ Xc2
+    q1 = T1 @ Xc2
+    q0 = q - q1
+
+    mean = s / n
+    var = np.maximum(q / n - mean * mean, 0.0)
+    m1, m0 = s1 / n1, s0 / n0
+    ss_between = n1 * (m1 - mean) ** 2 + n0 * (m0 - mean) ** 2
+    ss_within = np.maximum((q1 - s1 * m1) + (q0 - s0 * m0), 0.0)
+    F = np.divide(ss_between * (n - 2), ss_within, out=np.zeros_like(ss_between), where=ss_within > 1e-30)
+    return {"mean": mean + offset, "var": var, "F": F}
+
+
+def select_features(var: np.ndarray, F: np.ndarray, var_threshold: float = VAR_THRESHOLD,
+                    k_best=K_BEST) -> list:
+    """Per ogni fold: indici (ordinati) delle colonne con varianza > soglia e F tra i k_best più alti."""
+    out = []
+    for v, f in zip(var, F):
+        ok = np.flatnonzero(v > var_threshold)
+        if k_best is not None and ok.size > k_best:
+            ok = np.sort(ok[np.argpartition(-f[ok], k_best - 1)[:k_best]])
+        out.append(ok)
+    return out
+
+
+# -------------------------- Fold --------------------------
+def make_model(model: str = MODEL, c: float = C):
+    if model == "logreg":
+        return LogisticRegression(C=c, class_weight="balanced", solver="liblinear", max_iter=1000)
+    if model == "linear_svm":
+        return LinearSVC(C=c, class_weight="balanced", max_iter=10000)
+    raise ValueError(f"MODEL deve essere 'logreg' o 'linear_svm', trovato {model!r}")
+
+
+def _fold_job(args):
+    """Un fold: z-score con le statistiche di training, fit, punteggi sul test -> (punteggi, predizioni)."""
+    matrix_path, cols, train_idx, test_idx, mean, std, y_train, model, c = args
+    X = np.load(matrix_path, mmap_mode="r")
+    X_train = (np.asarray(X[train_idx][:, cols], dtype=float) - mean) / std
+    X_test = (np.asarray(X[test_idx][:, cols], dtype=float) - mean) / std
+
+    clf = make_model(model, c).fit(X_train, y_train)
+    return clf.decision_function(X_test), clf.predict(X_test)
+
+
+def cross_validate(matrix_path, y: np.ndarray, n_splits: int = N_SPLITS, n_repeats: int = N_REPEATS,
+                   seed: int = SEED, var_threshold: float = VAR_THRESHOLD, k_best=K_BEST,
+                   model: str = MODEL, c: float = C, n_workers=N_WORKERS) -> dict:
+    """
+    CV stratificata ripetuta sulla matrice .npy (S, F) di cached_matrix; y (S,) in {0, 1}.
+    Restituisce la tabella dei fold e i punteggi out-of-fold (n_repeats, S).
+    """
+    X = np.load(matrix_path, mmap_mode="r")
+    keep = np.flatnonzero(np.isfinite(X).all(axis=0))
+    if keep.size < X.shape[1]:
+        print(f"[WARN] Escluse {X.shape[1] - keep.size} colonne con valori mancanti")
+    S = X.shape[0]
+
+    cv = RepeatedStratifiedKFold(n_splits=n_splits, n_repeats=n_repeats, random_state=seed)
+    folds = list(cv.split(np.zeros((S, 1)), y))
+    train = np.zeros((len(folds), S), dtype=bool)
+    for k, (tr, _) in enumerate(folds):
+        train[k, tr] = True
+
+    stats = fold_statistics(X[:, keep], y, train)
+    selected = select_features(stats["var"], stats["F"], var_threshold, k_best)
+
+    jobs = []
+    for k, (tr, te) in enumerate(folds):
+        sel = selected[k]
+        std = np.sqrt(stats["var"][k, sel])
+        std[std == 0] = 1.0
+        jobs.append((str(matrix_path), keep[sel], tr, te, stats["mean"][k, sel], std, y[tr], model, c))
+
+    n_workers = (os.cpu_count() or 1) if n_workers is None else int(n_workers)
+    if n_workers <= 1 or len(jobs) <= 1:
+        results = list(map(_fold_job, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(jobs))) as ex:
+            results = list(ex.map(_fold_job, jobs))
+
+    oof = np.full((n_repeats, S), np.nan)
+    rows = []
+    for k, ((tr, te), (score, pred)) in enumerate(zip(folds, results)):
+        rep = k // n_splits
+        oof[rep, te] = score
+        rows.append({
+            "repeat": rep,
+            "fold": k % n_splits,
+            "n_train": tr.size,
+            "n_test": te.size,
+            "n_features": selected[k].size,
+            "auc": roc_auc_score(y[te], score) if np.unique(y[te]).size == 2 else np.nan,
+            "balanced_accuracy": balanced_accuracy_score(y[te], pred),
+        })
+    return {"folds": pd.DataFrame(rows), "oof": oof}
+
+
+def run(features_path=FEATURES_PATH, out_csv=OUT_CSV) -> Path:
+    matrix_path = cached_matrix(features_path, groups=GROUPS, cache_dir=CACHE_DIR)
+    _, columns, ids, labels = load_feature_matrix(matrix_path)
+    y, (l0, l1) = group_indicator(labels)
+    y = y.astype(int)
+
+    res = cross_validate(matrix_path, y, n_splits=N_SPLITS, n_repeats=N_REPEATS, seed=SEED,
+                         var_threshold=VAR_THRESHOLD, k_best=K_BEST, model=MODEL, c=C, n_workers=N_WORKERS)
+
+    out_csv = Path(out_csv)
+    out_csv.parent.mkdir(parents=True, exist_ok=True)
+    df = res["folds"]
+    df.to_csv(out_csv, index=False)
+
+    auc_rep = np.array([roc_auc_score(y, s) for s in res["oof"]])
+    print(f"[OK] {len(ids)} soggetti ({l1} = positivi), {len(columns)} feature, "
+          f"{N_REPEATS} x {N_SPLITS}-fold, modello {MODEL}")
+    print(f"[OK] Matrice delle feature: {matrix_path}")
+    print(f"[OK] AUC out-of-fold: {auc_rep.mean():.3f} ± {auc_rep.std():.3f} (su {N_REPEATS} ripetizioni)")
+    print(f"[OK] Balanced accuracy per fold: {df['balanced_accuracy'].mean():.3f} ± {df['balanced_accuracy'].std():.3f}")
+    print(f"[OK] Salvato: {out_csv}")
+    return out_csv
+
+
+if __name__ == "__main__":
+    features_path = sys.argv[1] if len(sys.argv) > 1 else FEATURES_PATH
+    out = sys.argv[2] if len(sys.argv) > 2 else OUT_CSV
+    run(features_path, out)
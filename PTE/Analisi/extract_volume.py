@@ -6,12 +6,24 @@ Mask labels:
 0 = background
 1 = lesion
 2 = edema
+
+Streaming mode (EXTENDED_STATS = False, default): the mask is read through the nibabel array proxy in its
+on-disk integer dtype, slab by slab along the last axis, and lesion/edema voxels
+are counted in the same pass. No float64 copy of the whole volume is created.
+
+Extended stats (EXTENDED_STATS = True): each mask is decompressed once, in its native
+dtype, and one pass computes per-label voxel counts and volumes (mm^3 from the header
+zooms), plus the lesion bounding box, centroid (voxel and world mm) and number of
+connected components. Masks are distributed over N_WORKERS processes.
 """
 
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+import os
 import csv
 import numpy as np
 import nibabel as nib
+from scipy import ndimage
 
 # =========================
 # HARD-CODED PARAMETERS
@@ -19,6 +31,12 @@ import nibabel as nib
 INPUT_DIR = Path("lesion_masks")
 OUTPUT_CSV = Path("lesion_voxels.csv")
 LESION_LABEL = 1
+EDEMA_LABEL = 2
+STREAMING = True        # False: legacy get_fdata() path (float64 copy of the whole volume)
+SLAB_SIZE = 16          # slices per chunk along the last axis in streaming mode
+EXTENDED_STATS = False  # True: volumes (mm^3), lesion bbox, centroid, connected components
+CONNECTIVITY = 3        # 1 = faces (6-conn), 2 = edges (18-conn), 3 = corners (26-conn)
+N_WORKERS = 1           # masks processed in parallel (e.g. = request_cpus of the .sub); None = all CPUs
 
 
 # =========================
@@ -43,6 +61,124 @@ def count_lesion_voxels(seg: np.ndarray) -> int:
     return int(np.count_nonzero(seg == LESION_LABEL))
 
 
+def iter_mask_slabs(img, slab_size: int = SLAB_SIZE):
+    """
+    Yield integer slabs of the mask along the last axis, read through the array proxy.
+    Integer masks keep their native dtype; float or scaled masks are rounded slab by slab.
+    """
+    proxy = img.dataobj
+    n_last = img.shape[-1]
+
+    for z0 in range(0, n_last, slab_size):
+        slab = np.asarray(proxy[..., z0:z0 + slab_size])
+        if not np.issubdtype(slab.dtype, np.integer):
+            slab = np.rint(slab).astype(np.int16)
+        yield slab
+
+
+def count_labels_streaming(img, labels, slab_size: int = SLAB_SIZE) -> dict:
+    """Voxel count for each label in a single streaming pass over the mask."""
+    counts = {lab: 0 for lab in labels}
+    for slab in iter_mask_slabs(img, slab_size=slab_size):
+        for lab in labels:
+            counts[lab] += int(np.count_nonzero(slab == lab))
+    return counts
+
+
+def fmt_tuple(values, ndigits=None) -> str:
+    if values is None:
+        return ""
+    if ndigits is not None:
+        values = [round(float(v), ndigits) for v in values]
+    return str(tuple(values))
+
+
+def mask_stats(seg: np.ndarray, zooms, affine) -> dict:
+    """Per-label counts/volumes and lesion geometry from an integer mask already in memory."""
+    voxel_mm3 = float(np.prod(zooms[:3]))
+    lesion = seg == LESION_LABEL
+    lesion_voxels = int(np.count_nonzero(lesion))
+    edema_voxels = int(np.count_nonzero(seg == EDEMA_LABEL))
+
+    stats = {
+        "lesion_voxels": lesion_voxels,
+        "edema_voxels": edema_voxels,
+        "voxel_volume_mm3": voxel_mm3,
+        "lesion_volume_mm3": lesion_voxels * voxel_mm3,
+        "edema_volume_mm3": edema_voxels * voxel_mm3,
+        "lesion_bbox_min": "",
+        "lesion_bbox_max": "",
+        "lesion_centroid_vox": "",
+        "lesion_centroid_mm": "",
+        "lesion_n_components": 0,
+    }
+    if lesion_voxels == 0:
+        return stats
+
+    coords = np.nonzero(lesion)
+    centroid = np.array([c.mean() for c in coords])
+    structure = ndimage.generate_binary_structure(lesion.ndim, CONNECTIVITY)
+    _, n_components = ndimage.label(lesion, structure=structure)
+
+    stats.update({
+        "lesion_bbox_min": fmt_tuple(int(c.min()) for c in coords),
+        "lesion_bbox_max": fmt_tuple(int(c.max()) for c in coords),
+        "lesion_centroid_vox": fmt_tuple(centroid, ndigits=2),
+        "lesion_centroid_mm": fmt_tuple(nib.affines.apply_affine(affine, centroid[:3]), ndigits=2),
+        "lesion_n_components": int(n_components),
+    })
+    return stats
+
+
+def process_mask(nifti_path: Path) -> dict:
+    """One output row for one mask (streaming counts, or extended stats)."""
+    if EXTENDED_STATS:
+        # decompressed once, native integer dtype (no float64 copy)
+        img = nib.load(str(nifti_path))
+        seg = np.asarray(img.dataobj)
+        if not np.issubdtype(seg.dtype, np.integer):
+            seg = np.rint(seg).astype(np.int16)
+        image_shape = seg.shape
+        stats = mask_stats(seg, img.header.get_zooms(), img.affine)
+    elif STREAMING:
+        # keep_file_open: slabs are read sequentially from one open (gzip) stream
+        img = nib.load(str(nifti_path), keep_file_open=True)
+        image_shape = img.shape
+        counts = count_labels_streaming(img, (LESION_LABEL, EDEMA_LABEL))
+        stats = {"lesion_voxels": counts[LESION_LABEL], "edema_voxels": counts[EDEMA_LABEL]}
+    else:
+        img = nib.load(str(nifti_path))
+        seg = img.get_fdata()
+        seg = np.rint(seg).astype(np.int16)
+
+        image_shape = seg.shape
+        stats = {
+            "lesion_voxels": count_lesion_voxels(seg),
+            "edema_voxels": int(np.count_nonzero(seg == EDEMA_LABEL)),
+        }
+
+    row = {
+        "patient_id": extract_patient_id(nifti_path),
+        "file_path": str(nifti_path),
+        "image_shape": str(tuple(image_shape)),
+    }
+    row.update(stats)
+    return row
+
+
+def iter_mask_rows(paths, n_workers=1):
+    """Rows in the same order as paths, serially or over a process pool."""
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+
+    if n_workers <= 1 or len(paths) <= 1:
+        yield from map(process_mask, paths)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(n_workers, len(paths))) as ex:
+        yield from ex.map(process_mask, paths)
+
+
 # =========================
 # MAIN
 # =========================
@@ -51,46 +187,39 @@ def main():
     if not INPUT_DIR.exists():
         raise FileNotFoundError(f"Input directory not found: {INPUT_DIR}")
 
+    paths = list(iter_nifti_files(INPUT_DIR))
     results = []
 
-    for nifti_path in iter_nifti_files(INPUT_DIR):
-
-        print(f"Processing: {nifti_path.name}")
-
-        img = nib.load(str(nifti_path))
-        seg = img.get_fdata()
-        seg = np.rint(seg).astype(np.int16)
-
-        image_shape = seg.shape
-        lesion_voxels = count_lesion_voxels(seg)
-
-        patient_id = extract_patient_id(nifti_path)
-
-        results.append((
-            patient_id,
-            str(nifti_path),
-            image_shape,
-            lesion_voxels
-        ))
+    for nifti_path, row in zip(paths, iter_mask_rows(paths, n_workers=N_WORKERS)):
+        print(f"Processed: {nifti_path.name}")
+        results.append(row)
 
     # =========================
     # SAVE CSV
     # =========================
+    fieldnames = [
+        "patient_id",
+        "file_path",
+        "image_shape",
+        "lesion_voxels",
+        "edema_voxels"
+    ]
+    if EXTENDED_STATS:
+        fieldnames += [
+            "voxel_volume_mm3",
+            "lesion_volume_mm3",
+            "edema_volume_mm3",
+            "lesion_bbox_min",
+            "lesion_bbox_max",
+            "lesion_centroid_vox",
+            "lesion_centroid_mm",
+            "lesion_n_components"
+        ]
+
     with open(OUTPUT_CSV, "w", newline="", encoding="utf-8") as f:
-        writer = csv.writer(f)
-        writer.writerow([
-            "patient_id",
-            "file_path",
-            "image_shape",
-            "lesion_voxels"
-        ])
-        for pid, path, shape, vox in results:
-            writer.writerow([
-                pid,
-                path,
-                str(shape),
-                vox
-            ])
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(results)
 
     print(f"\nDONE ✓")
     print(f"Processed {len(results)} volumes")
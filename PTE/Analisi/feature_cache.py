@@ -0,0 +1,129 @@
+"""
+Cache su disco delle feature per soggetto, indirizzata per contenuto.
+
+chiave = sha256(contenuto del file matrice (o bytes dell'array) + parametri rilevanti, es.
+EDGE_MIN_FOR_METRICS, ZERO_DIAG, CLIP_NEGATIVES, densità, versione delle feature)
+
+- un file .npz compresso per chiave (dict di array numpy)
+- scrittura atomica (file temporaneo + os.replace): sicura anche con più worker
+- eviction LRU quando la cartella supera max_bytes (l'mtime viene aggiornato a ogni hit)
+- dimensione tenuta come totale corrente: la cartella si scandisce solo alla prima put, quando il
+  totale supera max_bytes e ogni rescan_every put (per contare anche le scritture degli altri worker)
+
+Rinominare un file o cambiare le label non invalida nulla; cambiare la matrice o un parametro sì.
+
+Dipendenze: numpy
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+
+def file_digest(path, chunk_size: int = 1 << 20) -> str:
+    """sha256 del contenuto di un file."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class FeatureCache:
+    def __init__(self, cache_dir, max_bytes: int = 2 * 1024 ** 3, rescan_every: int = 256):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(max_bytes)
+        self.rescan_every = max(int(rescan_every), 1)
+        self._total = None      # byte stimati nella cartella (None = da scandire)
+        self._puts = 0
+
+    # ---------------- chiavi ----------------
+    @staticmethod
+    def key(source, **params) -> str:
+        """
+        source: path di un file (si usa il suo contenuto), bytes o np.ndarray.
+        params: parametri che cambiano le feature (serializzati in JSON ordinato).
+        """
+        h = hashlib.sha256()
+        if isinstance(source, np.ndarray):
+            arr = np.ascontiguousarray(source)
+            h.update(f"{arr.dtype.str}{arr.shape}".encode())
+            h.update(arr.tobytes())
+        elif isinstance(source, (bytes, bytearray)):
+            h.update(source)
+        else:
+            h.update(file_digest(source).encode())
+        h.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return h.hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.npz"
+
+    # ---------------- lettura / scrittura ----------------
+    def __contains__(self, key: str) -> bool:
+        return self._path(key).exists()
+
+    def get(self, key: str):
+        """dict di array oppure None (miss, o file rimosso/corrotto nel frattempo)."""
+        p = self._path(key)
+        try:
+            with np.load(p, allow_pickle=False) as z:
+                out = {k: z[k] for k in z.files}
+            os.utime(p)  # LRU
+            return out
+        except (OSError, ValueError, EOFError):
+            return None
+
+    def put(self, key: str, arrays: dict) -> None:
+        path = self._path(key)
+        fd, tmp = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez_compressed(f, **{k: np.asarray(v) for k, v in arrays.items()})
+            added = os.path.getsize(tmp)
+            try:
+                added -= path.stat().st_size    # sovrascrittura della stessa chiave
+            except OSError:
+                pass
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+        self._puts += 1
+        if self._total is None or self._puts % self.rescan_every == 0:
+            self._total = self.size_bytes()
+        else:
+            self._total += added
+        if self._total > self.max_bytes:
+            self.evict()
+
+    # ---------------- eviction ----------------
+    def size_bytes(self) -> int:
+        return sum(p.stat().st_size for p in self.cache_dir.glob("*.npz"))
+
+    def evict(self) -> None:
+        """Rimuove i file usati meno di recente finché la cache non rientra in max_bytes (scansione completa)."""
+        entries = []
+        for p in self.cache_dir.glob("*.npz"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, p in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                p.unlink()
+            except OSError:
+                pass
+            total -= size
+        self._total = total
@@ -0,0 +1,127 @@
+"""
+Tabella wide delle feature in formato colonnare/tipizzato.
+
+Formati:
+- "npy":     <stem>.npy (S, F) float32 + <stem>_columns.json {columns, ids, labels}
+             lettura memory-mapped, selezione di colonne senza caricare il resto
+- "parquet": <stem>.parquet con id, label + F colonne float32 (richiede pyarrow)
+- "csv":     il classico final.csv (solo lettura qui, lo scrive direttamente run())
+
+Gruppi di colonne: "edge" (edge_*), "gf" (gf_*), "nodal" (*_nXXX).
+I downstream (CV, statistica) caricano solo i gruppi che servono con load_feature_table.
+
+Dipendenze: numpy, pandas (+ pyarrow per parquet)
+"""
+
+import re
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+META_COLS = ("id", "label")
+GROUPS = ("edge", "gf", "nodal")
+_NODAL_RE = re.compile(r"_n\d+$")
+
+
+def column_group(col: str):
+    """'edge' | 'gf' | 'nodal' | None (id/label o altro)."""
+    if col.startswith("edge_"):
+        return "edge"
+    if col.startswith("gf_"):
+        return "gf"
+    if _NODAL_RE.search(col):
+        return "nodal"
+    return None
+
+
+def select_columns(columns, groups=None) -> list:
+    """Colonne di feature appartenenti ai gruppi richiesti (tutte se groups è None)."""
+    if isinstance(groups, str):
+        groups = (groups,)
+    return [c for c in columns if c not in META_COLS and (groups is None or column_group(c) in groups)]
+
+
+def sidecar_path(npy_path) -> Path:
+    p = Path(npy_path)
+    return p.with_name(p.stem + "_columns.json")
+
+
+# -------------------------- Scrittura --------------------------
+def write_npy(path, X: np.ndarray, columns, ids, labels) -> Path:
+    path = Path(path).with_suffix(".npy")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.save(path, np.ascontiguousarray(X, dtype=np.float32))
+    with open(sidecar_path(path), "w", encoding="utf-8") as f:
+        json.dump({"columns": list(columns), "ids": [str(i) for i in ids],
+                   "labels": [str(lab) for lab in labels]}, f)
+    return path
+
+
+def write_parquet(path, X: np.ndarray, columns, ids, labels) -> Path:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("OUT_FORMAT='parquet' richiede pyarrow (pip install pyarrow)") from e
+
+    path = Path(path).with_suffix(".parquet")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    X = np.asarray(X, dtype=np.float32)
+    arrays = [pa.array([str(i) for i in ids]), pa.array([str(lab) for lab in labels])]
+    arrays += [pa.array(X[:, j]) for j in range(X.shape[1])]
+    pq.write_table(pa.Table.from_arrays(arrays, names=list(META_COLS) + list(columns)), path)
+    return path
+
+
+def write_feature_table(path, X: np.ndarray, columns, ids, labels, fmt: str = "npy") -> Path:
+    if fmt == "npy":
+        return write_npy(path, X, columns, ids, labels)
+    if fmt == "parquet":
+        return write_parquet(path, X, columns, ids, labels)
+    raise ValueError(f"Formato colonnare non supportato: {fmt} (usa 'npy' o 'parquet')")
+
+
+# -------------------------- Lettura --------------------------
+def load_feature_matrix(path, groups=None):
+    """
+    Restituisce (X, columns, ids, labels) con X (S, F_sel) float32, solo per i gruppi richiesti.
+    .npy: memory-mapped, si leggono solo le colonne selezionate.
+    """
+    path = Path(path)
+    if path.suffix == ".npy":
+        with open(sidecar_path(path), encoding="utf-8") as f:
+            meta = json.load(f)
+        columns = meta["columns"]
+        sel = select_columns(columns, groups)
+        X = np.load(path, mmap_mode="r")
+        if len(sel) == len(columns):
+            X_sel = np.asarray(X)
+        else:
+            pos = {c: j for j, c in enumerate(columns)}
+            X_sel = X[:, [pos[c] for c in sel]]
+        return X_sel, sel, meta["ids"], meta["labels"]
+
+    if path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+        schema_cols = pq.read_schema(path).names
+        sel = select_columns(schema_cols, groups)
+        df = pq.read_table(path, columns=list(META_COLS) + sel).to_pandas()
+    else:
+        header = pd.read_csv(path, nrows=0).columns
+        sel = select_columns(header, groups)
+        df = pd.read_csv(path, usecols=list(META_COLS) + sel, dtype={"id": str, "label": str})
+
+    X = df[sel].to_numpy(dtype=np.float32)
+    return X, sel, df["id"].astype(str).tolist(), df["label"].astype(str).tolist()
+
+
+def load_feature_table(path, groups=None) -> pd.DataFrame:
+    """Come load_feature_matrix, ma come DataFrame con id, label in testa."""
+    X, columns, ids, labels = load_feature_matrix(path, groups=groups)
+    df = pd.DataFrame(X, columns=columns)
+    df.insert(0, "label", labels)
+    df.insert(0, "id", ids)
+    return df
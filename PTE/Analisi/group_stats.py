@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Statistica di gruppo sulla tabella wide (PTE vs noPTE, colonna label): t-test massivamente univariati
+con correzione FWER per permutazione (max-statistic) e network-based statistic (NBS) sugli edge.
+
+- t di Student a due campioni (varianza comune) su ogni colonna: gruppo_1 - gruppo_0,
+  con gruppo_0 / gruppo_1 = le due label in ordine crescente
+- permutazioni in forma matriciale: un blocco di P permutazioni è una matrice (P, S) di
+  indicatori di gruppo, somme e somme dei quadrati per gruppo escono da due prodotti (P, S) @ (S, F)
+- blocchi di permutazioni su un process pool; ogni blocco ha il suo seed (SeedSequence.spawn),
+  quindi il risultato dipende solo da SEED e non dal numero di processi
+- p non corretto: frazione di permutazioni con |t_perm| >= |t| sulla stessa colonna
+  p FWER: frazione di permutazioni con max_colonne |t_perm| >= |t| (Westfall & Young / Nichols & Holmes)
+- NBS (Zalesky et al. 2010): archi con t sopra NBS_THRESHOLD, componenti connesse, estensione = n. di archi;
+  p di ogni componente dalla distribuzione della componente massima sotto permutazione.
+  Un contrasto alla volta: con TAIL="both" la NBS gira separata per gruppo_1 > gruppo_0 (t > soglia)
+  e gruppo_1 < gruppo_0 (t < -soglia), ognuna con la sua distribuzione nulla, così archi con effetti
+  di segno opposto non finiscono nella stessa componente
+
+Le colonne edge_k seguono np.triu_indices(N, 1) come upper_triangle_vector in build_graph_feature_tables.py.
+
+Uso:
+    python group_stats.py [FEATURES_PATH] [OUT_CSV]
+
+Output: OUT_CSV (una riga per feature) e <OUT_CSV>_nbs.csv (una riga per componente NBS e contrasto).
+
+Dipendenze: numpy, pandas, scipy
+"""
+
+import os
+import sys
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from feature_table import load_feature_matrix
+
+
+# ============================
+# CONFIG (MODIFICA QUI)
+# ============================
+FEATURES_PATH = "Ema/final.csv"     # tabella wide (csv / npy / parquet) di build_graph_feature_tables.py
+OUT_CSV = "group_stats.csv"
+GROUPS = ("edge", "gf", "nodal")    # gruppi di colonne da testare (vedi feature_table.column_group)
+N_PERM = 10000
+SEED = 0
+TAIL = "both"                       # "both" (|t|) | "greater" (gruppo_1 > gruppo_0) | "less"
+NBS_THRESHOLD = 3.0                 # soglia sul t degli archi per la NBS, per contrasto (None = niente NBS)
+PERM_BLOCK = 500                    # permutazioni per blocco (memoria ~ PERM_BLOCK x n. colonne x 8 byte x 4)
+N_WORKERS = 1                       # >1: blocchi di permutazioni in parallelo; None = tutte le CPU
+# ============================
+
+
+# -------------------------- t-test batched --------------------------
+def group_indicator(labels):
+    """(indicatore del gruppo_1 (S,) float, (label gruppo_0, label gruppo_1)); errore se le label non sono 2."""
+    labels = np.asarray([str(v) for v in labels])
+    levels = np.unique(labels)
+    if levels.size != 2:
+        raise ValueError(f"Servono esattamente 2 gruppi nella colonna label, trovati {levels.size}: {levels.tolist()}")
+    return (labels == levels[1]).astype(float), (levels[0], levels[1])
+
+
+def batched_t(X: np.ndarray, G: np.ndarray, tot=None, tot2=None) -> np.ndarray:
+    """
+    t di Student (gruppo_1 - gruppo_0) per ogni riga di indicatori G (P, S) e colonna di X (S, F) -> (P, F).
+    Colonne a varianza nulla: t = 0. Somme dei quadrati non centrate: passare X già centrata sulle colonne
+    (t non cambia, la precisione sì quando la dispersione è piccola rispetto alla media).
+    """
+    S = X.shape[0]
+    tot = X.sum(axis=0) if tot is None else tot
+    tot2 = (X * X).sum(axis=0) if tot2 is None else tot2
+
+    n1 = G.sum(axis=1, keepdims=True)
+    n0 = S - n1
+    s1 = G @ X
+    q1 = G @ (X * X)
+    s0 = tot - s1
+    q0 = tot2 - q1
+
+    m1, m0 = s1 / n1, s0 / n0
+    ss = (q1 - s1 * m1) + (q0 - s0 * m0)
+    var = np.maximum(ss, 0.0) / (S - 2) * (1.0 / n1 + 1.0 / n0)
+    diff = m1 - m0
+    return np.divide(diff, np.sqrt(var), out=np.zeros_like(diff), where=var > 1e-30)
+
+
+def _tail(t: np.ndarray, tail: str) -> np.ndarray:
+    if tail == "both":
+        return np.abs(t)
+    if tail == "greater":
+        return t
+    if tail == "less":
+        return -t
+    raise ValueError(f"tail deve essere 'both', 'greater' o 'less', trovato {tail!r}")
+
+
+# -------------------------- NBS --------------------------
+def n_nodes_from_edges(n_edges: int) -> int:
+    n = int(round((1 + np.sqrt(1 + 8 * n_edges)) / 2))
+    if n * (n - 1) // 2 != n_edges:
+        raise ValueError(f"{n_edges} colonne edge_* non sono un triangolo superiore N(N-1)/2")
+    return n
+
+
+def components(supra: np.ndarray, iu: np.ndarray, ju: np.ndarray, n: int):
+    """Componenti degli archi sopra soglia: (etichetta del nodo (N,), n. di archi per componente)."""
+    g = coo_matrix((np.ones(int(supra.sum())), (iu[supra], ju[supra])), shape=(n, n))
+    _, lab = connected_components(g, directed=False)
+    sizes = np.bincount(lab[iu[supra]], minlength=lab.max() + 1)
+    return lab, sizes
+
+
+def _max_component(supra_rows: np.ndarray, iu, ju, n) -> np.ndarray:
+    return np.array([components(s, iu, ju, n)[1].max(initial=0) if s.any() else 0 for s in supra_rows])
+
+
+def nbs_contrasts(tail: str) -> dict:
+    """Contrasti NBS {nome: segno di t}: "greater" (t > soglia), "less" (t < -soglia), entrambi per "both"."""
+    signs = {"greater": 1.0, "less": -1.0}
+    if tail == "both":
+        return signs
+    if tail in signs:
+        return {tail: signs[tail]}
+    raise ValueError(f"tail deve essere 'both', 'greater' o 'less', trovato {tail!r}")
+
+
+# -------------------------- Permutazioni --------------------------
+def _perm_block(args):
+    """
+    Un blocco di permutazioni: (conteggi per colonna, max per permutazione,
+    {contrasto NBS: max componente per permutazione}).
+    """
+    X, g, seed_seq, n_perm, tail, nbs = args
+    rng = np.random.default_rng(seed_seq)
+    G = rng.permuted(np.tile(g, (n_perm, 1)), axis=1)
+
+    T_signed = batched_t(X, G)
+    T = _tail(T_signed, tail)
+    t_obs = _tail(batched_t(X, g[None])[0], tail)
+    exceed = (T >= t_obs - 1e-12).sum(axis=0)
+    max_t = T.max(axis=1)
+
+    max_comp = None
+    if nbs is not None:
+        edge_idx, thr, iu, ju, n = nbs
+        T_edges = T_signed[:, edge_idx]
+        max_comp = {c: _max_component(sign * T_edges > thr, iu, ju, n) for c, sign in nbs_contrasts(tail).items()}
+    return exceed, max_t, max_comp
+
+
+def permutation_test(X: np.ndarray, labels, n_perm: int = N_PERM, seed: int = SEED, tail: str = TAIL,
+                     edge_idx=None, nbs_threshold=None, block: int = PERM_BLOCK, n_workers=N_WORKERS) -> dict:
+    """
+    X (S, F), labels (S,). edge_idx: posizioni in X delle colonne edge_0..edge_{E-1} (in ordine) per la NBS.
+    Restituisce t, p_unc, p_fwer (F,), le distribuzioni nulle e, con la NBS, le componenti osservate
+    per contrasto (res["nbs"] = {"greater": ..., "less": ...}, vedi nbs_contrasts).
+    """
+    X = np.asarray(X, dtype=float)
+    X = X - X.mean(axis=0)      # una volta per tutti i blocchi: stesso t, niente cancellazione numerica
+    g, levels = group_indicator(labels)
+    t = batched_t(X, g[None])[0]
+    t_obs = _tail(t, tail)
+
+    nbs = None
+    if edge_idx is not None and nbs_threshold is not None:
+        edge_idx = np.asarray(edge_idx)
+        n = n_nodes_from_edges(edge_idx.size)
+        iu, ju = np.triu_indices(n, 1)
+        nbs = (edge_idx, float(nbs_threshold), iu, ju, n)
+
+    sizes = [min(block, n_perm - i) for i in range(0, n_perm, block)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    jobs = [(X, g, ss, k, tail, nbs) for ss, k in zip(seeds, sizes)]
+
+    n_workers = (os.cpu_count() or 1) if n_workers is None else int(n_workers)
+    if n_workers <= 1 or len(jobs) <= 1:
+        parts = list(map(_perm_block, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(jobs))) as ex:
+            parts = list(ex.map(_perm_block, jobs))
+
+    exceed = np.sum([p[0] for p in parts], axis=0)
+    max_t = np.concatenate([p[1] for p in parts])
+    exceed_max = n_perm - np.searchsorted(np.sort(max_t), t_obs - 1e-12, side="left")
+    out = {
+        "levels": levels,
+        "t": t,
+        "p_unc": (exceed + 1.0) / (n_perm + 1.0),
+        "p_fwer": (exceed_max + 1.0) / (n_perm + 1.0),
+        "max_t_null": max_t,
+    }
+
+    if nbs is not None:
+        edge_idx, thr, iu, ju, n = nbs
+        out["nbs"] = {}
+        for c, sign in nbs_contrasts(tail).items():
+            supra = sign * t[edge_idx] > thr
+            lab, comp_sizes = components(supra, iu, ju, n)
+            max_comp = np.concatenate([p[2][c] for p in parts])
+            out["nbs"][c] = {
+                "supra": supra,
+                "edge_component": np.where(supra, lab[iu], -1),
+                "sizes": comp_sizes,
+                "p": np.array([((max_comp >= k).sum() + 1.0) / (n_perm + 1.0) for k in comp_sizes]),
+                "max_component_null": max_comp,
+                "iu": iu,
+                "ju": ju,
+            }
+    return out
+
+
+# -------------------------- Tabelle --------------------------
+def results_table(res: dict, columns, X: np.ndarray, labels) -> pd.DataFrame:
+    g, (l0, l1) = group_indicator(labels)
+    X = np.asarray(X, dtype=float)
+    return pd.DataFrame({
+        "feature": list(columns),
+        f"mean_{l0}": X[g == 0].mean(axis=0),
+        f"mean_{l1}": X[g == 1].mean(axis=0),
+        "t": res["t"],
+        "p_unc": res["p_unc"],
+        "p_fwer": res["p_fwer"],
+    })
+
+
+def nbs_table(res: dict) -> pd.DataFrame:
+    """
+    Una riga per componente con almeno un arco e per contrasto ("<gruppo_1> > <gruppo_0>" o "<"):
+    n. archi, nodi, p FWER, archi come 'i-j;...'.
+    """
+    l0, l1 = res["levels"]
+    rows = []
+    for contrast, nbs in res["nbs"].items():
+        comp = nbs["edge_component"]
+        for c, (size, p) in enumerate(zip(nbs["sizes"], nbs["p"])):
+            if size == 0:
+                continue
+            sel = comp == c
+            i, j = nbs["iu"][sel], nbs["ju"][sel]
+            rows.append({
+                "contrast": f"{l1} {'>' if contrast == 'greater' else '<'} {l0}",
+                "component": c,
+                "n_edges": int(size),
+                "n_nodes": int(np.unique(np.concatenate([i, j])).size),
+                "p_fwer": float(p),
+                "edges": ";".join(f"{a}-{b}" for a, b in zip(i.tolist(), j.tolist())),
+            })
+    df = pd.DataFrame(rows, columns=["contrast", "component", "n_edges", "n_nodes", "p_fwer", "edges"])
+    return df.sort_values(["contrast", "n_edges"], ascending=[True, False]).reset_index(drop=True)
+
+
+def run(features_path=FEATURES_PATH, out_csv=OUT_CSV) -> Path:
+    X, columns, ids, labels = load_feature_matrix(features_path, groups=GROUPS)
+    keep = np.isfinite(X).all(axis=0)
+    if not keep.all():
+        print(f"[WARN] Escluse {int((~keep).sum())} colonne con valori mancanti")
+        X = X[:, keep]
+        columns = [c for c, k in zip(columns, keep) if k]
+
+    edge_idx = None
+    n_edge_cols = sum(c.startswith("edge_") for c in columns)
+    if NBS_THRESHOLD is not None and n_edge_cols:
+        pos = {c: j for j, c in enumerate(columns)}
+        try:
+            edge_idx = [pos[f"edge_{k}"] for k in range(n_edge_cols)]
+        except KeyError:
+            print("[WARN] Colonne edge_* incomplete: NBS saltata")
+
+    res = permutation_test(X, labels, n_perm=N_PERM, seed=SEED, tail=TAIL, edge_idx=edge_idx,
+                           nbs_threshold=NBS_THRESHOLD, block=PERM_BLOCK, n_workers=N_WORKERS)
+
+    out_csv = Path(out_csv)
+    out_csv.parent.mkdir(parents=True, exist_ok=True)
+    results_table(res, columns, X, labels).to_csv(out_csv, index=False)
+
+    l0, l1 = res["levels"]
+    print(f"[OK] {X.shape[0]} soggetti, {X.shape[1]} feature, {N_PERM} permutazioni (t = {l1} - {l0}, tail={TAIL})")
+    print(f"[OK] Feature con p_fwer < 0.05: {int((res['p_fwer'] < 0.05).sum())}")
+    print(f"[OK] Salvato: {out_csv}")
+
+    if "nbs" in res:
+        nbs_csv = out_csv.with_name(out_csv.stem + "_nbs.csv")
+        df_nbs = nbs_table(res)
+        df_nbs.to_csv(nbs_csv, index=False)
+        print(f"[OK] NBS (soglia {NBS_THRESHOLD}, contrasti: {', '.join(df_nbs['contrast'].unique())}): {len(df_nbs)} componenti, "
+              f"{int((df_nbs['p_fwer'] < 0.05).sum())} con p_fwer < 0.05 -> {nbs_csv}")
+    return out_csv
+
+
+if __name__ == "__main__":
+    features_path = sys.argv[1] if len(sys.argv) > 1 else FEATURES_PATH
+    out = sys.argv[2] if len(sys.argv) > 2 else OUT_CSV
+    run(features_path, out)
@@ -0,0 +1,185 @@
+"""
+Abbinamento paziente -> file e join delle label con un unico merge pandas.
+
+ID canonico (stessa regola di canon_id usata finora nello script di Ema):
+- dal nome file senza estensione si tengono tutte le cifre, senza zeri iniziali
+  ("sub-0001.csv" -> "1", "3_13_0051" -> "3130051")
+- se non ci sono cifre: minuscolo, senza spazi/-/_ e senza prefissi tipo sub/pt/patient
+- con id_pattern (es. r"sub-(\\d+)" per i file MATPTE degli script di Claudia) l'ID è il primo gruppo
+  della regex, così le altre cifre del nome (sessione, atlante, run) non entrano nell'ID:
+  "sub-0001_ses-1_HO96.csv" -> "1"; se il token manca si torna alla regola delle cifre
+
+Le cifre vengono estratte in blocco con i metodi .str di pandas (niente regex per file in Python),
+i file vengono indicizzati una volta per ID canonico e le label unite con un solo merge, invece di
+una scansione di tutti i file per ogni paziente.
+
+Il report segnala ID senza file, file senza label e ID duplicati (più righe di label o più file
+con lo stesso ID canonico), invece di prendere in silenzio il primo match.
+
+Tabelle supportate: .csv (labels_claudia.csv, outcomes.csv) e .xlsx/.xls (label.xlsx).
+
+Dipendenze: numpy, pandas (+ openpyxl per .xlsx)
+"""
+
+import os
+import re
+
+import pandas as pd
+
+
+ID_CANDIDATES = ("Paziente", "ID", "Id", "Subject", "subject", "Subject ID", "patient", "Patient")
+LABEL_CANDIDATES = ("Label", "label", "y", "Y", "Class", "class", "Classe")
+_PREFIXES = ("sub", "subject", "pt", "pte", "id", "patient", "paziente")
+_SEP = r"[\\/]" if os.altsep else "/"      # separatori di os.path.basename (su Windows anche \)
+
+
+def canon_id(s: str, id_pattern=None) -> str:
+    """Estrae un id canonico da stringa/nome file."""
+    s = str(s).strip()
+    b = os.path.splitext(os.path.basename(s))[0]
+    if id_pattern is not None:
+        m = re.search(id_pattern, b)
+        if m:
+            return m.group(1).lstrip("0") or "0"
+    digs = re.findall(r"\d+", b)
+    if digs:
+        d = "".join(digs).lstrip("0")
+        return d if d else "0"
+
+    b = re.sub(r"[\s\-_]+", "", b.lower())
+    for pref in _PREFIXES:
+        if b.startswith(pref):
+            b = b[len(pref):]
+    b = b.lstrip("0")
+    return b if b else "0"
+
+
+def canon_ids(values, id_pattern=None) -> pd.Series:
+    """canon_id vettorizzato su una sequenza/Series (stesso risultato elemento per elemento)."""
+    s = pd.Series(values, dtype=object).astype(str).str.strip()
+    stem = s.str.replace(f"^.*{_SEP}", "", regex=True)                    # basename
+    stem = stem.str.replace(r"^(.*?[^.].*)\.[^.]*$", r"\1", regex=True)   # splitext
+
+    digits = stem.str.replace(r"\D+", "", regex=True)
+    out = digits.str.lstrip("0").mask(lambda d: d == "", "0")
+
+    no_digits = digits == ""
+    if no_digits.any():
+        b = stem[no_digits].str.lower().str.replace(r"[\s\-_]+", "", regex=True)
+        # come il ciclo di canon_id: i prefissi vengono rimossi in sequenza, nell'ordine di _PREFIXES
+        for pref in _PREFIXES:
+            b = b.str.replace(f"^{pref}", "", regex=True)
+        out[no_digits] = b.str.lstrip("0").mask(lambda x: x == "", "0")
+
+    if id_pattern is not None:
+        token = stem.str.extract(id_pattern, expand=False)
+        found = token.notna()
+        out[found] = token[found].str.lstrip("0").mask(lambda x: x == "", "0")
+    return out
+
+
+def read_table(path: str, **kwargs) -> pd.DataFrame:
+    """CSV o Excel in base all'estensione, tutto come stringa."""
+    if str(path).lower().endswith((".xlsx", ".xls")):
+        return pd.read_excel(path, dtype=str, **kwargs)
+    return pd.read_csv(path, dtype=str, **kwargs)
+
+
+def detect_columns(df: pd.DataFrame, id_col=None, label_col=None) -> tuple:
+    """Colonne ID e LABEL: quelle passate, altrimenti i nomi più comuni."""
+    id_col = id_col or next((c for c in ID_CANDIDATES if c in df.columns), None)
+    label_col = label_col or next((c for c in LABEL_CANDIDATES if c in df.columns), None)
+    if id_col is None or label_col is None:
+        raise ValueError(
+            f"La tabella delle label deve avere colonne ID e LABEL. "
+            f"Colonne trovate: {list(df.columns)}. Passa id_col/label_col."
+        )
+    return id_col, label_col
+
+
+def load_label_table(path: str, id_col=None, label_col=None) -> pd.DataFrame:
+    """
+    labels_claudia.csv / label.xlsx / outcomes.csv -> DataFrame con tutte le colonne originali
+    (ID e label ripulite dagli spazi).
+    Per outcomes.csv la colonna label va indicata (es. label_col="LS (0- none, 1 - present)").
+    """
+    df = read_table(path)
+    id_col, label_col = detect_columns(df, id_col, label_col)
+    df[id_col] = df[id_col].astype(str).str.strip()
+    df[label_col] = df[label_col].astype(str).str.strip()
+    return df
+
+
+def index_files(files, id_pattern=None) -> pd.DataFrame:
+    """DataFrame (file, canon) nell'ordine dei file; un ID canonico può comparire più volte."""
+    files = [str(f) for f in files]
+    return pd.DataFrame({"file": files, "canon": canon_ids(files, id_pattern=id_pattern).to_numpy()})
+
+
+def match_labels(labels: pd.DataFrame, files, id_col=None, label_col=None,
+                 file_col: str = "file", keep: str = "last", on_duplicate_file: str = "first",
+                 id_pattern=None):
+    """
+    Join label <-> file per ID canonico con un unico merge.
+
+    labels: DataFrame delle label (tutte le colonne vengono mantenute)
+    files:  nomi o path dei file delle matrici
+    keep:   righe di label con lo stesso ID: "first" | "last"
+    on_duplicate_file: più file con lo stesso ID: "first" (primo in ordine) | "drop" (ID escluso) | "raise"
+    id_pattern: regex con un gruppo per l'ID (es. r"sub-(\\d+)"), applicata a ID e nomi file (vedi canon_id)
+
+    Restituisce (df, report):
+    df:     righe di label con un file, nell'ordine delle label, + colonne file_col e "canon"
+    report: dict con n_labels, n_files, matched, unmatched_ids, unmatched_files,
+            duplicate_ids, duplicate_files ({canon: [file, ...]})
+    """
+    id_col, label_col = detect_columns(labels, id_col, label_col)
+
+    lab = labels.copy()
+    lab["canon"] = canon_ids(lab[id_col], id_pattern=id_pattern).to_numpy()
+    dup_ids = lab.loc[lab["canon"].duplicated(keep=False), id_col].tolist()
+    lab = lab.drop_duplicates(subset="canon", keep=keep)
+
+    idx = index_files(files, id_pattern=id_pattern)
+    dup_mask = idx["canon"].duplicated(keep=False)
+    dup_files = idx[dup_mask].groupby("canon", sort=False)["file"].apply(list).to_dict()
+    if dup_files:
+        if on_duplicate_file == "raise":
+            raise ValueError(f"ID con più file: {dup_files}")
+        if on_duplicate_file == "drop":
+            idx = idx[~dup_mask]
+        else:
+            idx = idx.drop_duplicates(subset="canon", keep="first")
+
+    merged = lab.merge(idx.rename(columns={"file": file_col}), on="canon", how="left", sort=False)
+    has_file = merged[file_col].notna()
+
+    report = {
+        "n_labels": len(labels),
+        "n_files": len(files),
+        "matched": int(has_file.sum()),
+        "unmatched_ids": merged.loc[~has_file, id_col].tolist(),
+        "unmatched_files": idx.loc[~idx["canon"].isin(lab["canon"]), "file"].tolist(),
+        "duplicate_ids": dup_ids,
+        "duplicate_files": dup_files,
+    }
+    return merged[has_file].reset_index(drop=True), report
+
+
+def print_match_report(report: dict, max_items: int = 10) -> None:
+    def _show(items):
+        items = list(items)
+        more = f" ... (+{len(items) - max_items})" if len(items) > max_items else ""
+        return ", ".join(map(str, items[:max_items])) + more
+
+    print(f"[OK] Abbinati {report['matched']} / {report['n_labels']} ID con label "
+          f"({report['n_files']} file)")
+    if report["unmatched_ids"]:
+        print(f"[WARN] ID senza file ({len(report['unmatched_ids'])}): {_show(report['unmatched_ids'])}")
+    if report["unmatched_files"]:
+        print(f"[WARN] File senza label ({len(report['unmatched_files'])}): {_show(report['unmatched_files'])}")
+    if report["duplicate_ids"]:
+        print(f"[WARN] ID duplicati nelle label ({len(report['duplicate_ids'])}): {_show(report['duplicate_ids'])}")
+    if report["duplicate_files"]:
+        dup = [f"{k}: {v}" for k, v in report["duplicate_files"].items()]
+        print(f"[WARN] ID con più file ({len(dup)}): {_show(dup)}")
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Carico lesionale per parcella: quanta parte di ogni nodo del connettoma è coperta dalla lesione.
+
+Atlante: Harvard-Oxford corticale maxprob (48 label, valori 1..48) nello stesso spazio/griglia
+delle maschere (MNI 1 mm, 182 x 218 x 182). Gli emisferi vengono separati con la coordinata
+mondo x del voxel (x > 0 = Right) e ogni (emisfero, label) viene mappato sul nodo corrispondente
+di cortical-labels.csv (riga i = nodo i delle matrici di connettività).
+
+Indice precalcolato (una volta, salvato in ATLAS_INDEX):
+    vox     indici lineari (C-order) dei voxel dell'atlante che cadono in una parcella
+    parcel  nodo di ciascuno di quei voxel
+Per ogni maschera: lesione = seg.ravel()[vox] == LESION_LABEL, poi np.bincount(parcel[lesione]),
+senza ricampionare l'atlante soggetto per soggetto.
+
+Output: patient_id + mask_id + lesion_load_n000 ... (frazione di voxel lesionati per parcella), che
+build_graph_feature_tables.py può unire alla tabella wide (LESION_LOAD_CSV).
+patient_id è l'ID del soggetto, non il nome della maschera ("aff_3_11_0111_2019-05-12_lesion"):
+ID_PATTERN ne tiene solo l'ID dello studio ("3_11_0111", senza data e suffisso _lesion) e
+ID_MAP_CSV, se impostato, lo traduce nell'ID dei connettomi ("sub-0001"). Senza tabella di
+corrispondenza gli ID dello studio non si uniscono ai sub-XXXX: lo script di Ema lo segnala.
+
+Uso:
+    python lesion_parcels.py [MASK_DIR] [OUT_CSV]
+
+Dipendenze: numpy, pandas, nibabel, scipy (via extract_volume)
+"""
+
+import os
+import re
+import sys
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import nibabel as nib
+
+from extract_volume import iter_nifti_files, extract_patient_id  # stesse maschere e stessi ID di lesion_voxels.csv
+from id_matching import canon_ids, read_table
+
+
+# ============================
+# CONFIG (MODIFICA QUI)
+# ============================
+ATLAS_NII = "HarvardOxford-cort-maxprob-thr25-1mm.nii.gz"
+ATLAS_INDEX = "atlas_index.npz"         # creato al primo uso se non esiste
+PARCEL_LABELS_CSV = "../data/cortical-labels.csv"
+MASK_DIR = "lesion_masks"
+OUT_CSV = "lesion_parcel_load.csv"
+LESION_LABEL = 1
+ID_PATTERN = r"aff_(\d+_\d+_\d+)"       # primo gruppo = ID dello studio nel nome della maschera (None = nome intero)
+ID_MAP_CSV = None                       # es. "mask_subject_map.csv": colonne mask_id (ID dello studio) e subject_id (es. sub-0001)
+N_WORKERS = 1                           # >1: maschere in parallelo; None = tutte le CPU
+# ============================
+
+FEATURE = "lesion_load"
+_LABEL_RE = re.compile(r'(Right|Left)\s+index="(\d+)".*>(.*?)</label>')
+
+
+def load_parcel_labels(labels_csv: str = PARCEL_LABELS_CSV) -> pd.DataFrame:
+    """
+    cortical-labels.csv -> DataFrame (node, hemi, atlas_value, name).
+    node = posizione della riga (= indice di riga/colonna nelle matrici), atlas_value = index + 1.
+    """
+    raw = pd.read_csv(labels_csv, sep=";", dtype=str, encoding="utf-8-sig")
+    out = []
+    for node, text in enumerate(raw.iloc[:, 1].astype(str)):
+        m = _LABEL_RE.search(text)
+        if m is None:
+            raise ValueError(f"Riga {node + 1} di {labels_csv} non riconosciuta: {text!r}")
+        hemi, idx, name = m.groups()
+        out.append((node, hemi, int(idx) + 1, name.strip()))
+    return pd.DataFrame(out, columns=["node", "hemi", "atlas_value", "name"])
+
+
+def read_label_volume(path) -> tuple:
+    """(volume intero nel dtype nativo, affine); maschere float/scalate arrotondate."""
+    img = nib.load(str(path))
+    vol = np.asarray(img.dataobj)
+    if not np.issubdtype(vol.dtype, np.integer):
+        vol = np.rint(vol).astype(np.int16)
+    return vol, img.affine
+
+
+class AtlasIndex:
+    """Indice sparso voxel -> parcella, costruito una volta e riusato per tutte le maschere."""
+
+    def __init__(self, shape, affine, vox, parcel, n_parcels: int):
+        self.shape = tuple(int(s) for s in shape)
+        self.affine = np.asarray(affine, dtype=float)
+        self.vox = np.asarray(vox, dtype=np.int64)
+        self.parcel = np.asarray(parcel, dtype=np.int32)
+        self.n_parcels = int(n_parcels)
+        self.sizes = np.bincount(self.parcel, minlength=self.n_parcels)
+
+    @classmethod
+    def from_atlas(cls, atlas_nii: str = ATLAS_NII, labels_csv: str = PARCEL_LABELS_CSV):
+        atlas, affine = read_label_volume(atlas_nii)
+        labels = load_parcel_labels(labels_csv)
+
+        # lookup (emisfero, valore atlante) -> nodo, -1 = non usato
+        lut = np.full((2, max(int(atlas.max()), int(labels["atlas_value"].max())) + 1), -1, dtype=np.int32)
+        for node, hemi, value in labels[["node", "hemi", "atlas_value"]].itertuples(index=False):
+            lut[int(hemi == "Right"), value] = node
+
+        flat = atlas.ravel()
+        vox = np.flatnonzero(flat > 0)
+        ijk = np.stack(np.unravel_index(vox, atlas.shape)[:3])
+        x_mm = affine[0, :3] @ ijk + affine[0, 3]
+        parcel = lut[(x_mm > 0).astype(np.intp), flat[vox]]
+
+        keep = parcel >= 0
+        return cls(atlas.shape, affine, vox[keep], parcel[keep], n_parcels=len(labels))
+
+    def save(self, path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(path, shape=np.array(self.shape), affine=self.affine,
+                            vox=self.vox, parcel=self.parcel, n_parcels=self.n_parcels)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            return cls(z["shape"], z["affine"], z["vox"], z["parcel"], int(z["n_parcels"]))
+
+    def lesion_counts(self, seg: np.ndarray, label: int = LESION_LABEL) -> np.ndarray:
+        """Voxel lesionati per parcella, shape (n_parcels,)."""
+        if seg.shape[:3] != self.shape[:3]:
+            raise ValueError(f"Maschera {seg.shape} e atlante {self.shape} su griglie diverse: "
+                             f"ricampiona la maschera nello spazio dell'atlante")
+        hit = seg.ravel()[self.vox] == label
+        return np.bincount(self.parcel[hit], minlength=self.n_parcels)
+
+    def lesion_load(self, seg: np.ndarray, label: int = LESION_LABEL) -> np.ndarray:
+        """Frazione di voxel lesionati per parcella (0 per parcelle vuote nell'atlante)."""
+        counts = self.lesion_counts(seg, label=label)
+        return np.divide(counts, self.sizes, out=np.zeros(self.n_parcels), where=self.sizes > 0)
+
+
+_INDEX = None
+
+
+def atlas_index() -> AtlasIndex:
+    """Indice dell'atlante per processo: da ATLAS_INDEX se esiste, altrimenti costruito e salvato."""
+    global _INDEX
+    if _INDEX is None:
+        if os.path.exists(ATLAS_INDEX):
+            _INDEX = AtlasIndex.load(ATLAS_INDEX)
+        else:
+            _INDEX = AtlasIndex.from_atlas(ATLAS_NII, PARCEL_LABELS_CSV)
+            _INDEX.save(ATLAS_INDEX)
+    return _INDEX
+
+
+def load_id_map(path: str = ID_MAP_CSV) -> dict:
+    """Tabella mask_id -> subject_id (CSV o Excel) come {ID canonico dello studio: ID soggetto}."""
+    df = read_table(path)
+    missing = {"mask_id", "subject_id"} - set(df.columns)
+    if missing:
+        raise ValueError(f"{path}: mancano le colonne {sorted(missing)} (trovate: {list(df.columns)})")
+    df = df.dropna(subset=["mask_id", "subject_id"])
+    return dict(zip(canon_ids(df["mask_id"]), df["subject_id"].str.strip()))
+
+
+def subject_ids(mask_ids, id_pattern=ID_PATTERN, id_map: dict = None) -> list:
+    """
+    Nomi delle maschere -> ID dei soggetti.
+    id_pattern: il primo gruppo è l'ID ("aff_3_11_0111_2019-05-12_lesion" -> "3_11_0111"); nomi senza
+    il token restano interi. id_map ({ID canonico: ID soggetto}, vedi load_id_map): traduzione in ID dei
+    connettomi; gli ID senza corrispondenza restano quelli dello studio (con un avviso).
+    """
+    ids = pd.Series(list(mask_ids), dtype=object).astype(str)
+    if id_pattern is not None:
+        token = ids.str.extract(id_pattern, expand=False)
+        ids = token.fillna(ids)
+    if id_map is not None:
+        mapped = canon_ids(ids).map(id_map)
+        if mapped.isna().any():
+            print(f"[WARN] {int(mapped.isna().sum())} maschere senza riga in ID_MAP_CSV "
+                  f"(es. {ids[mapped.isna()].iloc[0]}): restano con l'ID dello studio")
+        ids = mapped.fillna(ids)
+    return ids.tolist()
+
+
+def feature_columns(n_parcels: int, fmt: str = "{:03d}") -> list:
+    """Stessi suffissi *_nXXX di flatten_nodal_wide."""
+    return [f"{FEATURE}_n{fmt.format(k)}" for k in range(n_parcels)]
+
+
+def subject_lesion_load(path) -> np.ndarray:
+    seg, _ = read_label_volume(path)
+    return atlas_index().lesion_load(seg, label=LESION_LABEL)
+
+
+def run(mask_dir: str = MASK_DIR, out_csv: str = OUT_CSV, n_workers=N_WORKERS,
+        id_pattern=ID_PATTERN, id_map_csv=ID_MAP_CSV) -> Path:
+    paths = list(iter_nifti_files(Path(mask_dir)))
+    if not paths:
+        raise FileNotFoundError(f"Nessuna maschera NIfTI trovata in {mask_dir}")
+
+    index = atlas_index()  # costruito qui una volta, prima di avviare i worker
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+
+    if n_workers <= 1 or len(paths) <= 1:
+        loads = list(map(subject_lesion_load, paths))
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(paths))) as ex:
+            loads = list(ex.map(subject_lesion_load, paths))
+
+    df = pd.DataFrame(np.vstack(loads), columns=feature_columns(index.n_parcels))
+    mask_ids = [extract_patient_id(p) for p in paths]
+    id_map = load_id_map(id_map_csv) if id_map_csv else None
+    df.insert(0, "patient_id", subject_ids(mask_ids, id_pattern=id_pattern, id_map=id_map))
+    df.insert(1, "mask_id", mask_ids)
+
+    out_csv = Path(out_csv)
+    out_csv.parent.mkdir(parents=True, exist_ok=True)
+    df.to_csv(out_csv, index=False)
+    return out_csv
+
+
+if __name__ == "__main__":
+    mask_dir = sys.argv[1] if len(sys.argv) > 1 else MASK_DIR
+    out = sys.argv[2] if len(sys.argv) > 2 else OUT_CSV
+    out = run(mask_dir, out)
+    index = atlas_index()
+    print(f"[OK] Atlante: {index.vox.size} voxel in {index.n_parcels} parcelle ({ATLAS_INDEX})")
+    print(f"[OK] Salvato: {out.resolve()}")
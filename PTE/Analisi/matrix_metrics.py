@@ -0,0 +1,137 @@
+"""
+Metriche di grafo calcolate direttamente sulla matrice di adiacenza (niente networkx).
+
+Stesse definizioni (e stessi numeri) delle funzioni networkx usate finora:
+- degree / strength                -> G.degree() / G.degree(weight="weight")
+- clustering pesato (Onnela)       -> nx.clustering(G, weight="weight")
+- transitività binaria             -> nx.transitivity(G)
+- eigenvector centrality           -> nx.eigenvector_centrality_numpy(G, weight="weight")
+- local efficiency per nodo (bin.) -> efficienza del sottografo dei vicini
+
+Gli archi sono quelli del triangolo superiore con w > edge_min (simmetrizzati, diagonale esclusa).
+Tutte le funzioni (tranne local_efficiency_binary) lavorano sugli ultimi due assi: accettano
+sia una matrice (N, N) sia uno stack di coorte (S, N, N) e in quel caso restituiscono (S, N) / (S,).
+
+I pesi restano in float32 se la matrice è float32 (modalità precisione singola), altrimenti float64.
+
+Dipendenze: numpy
+"""
+
+import numpy as np
+
+
+def as_float_array(A) -> np.ndarray:
+    """float32/float64 restano tali, tutto il resto diventa float64."""
+    A = np.asarray(A)
+    return A if A.dtype in (np.float32, np.float64) else A.astype(float)
+
+
+# -------------------------- Adiacenza --------------------------
+def adjacency(A: np.ndarray, edge_min: float = 0.0):
+    """
+    Restituisce (W, B):
+    W: pesi degli archi (0 dove l'arco non c'è), simmetrica, diagonale nulla
+    B: maschera booleana degli archi
+    """
+    A = as_float_array(A)
+    W = np.triu(A, 1)
+    W = W + np.swapaxes(W, -1, -2)
+
+    B = W > edge_min
+    n = A.shape[-1]
+    B[..., np.arange(n), np.arange(n)] = False
+
+    return np.where(B, W, 0.0), B
+
+
+# -------------------------- Metriche nodali --------------------------
+def degree(B: np.ndarray) -> np.ndarray:
+    return B.sum(axis=-1).astype(float)
+
+
+def strength(W: np.ndarray) -> np.ndarray:
+    return W.sum(axis=-1)
+
+
+def binary_density(B: np.ndarray):
+    """Frazione di archi presenti sulle N(N-1)/2 coppie possibili."""
+    n = B.shape[-1]
+    if n <= 1:
+        return np.zeros(B.shape[:-2]) if B.ndim > 2 else 0.0
+    dens = B.sum(axis=(-2, -1)) / 2.0 / (n * (n - 1) / 2.0)
+    return dens if B.ndim > 2 else float(dens)
+
+
+def weighted_clustering(W: np.ndarray, B: np.ndarray) -> np.ndarray:
+    """
+    Clustering pesato di Onnela (come networkx):
+    c_i = sum_jk (w_ij w_jk w_ki)^(1/3) / (k_i (k_i - 1)),  pesi normalizzati per il peso massimo
+    (del singolo soggetto, anche in modalità coorte).
+    """
+    w_max = W.max(axis=(-2, -1), keepdims=True)
+    C = np.cbrt(np.divide(W, w_max, out=np.zeros_like(W), where=w_max > 0))
+    tri = np.einsum("...ij,...jk,...ki->...i", C, C, C)
+
+    k = degree(B)
+    den = k * (k - 1)
+    return np.divide(tri, den, out=np.zeros_like(tri), where=den > 0)
+
+
+def transitivity(B: np.ndarray):
+    """Transitività binaria: triangoli chiusi / triple connesse (NaN se non ci sono archi)."""
+    Bf = B.astype(float)
+    tri = np.einsum("...ij,...jk,...ki->...", Bf, Bf, Bf)
+    k = Bf.sum(axis=-1)
+    triads = np.sum(k * (k - 1), axis=-1)
+
+    out = np.divide(tri, triads, out=np.zeros_like(tri), where=tri > 0)
+    out = np.where(B.any(axis=(-2, -1)), out, np.nan)
+    return out if B.ndim > 2 else float(out)
+
+
+def eigenvector_centrality(W: np.ndarray) -> np.ndarray:
+    """
+    Autovettore principale di W (eigh, W simmetrica), norma L2 = 1 e segno positivo
+    come in nx.eigenvector_centrality_numpy. Zeri se il grafo non ha archi.
+    """
+    _, vecs = np.linalg.eigh(W)
+    v = vecs[..., :, -1]
+
+    norm = np.sign(v.sum(axis=-1, keepdims=True)) * np.linalg.norm(v, axis=-1, keepdims=True)
+    has_edges = np.any(W > 0, axis=(-2, -1))[..., None]
+    return np.where(has_edges & (norm != 0), v / np.where(norm != 0, norm, 1.0), 0.0)
+
+
+def _binary_efficiency_sum(S: np.ndarray) -> float:
+    """Somma di 1/d sulle coppie i<j di un grafo binario (BFS via prodotti di matrici)."""
+    k = S.shape[0]
+    Sf = S.astype(float)
+    reached = S | np.eye(k, dtype=bool)
+    frontier = S
+    total = S.sum() / 2.0
+
+    d = 1
+    while True:
+        d += 1
+        new = ((frontier.astype(float) @ Sf) > 0) & ~reached
+        if not new.any():
+            break
+        total += new.sum() / 2.0 / d
+        reached |= new
+        frontier = new
+    return float(total)
+
+
+def local_efficiency_binary(B: np.ndarray) -> np.ndarray:
+    """Efficienza locale binaria: efficienza globale del sottografo dei vicini di ogni nodo."""
+    n = B.shape[0]
+    eff = np.zeros(n)
+
+    for u in range(n):
+        nbrs = np.flatnonzero(B[u])
+        k = nbrs.size
+        if k <= 1:
+            continue
+        sub = B[np.ix_(nbrs, nbrs)]
+        eff[u] = _binary_efficiency_sum(sub) / (k * (k - 1) / 2.0)
+    return eff
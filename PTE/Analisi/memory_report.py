@@ -0,0 +1,96 @@
+"""
+Report della memoria per stadio della pipeline.
+
+- per ogni stadio: picco della memoria allocata (Python + NumPy, via tracemalloc) rispetto
+  all'inizio dello stadio, memoria ancora trattenuta alla fine e durata
+- a fine run: picco RSS del processo principale e dei worker (modulo resource, solo Unix)
+
+Uso (stadi in sequenza, ognuno chiude il precedente):
+    mem = MemoryReport(enabled=True)
+    mem.mark("load")
+    ...
+    mem.mark("metriche")
+    ...
+    mem.finish()
+    mem.print_summary()
+
+tracemalloc rallenta le allocazioni Python (es. grafi networkx): da disattivato non fa nulla.
+Con un process pool gli stadi misurano il solo processo principale; i worker compaiono nel picco RSS dei figli.
+
+Dipendenze: nessuna (libreria standard)
+"""
+
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_MB = 1024 ** 2
+
+
+def peak_rss_mb(children: bool = False):
+    """Picco RSS in MB del processo (o dei figli terminati); None se non disponibile."""
+    if resource is None:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    kb = resource.getrusage(who).ru_maxrss
+    # Linux: KB, macOS: byte
+    return kb / _MB if sys.platform == "darwin" else kb / 1024
+
+
+class MemoryReport:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.rows = []
+        self._stage = None
+        self._started_tracing = False
+
+    def mark(self, name: str) -> None:
+        """Chiude lo stadio corrente (se c'è) e ne apre uno nuovo."""
+        if not self.enabled:
+            return
+        self._close()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        self._stage = (name, base, time.perf_counter())
+
+    def finish(self) -> None:
+        """Chiude l'ultimo stadio e ferma tracemalloc se l'aveva avviato questo report."""
+        if not self.enabled:
+            return
+        self._close()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _close(self) -> None:
+        if self._stage is None:
+            return
+        name, base, t0 = self._stage
+        current, peak = tracemalloc.get_traced_memory()
+        self.rows.append({
+            "stage": name,
+            "peak_mb": (peak - base) / _MB,
+            "retained_mb": (current - base) / _MB,
+            "seconds": time.perf_counter() - t0,
+        })
+        self._stage = None
+
+    def print_summary(self) -> None:
+        if not self.enabled or not self.rows:
+            return
+        width = max(len(r["stage"]) for r in self.rows)
+        print("[MEM] " + "stadio".ljust(width) + "  picco MB  trattenuti MB  secondi")
+        for r in self.rows:
+            print(f"[MEM] {r['stage'].ljust(width)}  {r['peak_mb']:8.1f}  {r['retained_mb']:13.1f}  {r['seconds']:7.2f}")
+
+        rss, rss_children = peak_rss_mb(), peak_rss_mb(children=True)
+        if rss is not None:
+            print(f"[MEM] Picco RSS processo: {rss:.1f} MB  |  worker (max): {rss_children:.1f} MB")
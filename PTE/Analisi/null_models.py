@@ -0,0 +1,263 @@
+"""
+Modelli nulli dei connettomi: grafi randomizzati per normalizzare le metriche globali
+(clustering, path length, efficienza) e calcolare la small-worldness.
+
+Surrogati (stessa N, stessi pesi):
+- "maslov_sneppen": scambi di archi (a-b, c-d) -> (a-d, c-b) che conservano il grado di ogni nodo;
+  i pesi viaggiano con gli archi (come randmio_und del Brain Connectivity Toolbox)
+- "strength": topologia Maslov–Sneppen, poi pesi riassegnati per rango in modo da conservare
+  circa la strength di ogni nodo (Rubinov & Sporns 2011, null_model_und_sign), a blocchi
+
+Scambi vettorizzati: a ogni passo gli archi vengono accoppiati a caso (ogni arco in una sola coppia)
+e tutti gli scambi validi si applicano insieme; si scartano quelli che creerebbero self-loop,
+archi già presenti o lo stesso arco due volte nel blocco. n_swaps = tentativi per arco.
+Su grafi quasi completi gli scambi validi sono pochi e i surrogati restano vicini all'originale:
+null_model_metrics restituisce anche la frazione di scambi accettati per null ("swap_rate") e
+avvisa quando la media è sotto MIN_SWAP_RATE (grafo da sogliare prima di normalizzare).
+
+Ogni null ha il suo generatore (SeedSequence(seed).spawn): l'ensemble dipende solo da seed,
+non dal numero di processi. Le metriche dell'ensemble si calcolano in blocco sullo stack (R, N, N)
+con le stesse funzioni batched di global_features; con una FeatureCache l'ensemble (triangolo superiore
+di ogni null) e le sue metriche si salvano per soggetto e seed.
+
+    null = null_model_metrics(W, n_nulls=100, seed=0, n_workers=8, cache=cache)
+    gf.update(normalized_features(gf, null))
+
+Dipendenze: numpy
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from matrix_metrics import adjacency, weighted_clustering, transitivity
+from shortest_paths import distance_matrix, characteristic_path_length, global_efficiency
+
+METHODS = ("maslov_sneppen", "strength")
+NULL_VERSION = 2  # da incrementare quando cambia la generazione dei null (invalida la cache)
+MIN_SWAP_RATE = 0.1  # sotto questa frazione di scambi accettati i null sono quasi copie del grafo
+
+
+# -------------------------- Surrogati --------------------------
+def _swap_edges(n: int, u: np.ndarray, v: np.ndarray, n_swaps: int, rng) -> float:
+    """
+    Scambi Maslov–Sneppen in place sulle liste di archi (u, v); la posizione k resta l'arco k.
+    Restituisce la frazione di tentativi accettati (0 con meno di due archi).
+    """
+    m = u.size
+    if m < 2:
+        return 0.0
+    A = np.zeros((n, n), dtype=bool)
+    A[u, v] = A[v, u] = True
+
+    half = m // 2
+    attempts, accepted = 0, 0
+    while attempts < n_swaps * m:
+        perm = rng.permutation(m)
+        e1, e2 = perm[:half], perm[half:2 * half]
+        a, b = u[e1], v[e1]
+        flip = rng.random(half) < 0.5
+        c = np.where(flip, v[e2], u[e2])
+        d = np.where(flip, u[e2], v[e2])
+
+        # nuovi archi (a, d) e (c, b): quattro nodi distinti, archi non già presenti
+        ok = (a != c) & (a != d) & (b != c) & (b != d)
+        ok &= ~A[a, d] & ~A[c, b]
+
+        # due scambi del blocco non possono creare lo stesso arco
+        keys = np.concatenate([np.minimum(a, d) * n + np.maximum(a, d),
+                               np.minimum(c, b) * n + np.maximum(c, b)])
+        cand = np.concatenate([ok, ok])
+        _, inv, cnt = np.unique(keys[cand], return_inverse=True, return_counts=True)
+        clash = np.zeros(keys.size, dtype=bool)
+        clash[cand] = cnt[inv] > 1
+        ok &= ~(clash[:half] | clash[half:])
+
+        a, b, c, d, e1, e2 = a[ok], b[ok], c[ok], d[ok], e1[ok], e2[ok]
+        A[a, b] = A[b, a] = False
+        A[c, d] = A[d, c] = False
+        A[a, d] = A[d, a] = True
+        A[c, b] = A[b, c] = True
+        u[e1], v[e1] = a, d
+        u[e2], v[e2] = c, b
+
+        attempts += half
+        accepted += int(ok.sum())
+    return accepted / attempts if attempts else 0.0
+
+
+def maslov_sneppen(W: np.ndarray, n_swaps: int = 10, rng=None, return_rate: bool = False):
+    """
+    Surrogato che conserva il grado di ogni nodo; ogni arco si porta dietro il suo peso.
+    return_rate: restituisce (surrogato, frazione di scambi accettati).
+    """
+    rng = np.random.default_rng(rng)
+    W = np.asarray(W, dtype=float)
+    n = W.shape[0]
+    u, v = np.nonzero(np.triu(W, 1))
+    w = W[u, v]
+    rate = _swap_edges(n, u, v, n_swaps, rng)
+
+    out = np.zeros((n, n))
+    out[u, v] = out[v, u] = w
+    return (out, rate) if return_rate else out
+
+
+def strength_preserving(W: np.ndarray, n_swaps: int = 10, rng=None, block: float = 0.1,
+                        return_rate: bool = False):
+    """
+    Surrogato che conserva il grado e circa la strength: topologia Maslov–Sneppen, poi i pesi
+    originali si assegnano per rango agli archi ordinati per s_i * s_j (strength ancora da coprire).
+    A ogni passo si assegna una frazione casuale `block` dei ranghi rimasti, poi s_i * s_j si aggiorna.
+    return_rate: restituisce (surrogato, frazione di scambi accettati).
+    """
+    rng = np.random.default_rng(rng)
+    W = np.asarray(W, dtype=float)
+    n = W.shape[0]
+    u, v = np.nonzero(np.triu(W, 1))
+    weights = np.sort(W[u, v])
+    rate = _swap_edges(n, u, v, n_swaps, rng)
+
+    s = W.sum(axis=1)
+    w_new = np.zeros(u.size)
+    left = np.arange(u.size)
+    while left.size:
+        k = max(1, int(np.ceil(block * left.size)))
+        ranks = np.sort(rng.choice(left.size, size=k, replace=False))
+
+        expected = np.maximum(s[u[left]], 0.0) * np.maximum(s[v[left]], 0.0)
+        by_rank = left[np.argsort(expected, kind="stable")]
+        edges = by_rank[ranks]
+        w_new[edges] = weights[ranks]
+        np.subtract.at(s, u[edges], weights[ranks])
+        np.subtract.at(s, v[edges], weights[ranks])
+
+        keep = np.ones(left.size, dtype=bool)
+        keep[ranks] = False
+        left = np.setdiff1d(left, edges, assume_unique=True)
+        weights = weights[keep]
+
+    out = np.zeros((n, n))
+    out[u, v] = out[v, u] = w_new
+    return (out, rate) if return_rate else out
+
+
+def _surrogate(W, method: str, n_swaps: int, rng) -> tuple:
+    """(surrogato, frazione di scambi accettati)."""
+    if method == "maslov_sneppen":
+        return maslov_sneppen(W, n_swaps=n_swaps, rng=rng, return_rate=True)
+    if method == "strength":
+        return strength_preserving(W, n_swaps=n_swaps, rng=rng, return_rate=True)
+    raise ValueError(f"method deve essere uno tra {METHODS}, trovato {method!r}")
+
+
+def null_ensemble(W: np.ndarray, n_nulls: int = 100, method: str = "maslov_sneppen", n_swaps: int = 10,
+                  seed: int = 0) -> np.ndarray:
+    """Stack (R, N, N) di surrogati di W, riproducibile con seed."""
+    seeds = np.random.SeedSequence(seed).spawn(n_nulls)
+    return _ensemble_chunk(W, seeds, method, n_swaps)[0]
+
+
+def _ensemble_chunk(W, seeds, method, n_swaps) -> tuple:
+    """(stack (R, N, N) dei surrogati, frazione di scambi accettati (R,))."""
+    W = np.asarray(W, dtype=float)
+    X = np.zeros((len(seeds),) + W.shape)
+    rates = np.zeros(len(seeds))
+    for r, ss in enumerate(seeds):
+        X[r], rates[r] = _surrogate(W, method, n_swaps, np.random.default_rng(ss))
+    return X, rates
+
+
+# -------------------------- Metriche sull'ensemble --------------------------
+def ensemble_metrics(X: np.ndarray) -> dict:
+    """Metriche globali (stesse definizioni di global_features) per ogni null dello stack (R, N, N) -> (R,)."""
+    W, B = adjacency(X)
+    _, D = distance_matrix(X)
+    has_edges = B.any(axis=(-2, -1))
+    return {
+        "gf_avg_weighted_clust": np.where(has_edges, weighted_clustering(W, B).mean(axis=-1), np.nan),
+        "gf_transitivity_bin": np.atleast_1d(transitivity(B)),
+        "gf_charpath_len_w": np.atleast_1d(characteristic_path_length(D)),
+        "gf_global_eff_w": np.atleast_1d(global_efficiency(D)),
+    }
+
+
+def _metrics_job(args):
+    W, seeds, method, n_swaps = args
+    X, rates = _ensemble_chunk(W, seeds, method, n_swaps)
+    iu, ju = np.triu_indices(X.shape[-1], 1)
+    return X[:, iu, ju], {**ensemble_metrics(X), "swap_rate": rates}
+
+
+def null_model_metrics(W: np.ndarray, n_nulls: int = 100, method: str = "maslov_sneppen", n_swaps: int = 10,
+                       seed: int = 0, n_workers: int = 1, cache=None, chunk: int = 16,
+                       min_swap_rate: float = MIN_SWAP_RATE) -> dict:
+    """
+    Metriche dell'ensemble nullo di W: dict {metrica: (R,)}, più "swap_rate" (R,) = frazione di scambi
+    accettati per null; se la media è sotto min_swap_rate stampa un avviso (null poco randomizzati).
+    I null si generano a blocchi di `chunk` su un process pool (n_workers > 1, None = tutti i core).
+    cache: FeatureCache opzionale; chiave = contenuto di W + parametri del modello nullo + seed.
+    """
+    if method not in METHODS:
+        raise ValueError(f"method deve essere uno tra {METHODS}, trovato {method!r}")
+    W = np.asarray(W, dtype=float)
+
+    key = None
+    if cache is not None:
+        key = cache.key(W, kind="null_models", method=method, n_nulls=n_nulls, n_swaps=n_swaps,
+                        seed=seed, version=NULL_VERSION)
+        hit = cache.get(key)
+        if hit is not None:
+            metrics = {k: v for k, v in hit.items() if k != "ensemble_upper"}
+            _check_swap_rate(metrics["swap_rate"], min_swap_rate)
+            return metrics
+
+    seeds = np.random.SeedSequence(seed).spawn(n_nulls)
+    jobs = [(W, seeds[i:i + chunk], method, n_swaps) for i in range(0, n_nulls, chunk)]
+    n_workers = (os.cpu_count() or 1) if n_workers is None else int(n_workers)
+    if n_workers <= 1 or len(jobs) <= 1:
+        parts = list(map(_metrics_job, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_workers, len(jobs))) as ex:
+            parts = list(ex.map(_metrics_job, jobs))
+
+    metrics = {k: np.concatenate([m[k] for _, m in parts]) for k in parts[0][1]} if parts else {}
+    if cache is not None:
+        ensemble = np.concatenate([up for up, _ in parts]) if parts else np.zeros((0, 0))
+        cache.put(key, {**metrics, "ensemble_upper": ensemble})
+    _check_swap_rate(metrics.get("swap_rate", np.zeros(0)), min_swap_rate)
+    return metrics
+
+
+def _check_swap_rate(rates: np.ndarray, min_swap_rate: float) -> None:
+    if rates.size and float(rates.mean()) < min_swap_rate:
+        print(f"[WARN] Modelli nulli: accettato solo il {100 * float(rates.mean()):.1f}% degli scambi "
+              f"(< {100 * min_swap_rate:.0f}%): grafo troppo denso, i null restano quasi uguali all'originale; "
+              f"soglia il grafo prima di normalizzare")
+
+
+# -------------------------- Feature normalizzate --------------------------
+def _ratio(x, ref) -> float:
+    ref = np.asarray(ref, dtype=float)
+    ref = ref[np.isfinite(ref)]
+    if ref.size == 0 or not np.isfinite(x):
+        return np.nan
+    den = float(ref.mean())
+    return float(x) / den if den != 0 else np.nan
+
+
+def normalized_features(observed: dict, null: dict) -> dict:
+    """
+    Metriche del soggetto divise per la media sull'ensemble nullo, più la small-worldness
+    sigma = (C / C_null) / (L / L_null) (Humphries & Gurney 2008) su clustering e path length pesati.
+    """
+    out = {
+        "gf_clust_norm_w": _ratio(observed["gf_avg_weighted_clust"], null["gf_avg_weighted_clust"]),
+        "gf_transitivity_norm": _ratio(observed["gf_transitivity_bin"], null["gf_transitivity_bin"]),
+        "gf_charpath_norm_w": _ratio(observed["gf_charpath_len_w"], null["gf_charpath_len_w"]),
+        "gf_global_eff_norm_w": _ratio(observed["gf_global_eff_w"], null["gf_global_eff_w"]),
+    }
+    lam = out["gf_charpath_norm_w"]
+    out["gf_small_world_w"] = out["gf_clust_norm_w"] / lam if np.isfinite(lam) and lam != 0 else np.nan
+    return out
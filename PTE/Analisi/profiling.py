@@ -0,0 +1,130 @@
+"""
+Profiling leggero delle metriche: tempo e numero di chiamate per blocco, per soggetto.
+
+    from profiling import timed, profiled
+    with timed("nodal.betweenness"):
+        ...
+    @profiled("gf.modularity")
+    def f(...): ...
+
+- disattivato (default) timed() restituisce sempre lo stesso oggetto no-op e profiled() fa solo un
+  controllo di un flag: costo trascurabile rispetto a qualunque metrica
+- i tempi si accumulano nel processo corrente; collect() li restituisce e azzera, così ogni
+  soggetto (anche in un worker del process pool) produce il suo dict {blocco: (chiamate, secondi)}
+- summary() aggrega i dict dei soggetti in una tabella per blocco
+
+Dipendenze: pandas (solo per summary)
+"""
+
+import time
+import functools
+from collections import defaultdict
+
+_ENABLED = False
+_STATS = defaultdict(lambda: [0, 0.0])  # blocco -> [chiamate, secondi]
+
+
+def enable(flag: bool = True) -> None:
+    global _ENABLED
+    _ENABLED = bool(flag)
+
+
+def is_enabled() -> bool:
+    return _ENABLED
+
+
+class _NoOp:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoOp()
+
+
+class _Timer:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        rec = _STATS[self.name]
+        rec[0] += 1
+        rec[1] += time.perf_counter() - self.t0
+        return False
+
+
+def timed(name: str):
+    """Context manager che accumula il tempo del blocco sotto name (no-op se disattivato)."""
+    return _Timer(name) if _ENABLED else _NOOP
+
+
+def profiled(name: str):
+    """Decoratore: come timed() attorno a ogni chiamata della funzione."""
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _ENABLED:
+                return fn(*args, **kwargs)
+            with _Timer(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def reset() -> None:
+    _STATS.clear()
+
+
+def collect(clear: bool = True) -> dict:
+    """{blocco: (chiamate, secondi)} accumulati finora nel processo corrente."""
+    out = {k: (v[0], v[1]) for k, v in _STATS.items()}
+    if clear:
+        reset()
+    return out
+
+
+def summary(per_subject) -> "pd.DataFrame":
+    """
+    Tabella per blocco da una lista di dict di collect() (uno per soggetto):
+    calls, subjects, total_s, mean_s (per soggetto), max_s (per soggetto), share (% della somma dei blocchi,
+    quindi i blocchi non dovrebbero essere annidati).
+    """
+    import pandas as pd
+
+    rows = [
+        {"block": name, "calls": calls, "seconds": sec, "subject": s}
+        for s, stats in enumerate(per_subject) if stats
+        for name, (calls, sec) in stats.items()
+    ]
+    if not rows:
+        return pd.DataFrame(columns=["block", "calls", "subjects", "total_s", "mean_s", "max_s", "share"])
+
+    df = pd.DataFrame(rows)
+    out = df.groupby("block").agg(
+        calls=("calls", "sum"),
+        subjects=("subject", "nunique"),
+        total_s=("seconds", "sum"),
+        mean_s=("seconds", "mean"),
+        max_s=("seconds", "max"),
+    )
+    out["share"] = 100.0 * out["total_s"] / out["total_s"].sum()
+    return out.sort_values("total_s", ascending=False).reset_index()
+
+
+def print_summary(per_subject, title: str = "Profiling") -> None:
+    df = summary(per_subject)
+    if df.empty:
+        return
+    print(f"[PROF] {title} (secondi; mean/max per soggetto)")
+    for line in df.to_string(index=False, float_format=lambda x: f"{x:.4f}").splitlines():
+        print(f"[PROF] {line}")
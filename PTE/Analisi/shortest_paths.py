@@ -0,0 +1,101 @@
+"""
+Motore condiviso per i cammini minimi su matrici di connettività dense.
+
+- lunghezza di un arco = 1/w (solo archi con w > edge_min), +inf se l'arco non c'è
+- la matrice delle distanze D si calcola UNA volta per soggetto (Floyd–Warshall
+  vettorizzato in NumPy) e alimenta tutte le metriche basate sui cammini:
+  path length caratteristico, efficienza globale, closeness
+- la betweenness (che richiede il conteggio dei cammini minimi) è in betweenness.py
+
+Floyd–Warshall lavora sugli ultimi due assi, quindi accetta anche stack (S, N, N).
+Lunghezze e distanze sono sempre float64 (anche da matrici float32): la betweenness
+riconosce i cammini minimi confrontando somme di lunghezze.
+
+Dipendenze: numpy
+"""
+
+import numpy as np
+
+
+# -------------------------- Lunghezze & distanze --------------------------
+def length_matrix(A: np.ndarray, edge_min: float = 0.0) -> np.ndarray:
+    """
+    Matrice delle lunghezze L (N x N, o stack ... x N x N) dal triangolo superiore di A:
+    L[i, j] = 1/w se w > edge_min, altrimenti +inf. Diagonale = +inf (nessun self-loop).
+    """
+    A = np.asarray(A, dtype=float)
+    W = np.triu(A, 1)
+    W = W + np.swapaxes(W, -1, -2)
+
+    mask = W > edge_min
+    n = A.shape[-1]
+    mask[..., np.arange(n), np.arange(n)] = False
+
+    L = np.full(W.shape, np.inf)
+    np.divide(1.0, W, out=L, where=mask)
+    return L
+
+
+def floyd_warshall(L: np.ndarray) -> np.ndarray:
+    """Distanze minime da una matrice di lunghezze (inf = non collegato). Batched sugli assi iniziali."""
+    D = np.array(L, dtype=float, copy=True)
+    n = D.shape[-1]
+    D[..., np.arange(n), np.arange(n)] = 0.0
+
+    for k in range(n):
+        np.minimum(D, D[..., :, k, None] + D[..., None, k, :], out=D)
+    return D
+
+
+def distance_matrix(A: np.ndarray, edge_min: float = 0.0):
+    """Restituisce (L, D): lunghezze 1/w e distanze minime pesate."""
+    L = length_matrix(A, edge_min=edge_min)
+    return L, floyd_warshall(L)
+
+
+# -------------------------- Metriche dai cammini --------------------------
+def _upper_pairs(D: np.ndarray) -> np.ndarray:
+    iu, ju = np.triu_indices(D.shape[-1], k=1)
+    return D[..., iu, ju]
+
+
+def _masked_mean(x: np.ndarray, mask: np.ndarray):
+    """Media sull'ultimo asse dei soli elementi in mask (NaN se nessuno); float se input 1D."""
+    cnt = mask.sum(axis=-1)
+    tot = np.where(mask, x, 0.0).sum(axis=-1)
+    out = np.divide(tot, cnt, out=np.full(cnt.shape, np.nan), where=cnt > 0)
+    return out if x.ndim > 1 else float(out)
+
+
+def characteristic_path_length(D: np.ndarray):
+    """Media delle distanze sulle coppie i<j raggiungibili (NaN se nessuna). Batched."""
+    d = _upper_pairs(D)
+    return _masked_mean(d, np.isfinite(d))
+
+
+def global_efficiency(D: np.ndarray):
+    """Media di 1/d sulle coppie i<j raggiungibili (NaN se nessuna). Batched."""
+    d = _upper_pairs(D)
+    ok = np.isfinite(d) & (d > 0)
+    return _masked_mean(np.divide(1.0, d, out=np.zeros_like(d), where=ok), ok)
+
+
+def closeness_centrality(D: np.ndarray) -> np.ndarray:
+    """
+    Closeness per nodo come nx.closeness_centrality (wf_improved=True). Batched.
+    c_u = (r-1)/sum(d) * (r-1)/(N-1), r = nodi raggiungibili da u (u incluso).
+    """
+    n = D.shape[-1]
+    reach = np.isfinite(D)
+    r = reach.sum(axis=-1)
+    tot = np.where(reach, D, 0.0).sum(axis=-1)
+
+    ok = (tot > 0) & (n > 1)
+    c = np.divide(r - 1.0, tot, out=np.zeros(tot.shape), where=ok)
+    return c * (r - 1.0) / max(n - 1, 1)
+
+
+def mean_node_distance(D: np.ndarray) -> np.ndarray:
+    """Distanza media da ogni nodo ai nodi raggiungibili, sé stesso (d=0) incluso. Batched."""
+    reach = np.isfinite(D)
+    return np.where(reach, D, 0.0).sum(axis=-1) / reach.sum(axis=-1)
@@ -0,0 +1,6 @@
+"""I test importano i moduli condivisi di PTE/Analisi come fanno gli script (cartella nel sys.path)."""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
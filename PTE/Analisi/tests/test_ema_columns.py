@@ -0,0 +1,25 @@
+"""Output colonnare del builder di Ema: il vettore del soggetto coincide con la sua riga del CSV wide."""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "Ema"))
+import build_graph_feature_tables as ema  # noqa: E402
+
+
+def test_subject_vector_matches_row(tmp_path, monkeypatch):
+    monkeypatch.setattr(ema, "CACHE_DIR", None)
+    rng = np.random.default_rng(0)
+    A = rng.random((10, 10))
+    fp = tmp_path / "sub-0001.csv"
+    np.savetxt(fp, (A + A.T) / 2, delimiter=",")
+
+    row = ema.process_subject(str(fp), "1", 0)
+    schema, vec = ema.subject_vector(str(fp))
+
+    cols = ema.vector_columns(schema)
+    assert cols == [c for c in row if c not in ("id", "label")]
+    assert vec.dtype == np.float32
+    np.testing.assert_allclose(vec, np.array([row[c] for c in cols], dtype=np.float32), equal_nan=True)
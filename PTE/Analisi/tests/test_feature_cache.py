@@ -0,0 +1,60 @@
+"""FeatureCache: dimensione tenuta come totale corrente (niente scansione della cartella a ogni put)."""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from feature_cache import FeatureCache
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "Ema"))
+import build_graph_feature_tables as ema  # noqa: E402
+
+
+def _count_scans(monkeypatch):
+    calls = []
+    orig = FeatureCache.size_bytes
+
+    def counting(self):
+        calls.append(1)
+        return orig(self)
+
+    monkeypatch.setattr(FeatureCache, "size_bytes", counting)
+    return calls
+
+
+def test_put_scans_once_per_instance(tmp_path, monkeypatch):
+    calls = _count_scans(monkeypatch)
+    cache = FeatureCache(tmp_path, max_bytes=1 << 30, rescan_every=1000)
+    for i in range(20):
+        cache.put(f"k{i}", {"a": np.arange(100.0) + i})
+    assert len(calls) == 1
+    assert cache._total == sum(p.stat().st_size for p in tmp_path.glob("*.npz"))
+
+
+def test_eviction_keeps_limit(tmp_path):
+    cache = FeatureCache(tmp_path, max_bytes=20_000, rescan_every=1000)
+    rng = np.random.default_rng(0)
+    for i in range(30):
+        cache.put(f"k{i:02d}", {"a": rng.random(500)})
+        assert cache.size_bytes() <= 20_000
+    assert cache.get("k29") is not None
+    assert cache.get("k00") is None
+
+
+def test_ema_reuses_one_cache(tmp_path, monkeypatch):
+    """Il builder usa la stessa istanza per tutti i soggetti: una sola scansione per molte put."""
+    monkeypatch.setattr(ema, "CACHE_DIR", str(tmp_path / "cache"))
+    monkeypatch.setattr(ema, "_CACHE", None)
+    calls = _count_scans(monkeypatch)
+
+    rng = np.random.default_rng(1)
+    for s in range(4):
+        A = rng.random((8, 8))
+        fp = tmp_path / f"sub-{s:04d}.csv"
+        np.savetxt(fp, (A + A.T) / 2, delimiter=",")
+        ema.process_subject(str(fp), str(s), s % 2)
+
+    assert ema._feature_cache() is ema._feature_cache()
+    assert len(list((tmp_path / "cache").glob("*.npz"))) == 4
+    assert len(calls) == 1
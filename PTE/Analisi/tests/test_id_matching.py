@@ -0,0 +1,50 @@
+"""ID canonici e join label <-> file di id_matching, con e senza id_pattern."""
+
+import pandas as pd
+
+from id_matching import canon_id, canon_ids, match_labels
+
+SUB = r"sub-(\d+)"
+FILES = ["sub-0001_ses-1_HO96.csv", "sub-0002_run-2.csv", "sub-0010.csv", "3_13_0051.csv", "extra.csv"]
+
+
+def test_canon_id_digits_rule():
+    assert canon_id("sub-0001.csv") == "1"
+    assert canon_id("3_13_0051") == "3130051"
+    assert canon_id("PTE-0001") == "1"
+    assert canon_id("sub-000.csv") == "0"
+    assert canon_id("Patient_ab") == "ab"
+
+
+def test_canon_id_pattern_ignores_session_and_atlas():
+    assert canon_id("sub-0001_ses-1_HO96.csv", id_pattern=SUB) == "1"
+    assert canon_id("dir/sub-0002_run-2.csv", id_pattern=SUB) == "2"
+    # senza token: regola delle cifre
+    assert canon_id("3_13_0051.csv", id_pattern=SUB) == "3130051"
+    assert canon_id("PTE-0001", id_pattern=SUB) == "1"
+
+
+def test_canon_ids_matches_canon_id():
+    values = FILES + ["PTE-0001", "sub-000.csv", "Patient_ab", "C:/dati/sub-0003_ses-2.csv"]
+    for pattern in (None, SUB):
+        assert canon_ids(values, id_pattern=pattern).tolist() == [canon_id(v, id_pattern=pattern) for v in values]
+
+
+def test_match_labels_with_pattern():
+    labels = pd.DataFrame({"Patient": ["PTE-0001", "PTE-0002", "PTE-0010", "PTE-0099"],
+                           "Label": ["1", "0", "1", "0"]})
+    df, report = match_labels(labels, FILES, id_col="Patient", label_col="Label", file_col="Matadi_File",
+                              id_pattern=SUB)
+    assert dict(zip(df["Patient"], df["Matadi_File"])) == {
+        "PTE-0001": "sub-0001_ses-1_HO96.csv",
+        "PTE-0002": "sub-0002_run-2.csv",
+        "PTE-0010": "sub-0010.csv",
+    }
+    assert report["unmatched_ids"] == ["PTE-0099"]
+    assert report["unmatched_files"] == ["3_13_0051.csv", "extra.csv"]
+
+
+def test_match_labels_without_pattern_joins_all_digits():
+    labels = pd.DataFrame({"Patient": ["PTE-0001"], "Label": ["1"]})
+    df, _ = match_labels(labels, ["sub-0001_ses-1_HO96.csv"], id_col="Patient", label_col="Label")
+    assert df.empty     # "1196" != "1": per questi nomi serve id_pattern
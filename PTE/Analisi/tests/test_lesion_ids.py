@@ -0,0 +1,62 @@
+"""ID della tabella lesionale: dal nome della maschera all'ID dei connettomi (sub-XXXX), e join nello script di Ema."""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from extract_volume import extract_patient_id
+from id_matching import match_labels
+from lesion_parcels import feature_columns, load_id_map, subject_ids
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "Ema"))
+import build_graph_feature_tables as ema  # noqa: E402
+
+MASKS = [Path("lesion_masks/aff_3_11_0111_2019-05-12_lesion.nii"),
+         Path("lesion_masks/aff_3_13_0024_2018-02-21_lesion.nii.gz")]
+
+
+def _lesion_table(tmp_path, patient_ids):
+    df = pd.DataFrame(np.arange(len(patient_ids) * 3, dtype=float).reshape(-1, 3), columns=feature_columns(3))
+    df.insert(0, "patient_id", patient_ids)
+    path = tmp_path / "lesion_parcel_load.csv"
+    df.to_csv(path, index=False)
+    return path
+
+
+def test_pattern_drops_date_and_suffix():
+    assert subject_ids([extract_patient_id(p) for p in MASKS]) == ["3_11_0111", "3_13_0024"]
+    assert subject_ids(["altro_nome"]) == ["altro_nome"]
+
+
+def test_mask_ids_join_connectome_ids(tmp_path):
+    id_map_csv = tmp_path / "mask_subject_map.csv"
+    pd.DataFrame({"mask_id": ["3_11_0111", "3_13_0024"], "subject_id": ["sub-0001", "sub-0003"]}).to_csv(
+        id_map_csv, index=False)
+    pids = subject_ids([extract_patient_id(p) for p in MASKS], id_map=load_id_map(id_map_csv))
+    assert pids == ["sub-0001", "sub-0003"]
+
+    labels = pd.DataFrame({"Patient": ["sub-0001", "sub-0003", "sub-0004"], "Label": ["1", "0", "1"]})
+    matched, _ = match_labels(labels, ["sub-0001.csv", "sub-0003.csv", "sub-0004.csv"])
+    lesion = ema.load_lesion_load(str(_lesion_table(tmp_path, pids)))
+
+    assert ema.check_lesion_match(lesion, matched["canon"]) == 2
+    by_pid = {pid: ema.lesion_load_features(lesion, pid) for pid in matched["canon"]}
+    assert by_pid["1"]["lesion_load_n000"] == 0.0
+    assert by_pid["3"]["lesion_load_n002"] == 5.0
+    assert np.isnan(by_pid["4"]["lesion_load_n000"])
+
+
+def test_unmatched_lesion_table_raises(tmp_path):
+    # patient_id ancora come nome della maschera: "311011120190512" non è nessun sub-XXXX
+    lesion = ema.load_lesion_load(str(_lesion_table(tmp_path, [extract_patient_id(p) for p in MASKS])))
+    with pytest.raises(ValueError, match="ID_MAP_CSV"):
+        ema.check_lesion_match(lesion, ["1", "3", "4"])
+
+
+def test_few_matches_warn(tmp_path, capsys):
+    lesion = ema.load_lesion_load(str(_lesion_table(tmp_path, ["sub-0001"])))
+    assert ema.check_lesion_match(lesion, ["1", "3", "4", "9"]) == 1
+    assert "[WARN] Solo 1/4" in capsys.readouterr().out
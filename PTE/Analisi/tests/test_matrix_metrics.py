@@ -0,0 +1,147 @@
+"""
+Parità dei kernel su matrice (matrix_metrics, shortest_paths) con le funzioni networkx usate in origine,
+su grafi pesati casuali sparsi, sconnessi (con nodi isolati) e vuoti.
+
+    python -m pytest -q PTE/Analisi/tests
+"""
+
+import numpy as np
+import networkx as nx
+import pytest
+
+from matrix_metrics import (
+    adjacency,
+    degree,
+    strength,
+    weighted_clustering,
+    transitivity,
+    eigenvector_centrality,
+    local_efficiency_binary,
+)
+from shortest_paths import (
+    distance_matrix,
+    closeness_centrality,
+    characteristic_path_length,
+    global_efficiency,
+)
+
+N = 30
+ATOL = 1e-10
+
+
+def _random_weights(rng, n, density):
+    A = np.triu(rng.random((n, n)), 1)
+    A[np.triu(rng.random((n, n)) >= density, 0)] = 0.0
+    return A + A.T
+
+
+def _sparse(seed):
+    return _random_weights(np.random.default_rng(seed), N, 0.2)
+
+
+def _disconnected(seed):
+    rng = np.random.default_rng(seed)
+    A = np.zeros((N, N))
+    A[:12, :12] = _random_weights(rng, 12, 0.5)
+    A[12:25, 12:25] = _random_weights(rng, 13, 0.4)
+    return A   # nodi 25..29 isolati
+
+
+GRAPHS = {
+    "sparse_0": _sparse(0),
+    "sparse_1": _sparse(1),
+    "disconnected": _disconnected(2),
+    "empty": np.zeros((N, N)),
+}
+
+
+@pytest.fixture(params=sorted(GRAPHS))
+def graph(request):
+    A = GRAPHS[request.param]
+    G = nx.Graph()
+    G.add_nodes_from(range(N))
+    iu, ju = np.nonzero(np.triu(A, 1))
+    G.add_edges_from((i, j, {"weight": A[i, j], "length": 1.0 / A[i, j]}) for i, j in zip(iu.tolist(), ju.tolist()))
+    return A, G
+
+
+def _nodes(d: dict) -> np.ndarray:
+    return np.array([d[i] for i in range(N)], dtype=float)
+
+
+def test_degree_strength(graph):
+    A, G = graph
+    W, B = adjacency(A)
+    np.testing.assert_allclose(degree(B), _nodes(dict(G.degree())), atol=ATOL)
+    np.testing.assert_allclose(strength(W), _nodes(dict(G.degree(weight="weight"))), atol=ATOL)
+
+
+def test_weighted_clustering(graph):
+    A, G = graph
+    W, B = adjacency(A)
+    np.testing.assert_allclose(weighted_clustering(W, B), _nodes(nx.clustering(G, weight="weight")), atol=ATOL)
+
+
+def test_transitivity(graph):
+    A, G = graph
+    _, B = adjacency(A)
+    if G.number_of_edges() == 0:
+        assert np.isnan(transitivity(B))
+    else:
+        assert transitivity(B) == pytest.approx(nx.transitivity(G), abs=ATOL)
+
+
+def test_eigenvector_centrality(graph):
+    A, G = graph
+    W, _ = adjacency(A)
+    if G.number_of_edges() == 0:
+        np.testing.assert_array_equal(eigenvector_centrality(W), np.zeros(N))
+    elif not nx.is_connected(G):
+        # networkx rifiuta i grafi sconnessi: gli script mettono zeri (maschera "connected" di cohort_metrics)
+        with pytest.raises(nx.AmbiguousSolution):
+            nx.eigenvector_centrality_numpy(G, weight="weight")
+    else:
+        ref = nx.eigenvector_centrality_numpy(G, weight="weight")
+        np.testing.assert_allclose(eigenvector_centrality(W), _nodes(ref), atol=1e-8)
+
+
+def test_local_efficiency_binary(graph):
+    A, G = graph
+    _, B = adjacency(A)
+    ref = {u: nx.global_efficiency(G.subgraph(G[u])) if G.degree(u) > 1 else 0.0 for u in G}
+    np.testing.assert_allclose(local_efficiency_binary(B), _nodes(ref), atol=ATOL)
+
+
+def test_closeness(graph):
+    A, G = graph
+    _, D = distance_matrix(A)
+    np.testing.assert_allclose(closeness_centrality(D), _nodes(nx.closeness_centrality(G, distance="length")),
+                               atol=ATOL)
+
+
+def _reachable_pair_lengths(G) -> np.ndarray:
+    """Distanze pesate (length = 1/w) sulle coppie i<j raggiungibili, come nella versione networkx."""
+    lengths = dict(nx.all_pairs_dijkstra_path_length(G, weight="length"))
+    return np.array([d for i, row in lengths.items() for j, d in row.items() if i < j])
+
+
+def test_charpath_and_global_efficiency(graph):
+    A, G = graph
+    _, D = distance_matrix(A)
+    d = _reachable_pair_lengths(G)
+    if d.size == 0:
+        assert np.isnan(characteristic_path_length(D))
+        assert np.isnan(global_efficiency(D))
+    else:
+        assert characteristic_path_length(D) == pytest.approx(d.mean(), abs=ATOL)
+        assert global_efficiency(D) == pytest.approx(np.mean(1.0 / d), abs=ATOL)
+
+
+def test_cohort_stack_matches_single(graph):
+    """Gli stessi kernel su uno stack (S, N, N) danno i valori dei singoli soggetti."""
+    A, _ = graph
+    X = np.stack([A, GRAPHS["sparse_0"]])
+    W, B = adjacency(X)
+    W0, B0 = adjacency(A)
+    np.testing.assert_allclose(weighted_clustering(W, B)[0], weighted_clustering(W0, B0), atol=ATOL)
+    np.testing.assert_allclose(eigenvector_centrality(W)[0], eigenvector_centrality(W0), atol=1e-8)
@@ -0,0 +1,45 @@
+"""Modelli nulli: grado conservato e frazione di scambi accettati, alta sui grafi sparsi e bassa su quelli densi."""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from null_models import maslov_sneppen, null_model_metrics
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "Ema"))
+import build_graph_feature_tables as ema  # noqa: E402
+
+
+def _weights(n, density, seed=0):
+    rng = np.random.default_rng(seed)
+    A = np.triu(rng.random((n, n)), 1)
+    A[np.triu(rng.random((n, n)) >= density, 0)] = 0.0
+    return A + A.T
+
+
+def test_maslov_sneppen_keeps_degree():
+    W = _weights(40, 0.15)
+    X, rate = maslov_sneppen(W, n_swaps=5, rng=0, return_rate=True)
+    np.testing.assert_array_equal((X > 0).sum(axis=1), (W > 0).sum(axis=1))
+    np.testing.assert_allclose(np.sort(X[np.triu_indices(40, 1)]), np.sort(W[np.triu_indices(40, 1)]))
+    assert 0.0 < rate <= 1.0
+
+
+def test_swap_rate_sparse_vs_dense(capsys):
+    sparse = null_model_metrics(_weights(40, 0.15), n_nulls=4, n_swaps=2)
+    assert sparse["swap_rate"].shape == (4,)
+    assert sparse["swap_rate"].mean() > 0.5
+    assert "[WARN]" not in capsys.readouterr().out
+
+    dense = null_model_metrics(_weights(40, 0.97), n_nulls=4, n_swaps=2)
+    assert dense["swap_rate"].mean() < 0.1
+    assert "[WARN] Modelli nulli" in capsys.readouterr().out
+
+
+def test_ema_refuses_null_models_without_threshold(monkeypatch):
+    monkeypatch.setattr(ema, "NULL_MODELS", True)
+    monkeypatch.setattr(ema, "EDGE_MIN_FOR_METRICS", 0.0)
+    with pytest.raises(ValueError, match="EDGE_MIN_FOR_METRICS"):
+        ema.run()
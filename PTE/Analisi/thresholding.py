@@ -0,0 +1,69 @@
+"""
+Soglia proporzionale (densità) per sweep su molte densità.
+
+Gli archi del triangolo superiore vengono ordinati UNA volta per soggetto (rango 0 = arco più forte);
+la maschera di una densità d è semplicemente rank < floor(E * d), quindi ogni densità aggiuntiva
+costa solo un confronto vettoriale invece di un nuovo argsort.
+
+Stessa regola (e stesso ordine in caso di pari merito) di
+    keep_idx = np.argsort(upper_vals)[::-1][:n_keep]
+
+Le funzioni lavorano sull'ultimo asse: accettano una matrice (N, N) o uno stack (S, N, N).
+
+Dipendenze: numpy
+"""
+
+import numpy as np
+
+
+def upper_values(mat: np.ndarray) -> np.ndarray:
+    """Valori del triangolo superiore (k=1): shape (..., E)."""
+    n = mat.shape[-1]
+    iu, ju = np.triu_indices(n, 1)
+    return mat[..., iu, ju]
+
+
+def edge_ranks(mat: np.ndarray) -> np.ndarray:
+    """Rango di ogni arco del triangolo superiore (0 = peso maggiore), shape (..., E)."""
+    vals = upper_values(mat)
+    order = np.argsort(vals, axis=-1)[..., ::-1]
+
+    ranks = np.empty(order.shape, dtype=np.int64)
+    np.put_along_axis(ranks, order, np.broadcast_to(np.arange(order.shape[-1]), order.shape), axis=-1)
+    return ranks
+
+
+def n_keep(n_edges: int, dens: float) -> int:
+    """Numero di archi tenuti a densità dens."""
+    return int(np.floor(n_edges * dens))
+
+
+def density_masks(ranks: np.ndarray, densities) -> np.ndarray:
+    """Maschere (len(densities), ..., E) degli archi tenuti per ciascuna densità."""
+    n_edges = ranks.shape[-1]
+    k = np.array([n_keep(n_edges, d) for d in densities])
+    return ranks[None, ...] < k.reshape((-1,) + (1,) * ranks.ndim)
+
+
+def apply_upper_mask(mat: np.ndarray, mask: np.ndarray) -> np.ndarray:
+    """Matrice simmetrica con i soli archi del triangolo superiore in mask (diagonale nulla)."""
+    n = mat.shape[-1]
+    iu, ju = np.triu_indices(n, 1)
+
+    out = np.zeros_like(mat)
+    out[..., iu, ju] = np.where(mask, mat[..., iu, ju], 0)
+    return out + np.swapaxes(out, -1, -2)
+
+
+def proportional_threshold(mat: np.ndarray, dens: float, ranks: np.ndarray = None) -> np.ndarray:
+    """Soglia proporzionale a densità dens; passa ranks (da edge_ranks) per non riordinare."""
+    if ranks is None:
+        ranks = edge_ranks(mat)
+    return apply_upper_mask(mat, ranks < n_keep(ranks.shape[-1], dens))
+
+
+def threshold_sweep(mat: np.ndarray, densities):
+    """Generatore (dens, matrice sogliata) su una lista di densità, con un solo ordinamento."""
+    ranks = edge_ranks(mat)
+    for dens, mask in zip(densities, density_masks(ranks, densities)):
+        yield dens, apply_upper_mask(mat, mask)